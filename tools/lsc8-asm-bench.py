@@ -0,0 +1,167 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+import argparse
+import io
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+
+from lsc8 import assembler as asm
+
+
+def create_parser():
+    prs = argparse.ArgumentParser(
+        prog='ASM Benchmark',
+        description="""Throughput of the assembler tokenizer
+         on the source repeated many times, or the peak memory
+         of the assembled synthetic program.""",
+        usage=""" python lsc8-asm-bench.py [<file>] [--scale|-n <COUNT>]
+        [--repeat|-r <COUNT>] [--memory|-m [<LINES>]]
+        [--baseline|-b <REV>] [--help|-h]
+examples:
+        python lsc8-asm-bench.py
+        python lsc8-asm-bench.py src/fibo.asm -n 100 -r 5
+        python lsc8-asm-bench.py -m 300000
+        python lsc8-asm-bench.py -m 300000 -b HEAD~1"""
+    )
+    prs.add_argument('file', nargs='?', default='src/8kBIOS.asm',
+                     help='Source file (src/8kBIOS.asm by default)')
+    prs.add_argument('--scale', '-n', type=int, default=1000,
+                     help='Repeat the source COUNT times (1000 by default)')
+    prs.add_argument('--repeat', '-r', type=int, default=3,
+                     help='Best of COUNT runs (3 by default)')
+    prs.add_argument('--memory', '-m', type=int, nargs='?', const=200_000,
+                     default=None, metavar='LINES',
+                     help='Assemble the synthetic program of LINES lines'
+                          ' (200000 by default) and print the peak memory')
+    prs.add_argument('--baseline', '-b', metavar='REV',
+                     help='Measure the --memory of the assembler of the git'
+                          ' revision REV as well, every assembler in its'
+                          ' own process')
+
+    return prs
+
+
+def best_time(function, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def synthetic(lines):
+    """
+    Program of the typical generated lines: instructions, EQU constants,
+    DB tables and strings. The labels are kept in the first 64 kB.
+    """
+    body = [
+        'mov a, {c}', 'add a, b', 'mov h, {h}', 'mov l, {l}', 'mov mem, a',
+        'inc l', 'push h', 'pop h', 'cmp a, {l}', 'out 4',
+        'db {c}, {h}, {l}, 0, 1, 2, 3, 4', "db 'TABLE {l}', 0Ah, 0",
+        'xor a, a', 'int 4h', 'or a, a', 'jnz loop_{k}',
+    ]
+    result = ['org 0', 'start:']
+    loop = 0
+    for i in range(lines // len(body)):
+        if i < 1000:
+            result.append(f'loop_{i}:')
+            loop = i
+        if i < 64:
+            result.append(f'const_{i} equ {i * 2}')
+        for line in body:
+            result.append('    ' + line.format(c=f'const_{i % 64}', h=i % 256,
+                                                 l=(i * 7) % 256, k=loop))
+    return '\n'.join(result)
+
+
+def peak_rss():
+    """Peak resident set size of the process in MB"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def export_tools(revision, directory):
+    """
+    Copy the lsc8 package of the git revision and this script to the
+    directory, return the path of the script copy
+    """
+    tools = os.path.dirname(os.path.abspath(__file__))
+    top, prefix = subprocess.run(
+        ['git', 'rev-parse', '--show-toplevel', '--show-prefix'], cwd=tools,
+        check=True, capture_output=True, text=True).stdout.split('\n')[:2]
+    archive = subprocess.run(
+        ['git', 'archive', '--format=tar', revision, prefix + 'lsc8'],
+        cwd=top, check=True, capture_output=True).stdout
+    with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+        tar.extractall(directory)
+    script = os.path.join(directory, prefix, os.path.basename(__file__))
+    shutil.copy(__file__, script)
+    return script
+
+
+def compare(lines, revision):
+    """Print the --memory of the revision and of the working tree"""
+    with tempfile.TemporaryDirectory() as directory:
+        try:
+            baseline = export_tools(revision, directory)
+        except subprocess.CalledProcessError as err:
+            message = err.stderr
+            if isinstance(message, bytes):
+                message = message.decode(errors='replace')
+            raise SystemExit(message.strip() or err)
+        for name, script in ((revision, baseline), ('current', __file__)):
+            output = subprocess.run(
+                [sys.executable, script, '--memory', str(lines)],
+                check=True, capture_output=True, text=True).stdout
+            for line in output.splitlines():
+                print(f'{name:>10}: {line}')
+
+
+if __name__ == '__main__':
+    parser = create_parser()
+    namespace = parser.parse_args()
+
+    if namespace.baseline is not None:
+        if namespace.memory is None:
+            parser.error('--baseline compares the --memory')
+        compare(namespace.memory, namespace.baseline)
+        raise SystemExit
+
+    if namespace.memory is not None:
+        text = synthetic(namespace.memory)
+        lines = text.count('\n') + 1
+        before = peak_rss()
+        start = time.perf_counter()
+        image = asm.assemble(text)
+        elapsed = time.perf_counter() - start
+        print(f'synthetic: {lines} lines, {len(image)} bytes'
+              f' in {elapsed:.3f} s')
+        print(f'peak RSS: {peak_rss():.1f} MB'
+              f' ({peak_rss() - before:.1f} MB by the assembler)')
+        raise SystemExit
+
+    with open(namespace.file, 'r') as file:
+        text = '\n'.join([file.read().rstrip('\n')] * namespace.scale)
+    lines = text.count('\n') + 1
+
+    def scan():
+        asm.tokenize(text)
+
+    def tokens():
+        lex = asm.Lexer('')
+        for l_num, parts in enumerate(asm.tokenize(text), 1):
+            lex._tokenize(parts, l_num)
+
+    print(f'{namespace.file} x {namespace.scale}: {lines} lines')
+    for name, function in (('scan', scan), ('tokens', tokens)):
+        elapsed = best_time(function, namespace.repeat)
+        print(f'{name:>8}: {elapsed:.3f} s, {lines / elapsed:,.0f} lines/s')
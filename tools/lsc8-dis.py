@@ -0,0 +1,103 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+import argparse
+import sys
+
+from lsc8.assembler import ExceptionWithLineNumber
+from lsc8.disassembler import Disassembler, verify
+from lsc8.expression import ExpressionError, parse_number
+from lsc8.rom import load_image
+from lsc8.symbols import assemble_symbols
+
+
+def address_arg(value: str):
+    try:
+        address = parse_number(value)
+    except (ExpressionError, IndexError):
+        raise argparse.ArgumentTypeError(f'wrong address "{value}"')
+    if not 0 <= address <= 0xFFFF:
+        raise argparse.ArgumentTypeError(f'address "{value}" is out of range')
+    return address
+
+
+def create_parser():
+    prs = argparse.ArgumentParser(
+        prog='LSC-8 Disassembler',
+        description="""Converting the byte-code of 8-bit LogiSim CPU
+         back to ASM-code.""",
+        usage=""" python lsc8-dis.py <image> [--out|-o <OUT>] [--org <ADDRESS>]
+        [--entry|-e <ADDRESS>] [--vectors <ADDRESS> | --no-vectors]
+        [--symbols|-y <SOURCE>] [--help|-h]
+    python lsc8-dis.py --verify <source> ...
+examples:
+        python lsc8-dis.py rom/8kBIOS.rom -o bios.asm
+        python lsc8-dis.py rom/fibo.rom -y src/fibo.asm
+        python lsc8-dis.py prog.bin --org 0C00h -e 0C40h
+        python lsc8-dis.py --verify src/*.asm""",
+        epilog='(c) by baskiton, 2020'
+    )
+    prs.add_argument('file', nargs='+',
+                     help='Image (LogiSim "v2.0 raw", binary or Intel HEX)'
+                          ' or the sources with --verify')
+    prs.add_argument('--out', '-o', type=argparse.FileType(mode='w'),
+                     default=sys.stdout, help='Write the source to file')
+    prs.add_argument('--org', type=address_arg, default=None,
+                     help='Address of the image (the boot location 0C00h'
+                          ' for a boot sector, otherwise the BIOS E000h)')
+    prs.add_argument('--entry', '-e', type=address_arg, action='append',
+                     default=[],
+                     help='Entry point of the code (the org by default)')
+    prs.add_argument('--vectors', type=address_arg, default=True,
+                     help='Address of the interrupt vector table'
+                          ' (searched in the BIOS by default)')
+    prs.add_argument('--no-vectors', dest='vectors', action='store_const',
+                     const=None, help='Do not look for the vector table')
+    prs.add_argument('--symbols', '-y', metavar='SOURCE', action='append',
+                     default=[], help='Name the addresses by the labels'
+                                      ' of the source (or its .dbg file)')
+    prs.add_argument('--verify', action='store_true', default=False,
+                     help='Assemble the sources, disassemble and assemble'
+                          ' again, compare the bytes')
+
+    return prs
+
+
+def verify_sources(paths):
+    """Print the result of every source, return True if all are equal"""
+    success = True
+    for path in paths:
+        try:
+            with open(path, 'r') as file:
+                equal, image, _, again = verify(file.read(), path)
+        except (OSError, ExceptionWithLineNumber) as err:
+            print(f'{path}: {err}')
+            success = False
+            continue
+        if equal:
+            print(f'{path}: OK, {len(image)} bytes')
+        else:
+            first, second = bytes(image), bytes(again)
+            offset = next((i for i in range(min(len(first), len(second)))
+                           if first[i] != second[i]),
+                          min(len(first), len(second)))
+            print(f'{path}: DIFFERENT at {image.org + offset:04X}h')
+            success = False
+    return success
+
+
+if __name__ == '__main__':
+    parser = create_parser()
+    namespace = parser.parse_args()
+
+    if namespace.verify:
+        sys.exit(0 if verify_sources(namespace.file) else 1)
+
+    if len(namespace.file) > 1:
+        parser.error('one image is disassembled at a time')
+    labels = {}
+    for path in namespace.symbols:
+        labels.update(assemble_symbols(path))
+    disassembler = Disassembler(load_image(namespace.file[0]), namespace.org,
+                                namespace.entry, namespace.vectors, labels)
+    namespace.out.write(disassembler.source())
@@ -0,0 +1,227 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+import argparse
+import sys
+import time
+
+from lsc8.computer import Computer
+from lsc8.cpu import IllegalInstruction
+from lsc8.microcode import Microcode
+from lsc8 import hle
+from lsc8.profiler import Profiler, DEFAULT_INTERVAL
+from lsc8.devices import Screen, Storage
+from lsc8.rom import BIOS_ROM, image_format, load_image, rom_path
+from lsc8.snapshot import Recorder, Snapshot
+from lsc8.symbols import assemble_symbols, assemble_routines
+
+
+def drive_arg(value: str):
+    """<number>=<file>[:ro][:rem]"""
+    try:
+        number, path = value.split('=', 1)
+        number = int(number)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'wrong drive "{value}"')
+    if not 0 <= number <= 3:
+        raise argparse.ArgumentTypeError('drive number should be 0-3')
+    options = path.split(':')
+    return number, options[0], 'ro' not in options[1:], 'rem' in options[1:]
+
+
+def create_parser():
+    prs = argparse.ArgumentParser(
+        prog='LSC-8 Simulator',
+        description="""Headless instruction-level simulator
+         of 8-bit LogiSim Computer.""",
+        usage=""" python lsc8-sim.py [<bios>] [--drive|-d <N>=<FILE>[:ro][:rem]]
+        [--input|-i <TEXT>] [--input-file|-f <FILE>] [--max|-m <COUNT>]
+        [--stats|-s] [--terminal|-T] [--fps <COUNT>]
+        [--microcode|-u [<DECODER> <MICROCODE>]] [--jit|-j]
+        [--trap|-t <BIOS SOURCE>] [--profile|-p [<TOP>]]
+        [--folded <FILE>] [--symbols|-y <SOURCE>] [--interval <COUNT>]
+        [--load-state <FILE>] [--save-state <FILE>] [--back <COUNT>]
+        [--help|-h]
+examples:
+        python lsc8-sim.py -d 1=rom/hello-world.rom:rem
+        python lsc8-sim.py rom/8kBIOS.rom -d 0=rom/fibo.rom -i "10\\n" -s
+        python lsc8-sim.py -d 1=rom/hello-world.rom:rem -u -s
+        python lsc8-sim.py -d 0=rom/fibo.rom -T
+        python lsc8-sim.py -d 0=rom/fibo.rom -f input.txt
+        python lsc8-sim.py -d 0=rom/fibo.rom -i "10\\n" -p 10
+            -y src/8kBIOS.asm -y src/fibo.asm --folded fibo.folded
+        python lsc8-sim.py -m 20000 --save-state booted.state
+        python lsc8-sim.py --load-state booted.state -d 0=rom/fibo.rom""",
+        epilog='(c) by baskiton, 2020'
+    )
+    prs.add_argument('bios', nargs='?', default=rom_path(BIOS_ROM),
+                     help='BIOS ROM file (LogiSim "v2.0 raw")')
+    prs.add_argument('--drive', '-d', type=drive_arg, action='append',
+                     default=[], help='Insert storage image to the drive')
+    prs.add_argument('--input', '-i', default='',
+                     help='Text typed on the keyboard')
+    prs.add_argument('--input-file', '-f', metavar='FILE', default=None,
+                     help='File typed on the keyboard after the --input'
+                          ' text ("-" - the standard input)')
+    prs.add_argument('--max', '-m', type=int, default=None,
+                     help='Maximum number of instructions to execute')
+    prs.add_argument('--stats', '-s', action='store_true', default=False,
+                     help='Print execution statistics')
+    prs.add_argument('--terminal', '-T', action='store_true', default=False,
+                     help='Show the 80x25 screen in the terminal (curses),'
+                          ' the keys are typed on the keyboard')
+    prs.add_argument('--fps', type=int, default=None,
+                     help='Screen frames per second of the --terminal'
+                          ' (30 by default)')
+    prs.add_argument('--microcode', '-u', nargs='*', default=None,
+                     metavar='ROM',
+                     help='Execute the microcode (default: '
+                          'rom/COMMAND_DECODER.rom rom/MICROCODE.rom)')
+    prs.add_argument('--jit', '-j', action='store_true', default=False,
+                     help='Translate basic blocks to Python code')
+    prs.add_argument('--trap', '-t', metavar='SOURCE', default=None,
+                     help='Emulate INT 7h sector transfers and MEM_TO_MEM'
+                          ' by bulk copies, routines are found'
+                          ' in the BIOS source')
+    prs.add_argument('--profile', '-p', type=int, nargs='?', const=20,
+                     default=None, metavar='TOP',
+                     help='Count the instructions per address and print'
+                          ' the TOP routines, addresses and calls'
+                          ' (20 by default)')
+    prs.add_argument('--folded', metavar='FILE', default=None,
+                     help='Write the sampled call stacks in the folded'
+                          ' format of the flame graph tools')
+    prs.add_argument('--symbols', '-y', metavar='SOURCE', action='append',
+                     default=[],
+                     help='Source (or its .dbg file) of the profiled code for'
+                          ' the names of the routines (the --trap source is'
+                          ' used too)')
+    prs.add_argument('--interval', type=int, default=DEFAULT_INTERVAL,
+                     help='Instructions between the call stack samples'
+                          f' ({DEFAULT_INTERVAL} by default)')
+    prs.add_argument('--load-state', metavar='FILE', default=None,
+                     help='Start from the saved state (the drives and'
+                          ' the input given are added to it)')
+    prs.add_argument('--save-state', metavar='FILE', default=None,
+                     help='Save the state of the computer after the run')
+    prs.add_argument('--back', type=int, default=None, metavar='COUNT',
+                     help='Step back COUNT instructions after the run,'
+                          ' the state is restored from the snapshots')
+
+    return prs
+
+
+def create_profiler(sources, microcode):
+    labels, procedures = {}, {}
+    for path in sources:
+        source_labels, source_procedures = assemble_routines(path)
+        labels.update(source_labels)
+        procedures.update(source_procedures)
+    if microcode is None:
+        try:    # for the cycle estimates
+            microcode = Microcode.load()
+        except OSError:
+            pass
+    return Profiler(labels, procedures, microcode)
+
+
+if __name__ == '__main__':
+    parser = create_parser()
+    namespace = parser.parse_args()
+
+    microcode = None
+    if namespace.microcode is not None:
+        if len(namespace.microcode) not in (0, 2):
+            parser.error('--microcode takes the decoder and microcode ROMs')
+        microcode = Microcode.load(*namespace.microcode)
+
+    keyboard_input = namespace.input.encode().decode('unicode_escape')
+    if namespace.input_file == '-':
+        if namespace.terminal:
+            parser.error('--terminal reads the keys from the standard input')
+        keyboard_input += sys.stdin.read()
+    elif namespace.input_file is not None:
+        with open(namespace.input_file, 'r') as file:
+            keyboard_input += file.read()
+
+    if namespace.terminal:
+        computer = Computer(load_image(namespace.bios), keyboard_input,
+                            microcode=microcode, jit=namespace.jit,
+                            screen=Screen())
+    else:
+        computer = Computer(load_image(namespace.bios), keyboard_input,
+                            echo=sys.stdout, microcode=microcode,
+                            jit=namespace.jit)
+    if namespace.trap is not None:
+        if microcode is not None:
+            parser.error('--trap is not supported with --microcode')
+        hle.install(computer, assemble_symbols(namespace.trap))
+    if namespace.load_state is not None:
+        computer.restore(Snapshot.load(namespace.load_state))
+        computer.keyboard.feed(keyboard_input)
+
+    for number, path, volatile, removable in namespace.drive:
+        if image_format(path) != 'bin':
+            computer.insert(number, load_image(path), volatile, removable)
+        else:   # mapped as is
+            computer.storage.insert(number,
+                                    Storage.open(path, volatile, removable))
+
+    profiler = recorder = terminal = None
+    if namespace.terminal:
+        if (namespace.back is not None or namespace.profile is not None or
+                namespace.folded):
+            parser.error('--terminal is not supported with --back'
+                         ' and the profiler')
+        # curses is not available everywhere
+        from lsc8.terminal import Terminal, DEFAULT_FPS
+        terminal = Terminal(computer, namespace.fps or DEFAULT_FPS)
+    elif namespace.back is not None:
+        if namespace.profile is not None or namespace.folded:
+            parser.error('--back is not supported with the profiler')
+        recorder = Recorder(computer)
+    elif namespace.profile is not None or namespace.folded:
+        sources = namespace.symbols + ([namespace.trap]
+                                       if namespace.trap else [])
+        profiler = create_profiler(sources, microcode)
+
+    start = time.perf_counter()
+    try:
+        if recorder is not None:
+            recorder.run(namespace.max)
+            recorder.step_back(namespace.back)
+            executed = (recorder.instructions -
+                        recorder.snapshots[0].instructions)
+        elif terminal is not None:
+            executed = terminal.run(namespace.max)
+        elif profiler is not None:
+            executed = computer.run(namespace.max, lambda count: profiler.run(
+                computer.cpu, count, namespace.interval))
+        else:
+            executed = computer.run(namespace.max)
+    except IllegalInstruction as err:
+        executed = computer.cpu.instructions
+        print(f'\n{err}', file=sys.stderr)
+    elapsed = time.perf_counter() - start
+
+    if namespace.stats:
+        cpu = computer.cpu
+        print(f'\n{"halted" if cpu.halted else "stopped"} at {cpu.pc:04X}h,'
+              f' {executed} instructions in {elapsed:.3f} s'
+              f' ({executed / max(elapsed, 1e-9) / 1e6:.2f} MIPS)',
+              file=sys.stderr)
+        if microcode is not None:
+            print(f'{cpu.cycles} cycles'
+                  f' ({cpu.cycles / max(elapsed, 1e-9) / 1e3:.1f} kHz)',
+                  file=sys.stderr)
+
+    if profiler is not None:
+        if namespace.profile is not None:
+            print('\n' + profiler.report(computer.cpu.memory,
+                                         namespace.profile), file=sys.stderr)
+        if namespace.folded:
+            with open(namespace.folded, 'w') as file:
+                file.write(profiler.folded())
+
+    if namespace.save_state is not None:
+        computer.snapshot().save(namespace.save_state)
@@ -0,0 +1,103 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+import argparse
+import sys
+import time
+
+from lsc8 import runner
+from lsc8.rom import BIOS_ROM, load_image, rom_path
+
+
+def create_parser():
+    prs = argparse.ArgumentParser(
+        prog='LSC-8 Test Runner',
+        description="""Run the boot-sector programs in parallel,
+         each forked from the computer booted once.""",
+        usage=""" python lsc8-test.py <tests.json | image | source.asm> ...
+        [--bios|-b <ROM>] [--input|-i <TEXT>] [--expect|-e <TEXT>]
+        [--max|-m <COUNT>] [--jobs|-j <COUNT>] [--jit]
+        [--json <FILE>] [--junit <FILE>] [--verbose|-v] [--help|-h]
+examples:
+        python lsc8-test.py rom/hello-world.rom -e "Hello, World"
+        python lsc8-test.py src/fibo.asm -i "10\\n" -e "55"
+        python lsc8-test.py tests.json --junit report.xml -j 16""",
+        epilog='(c) by baskiton, 2020'
+    )
+    prs.add_argument('file', nargs='+',
+                     help='JSON list of the tests, program image'
+                          ' or its source (.asm)')
+    prs.add_argument('--bios', '-b', default=rom_path(BIOS_ROM),
+                     help='BIOS ROM file (rom/8kBIOS.rom by default)')
+    prs.add_argument('--input', '-i', default='',
+                     help='Text typed on the keyboard (for the tests'
+                          ' without "input")')
+    prs.add_argument('--expect', '-e', default=None,
+                     help='Text expected in the display output (for the'
+                          ' tests without "expect"), otherwise the'
+                          ' program should halt')
+    prs.add_argument('--max', '-m', type=int, default=runner.DEFAULT_BUDGET,
+                     help='Instruction budget of a test'
+                          f' ({runner.DEFAULT_BUDGET} by default)')
+    prs.add_argument('--jobs', '-j', type=int, default=None,
+                     help='Number of worker processes (all cores by default)')
+    prs.add_argument('--jit', action='store_true', default=False,
+                     help='Translate basic blocks to Python code')
+    prs.add_argument('--json', metavar='FILE', default=None,
+                     help='Write the results as JSON')
+    prs.add_argument('--junit', metavar='FILE', default=None,
+                     help='Write the results as JUnit XML')
+    prs.add_argument('--verbose', '-v', action='store_true', default=False,
+                     help='Print the output of the failed tests')
+
+    return prs
+
+
+if __name__ == '__main__':
+    parser = create_parser()
+    namespace = parser.parse_args()
+
+    defaults = {
+        'input': namespace.input.encode().decode('unicode_escape'),
+        'expect': namespace.expect,
+        'max': namespace.max,
+    }
+    tests = []
+    for path in namespace.file:
+        if path.endswith('.json'):
+            try:
+                tests += runner.load_tests(path, defaults)
+            except runner.ManifestError as err:
+                parser.exit(1, f'{err}\n')
+        elif path.endswith('.asm'):
+            tests.append(runner.Test(path, source=path, **defaults))
+        else:
+            tests.append(runner.Test(path, image=path, **defaults))
+
+    start = time.perf_counter()
+    try:
+        snapshot = runner.boot_snapshot(load_image(namespace.bios),
+                                        namespace.jit)
+    except runner.BootError as err:
+        parser.exit(1, f'{err}\n')
+    results = runner.run_tests(tests, snapshot, namespace.jobs, namespace.jit)
+    elapsed = time.perf_counter() - start
+
+    for result in results:
+        if result.status != runner.PASSED or namespace.verbose:
+            print(f'{result.status.upper():<7} {result.name}: '
+                  f'{result.message or "ok"}')
+            if result.status != runner.PASSED and namespace.verbose:
+                print(result.output)
+    counts = runner.summary(results)
+    print(f'{counts["tests"]} tests: {counts[runner.PASSED]} passed,'
+          f' {counts[runner.FAILED]} failed, {counts[runner.ERROR]} errors'
+          f' in {elapsed:.2f} s')
+
+    if namespace.json:
+        with open(namespace.json, 'w') as file:
+            runner.write_json(results, file)
+    if namespace.junit:
+        with open(namespace.junit, 'w') as file:
+            runner.write_junit(results, file)
+    sys.exit(0 if counts[runner.PASSED] == counts['tests'] else 1)
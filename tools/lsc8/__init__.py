@@ -0,0 +1,5 @@
+# -*- coding: UTF-8 -*-
+"""
+Support library for the LSC-8 tools: ROM images, the headless simulator
+and its device models.
+"""
@@ -0,0 +1,1922 @@
+# -*- coding: UTF-8 -*-
+"""
+Assembler of the LSC-8 programs.
+
+    image = assemble(text)
+
+The state of the assembly is kept by the Lexer instance, so any number
+of programs may be assembled in one process.
+"""
+
+import bisect
+import hashlib
+import json
+import os
+import pickle
+import re
+import sys
+import threading
+from array import array
+
+from . import isa, linker, rom
+from .debuginfo import DebugInfo, debug_path
+from .expression import HERE, Expression, ExpressionError, parse
+
+
+class ExceptionWithLineNumber(Exception):
+    def __init__(self, message: str, line_number: int):
+        super().__init__(message)
+        self._line_number = line_number
+
+    def __str__(self):
+        return f'{super().__str__()} at line {self._line_number}'
+
+
+class WrongParameterException(ExceptionWithLineNumber):
+    def __init__(self, line_number: int, arg, column: int = None):
+        super().__init__('Wrong parameter', line_number)
+        self.arg = arg
+        self.column = column
+
+    def __str__(self):
+        if self.column is None:
+            return f'Wrong parameter at line {self._line_number}: {self.arg}'
+        return (f'Wrong parameter at line {self._line_number},'
+                f' column {self.column}: {self.arg}')
+
+
+class FewArgumentsException(ExceptionWithLineNumber):
+    def __init__(self, line_number: int, necessary_arguments: int = None):
+        if necessary_arguments is None:
+            super().__init__('Few arguments', line_number)
+        else:
+            super().__init__(f'Few arguments, need {necessary_arguments} args',
+                             line_number)
+
+
+class TooManyArgumentsException(ExceptionWithLineNumber):
+    def __init__(self, line_number: int, necessary_arguments: int = None):
+        if necessary_arguments is None:
+            super().__init__('Too many arguments', line_number)
+        else:
+            super().__init__(
+                f'Too many arguments, need {necessary_arguments} args',
+                line_number
+            )
+
+
+class CommaExpectedException(ExceptionWithLineNumber):
+    def __init__(self, line_number: int):
+        super().__init__('Comma expected', line_number)
+
+
+class WrongOperandSize(ExceptionWithLineNumber):
+    def __init__(self, line_number, need, arg):
+        super().__init__(f'Operand "{arg.name}" over {need} byte', line_number)
+
+
+class WrongOperandValue(ExceptionWithLineNumber):
+    def __init__(self, line_num, have):
+        super().__init__(f'I/O port number should be between 0 and 15,'
+                         f' you have {have}', line_num)
+
+
+class NameIsNotDefined(ExceptionWithLineNumber):
+    def __init__(self, line_num, name):
+        super().__init__(f"Name \"{name}\" is not defined", line_num)
+
+
+class RecursiveInclude(ExceptionWithLineNumber):
+    def __init__(self, line_num, path):
+        super().__init__(f'Recursive include of "{path}"', line_num)
+
+
+class BuildError(Exception):
+    """Error of a module assembled in the worker process"""
+
+
+class Token:
+    """
+    Lexeme of the source. The tokens have no instance dict (__slots__),
+    the registers and commas are shared by all the lines.
+    """
+    __slots__ = ('cls', 'group', 'subgroup', 'name', 'allocate', 'value',
+                 'size')
+
+    def __init__(self, cls, group=None, subgroup=None, name=None):
+        self.cls = cls
+        self.group = group
+        self.subgroup = subgroup
+        self.name = name
+        self.allocate = None
+        self.value = None
+        self.size = 0
+
+    @staticmethod
+    def is_this(line: list, pos: int):
+        return Token.get_token(line, pos)
+
+    def specify(self, line, pos):
+        return self
+
+    @staticmethod
+    def get_token(line, pos):
+        return Token('Token', name=line[pos]).specify(line, pos)
+
+    def syntax_check(self, line_num, pos, line):
+        return True
+
+    @staticmethod
+    def instance_check(size, line, pattern, line_num):
+        for i in range(size):
+            if not isinstance(line[i], pattern[i]):
+                raise WrongParameterException(line_num, line[i].name)
+
+    def generate(self, line, pos, l_num):
+        return []
+
+    def __repr__(self):
+        return f'[{self.cls}: {self.group}: {self.name}]'
+
+
+class Undefined(Token):
+    __slots__ = ()
+
+    def __init__(self):
+        super().__init__('Undefined')
+
+    def __repr__(self):
+        return f'[{self.cls}]'
+
+
+class Comma(Token):
+    __slots__ = ()
+
+    def __init__(self, name):
+        super().__init__('Comma', name=name)
+
+    @staticmethod
+    def is_this(line, pos):
+        if line[pos] == ',':
+            return Comma.get_token(line, pos)
+
+    @staticmethod
+    def get_token(line, pos):
+        return COMMA
+
+    def __repr__(self):
+        return f'[{self.name}]'
+
+
+class Action(Token):
+    __slots__ = ()
+
+    INSTRUCTION_SET = frozenset((
+        # Data transfer commands
+        'mov', 'push', 'pop',
+        'in', 'out',
+
+        # Arithmetic commands
+        'inc', 'dec',
+        'add', 'adc', 'sub', 'sbb',
+        'and', 'xor', 'or', 'cmp',
+        'rlc', 'rol',   # synonymic
+        'rrc', 'ror',   # synonymic
+        'ral', 'rcl',   # synonymic
+        'rar', 'rcr',   # synonymic
+
+        # Control transfer commands
+        'jmp', 'call', 'ret',
+
+        'clc', 'stc', 'cli', 'sti',
+
+        'jnc', 'jae', 'jnb',    # CF=0
+        'jc', 'jb', 'jnae',     # CF=1
+        'jnz', 'jne',           # ZF=0
+        'jz', 'je',             # ZF=1
+        'jns',                  # SF=0
+        'js',                   # SF=1
+        'jnp', 'jpo',           # PF=0
+        'jp', 'jpe',            # PF=1
+
+        'cnc', 'cnz', 'cp', 'cpo',  # CF, ZF, SF, PF = 0
+        'cc', 'cz', 'cm', 'cpe',    # CF, ZF, SF, PF = 1
+
+        'rnc', 'rnz', 'rp', 'rpo',  # CF, ZF, SF, PF = 0
+        'rc', 'rz', 'rm', 'rpe',    # CF, ZF, SF, PF = 1
+
+        # Interrupt commands
+        'int', 'into', 'iret',
+
+        # Control commands
+        'hlt',
+        'nop',
+    ))
+
+    DIRECTIVE_SET = frozenset(('db', 'dw', 'dd', 'dq', 'dt', 'dup',
+                               'byte', 'word', 'dword', 'qword', 'tbyte',
+                               'equ', '=', 'end', 'endp',
+                               'proc', 'label', 'org',
+                               'near', 'far'))
+
+    def __init__(self, name, group=None):
+        super().__init__('Action', group=group, name=name)
+
+    @staticmethod
+    def is_this(line, pos):
+        if line[pos] in Action.INSTRUCTION_SET:
+            return Instruction(line[pos])
+        elif line[pos] in Action.DIRECTIVE_SET:
+            return Directive(line[pos])
+        return False
+
+
+class Instruction(Action):
+    __slots__ = ()
+
+    def __init__(self, name):
+        super().__init__(group='Instruction', name=name)
+        self.size = 1
+
+    @staticmethod
+    def get_token(line, pos):
+        return Instruction(name=line[pos])
+
+    def syntax_check(self, line_num, pos, line):
+        name = self.name
+        instr_len = len(line[pos:])
+
+        pattern_2op = [Instruction, Register, Comma, Operand]
+
+        pattern_1op = [Instruction, Operand]
+        pattern_1op_1 = [Instruction, (Name, Immediate)]
+        pattern_1op_2 = [Instruction, (Immediate, Symbol)]
+        pattern_1op_3 = [Instruction, Register]
+        pattern_1op_4 = [Instruction, (Register, Immediate)]
+
+        pattern_0op = [Instruction]
+
+        if name in ('mov', 'add', 'adc', 'sub', 'sbb',
+                    'and', 'xor', 'or', 'cmp',):
+            if instr_len == 4:      # 2 op
+                self.instance_check(4, line[pos:], pattern_2op, line_num)
+                self.allocate_check(1, instr_len, line, line_num, pos)
+                if ((line[pos + 3].name == 'mem' and
+                     line[pos + 1].name == 'mem') or
+                        (self.name != 'mov' and
+                         line[pos + 1].name != 'a')):
+                    raise WrongParameterException(line_num, line[pos])
+
+            elif instr_len < len(pattern_2op):
+                raise FewArgumentsException(line_num, 2)
+            else:
+                raise TooManyArgumentsException(line_num, 2)
+
+        elif name in ('hlt', 'nop', 'iret', 'ret',
+                      'rnc', 'rnz', 'rp', 'rpo',
+                      'rc', 'rz', 'rm', 'rpe',
+                      'rlc', 'rol', 'rrc', 'ror',
+                      'ral', 'rcl', 'rar', 'rcr',
+                      'clc', 'stc', 'cli', 'sti'):  # 0 op
+            if instr_len == 1:
+                return
+
+            elif instr_len < len(pattern_0op):
+                raise FewArgumentsException(line_num)
+            else:
+                raise TooManyArgumentsException(line_num, 0)
+
+        else:           # 1 op
+            if instr_len == 2:
+                if name in ['inc', 'dec', 'pop']:
+                    self.instance_check(2, line[pos:], pattern_1op_3, line_num)
+                    self.allocate_check(1, instr_len, line, line_num, pos)
+
+                elif name in ('in', 'out'):
+                    self.instance_check(2, line[pos:], pattern_1op_2, line_num)
+                    self.allocate_check(1, instr_len, line, line_num, pos)
+                    line[pos + 1].size = 0
+
+                elif name == 'int':
+                    self.instance_check(2, line[pos:], pattern_1op_2, line_num)
+                    self.allocate_check(1, instr_len, line, line_num, pos)
+                    # line[pos + 1].size = 0
+
+                elif name in ('jmp', 'call',
+                              'jnc', 'jae', 'jnb', 'jc', 'jb', 'jnae',
+                              'jnz', 'jne', 'jz', 'je', 'jns', 'js',
+                              'jnp', 'jpo', 'jp', 'jpe',
+                              'cnc', 'cnz', 'cp', 'cpo',
+                              'cc', 'cz', 'cm', 'cpe'):
+                    self.instance_check(2, line[pos:], pattern_1op_1, line_num)
+                    if isinstance(line[pos + 1], Immediate):    # address
+                        line[pos + 1].allocate = line[pos + 1].size = 2
+
+                elif name == 'push':
+                    self.instance_check(2, line[pos:], pattern_1op_4, line_num)
+                    self.allocate_check(1, instr_len, line, line_num, pos)
+
+                else:
+                    raise WrongParameterException(line_num, name)
+
+            elif instr_len < len(pattern_1op):
+                raise FewArgumentsException(line_num, 1)
+            else:
+                raise TooManyArgumentsException(line_num, 1)
+
+    @staticmethod
+    def allocate_check(alloc_need, instr_len, line, line_num, pos):
+        for i in range(pos + 1, instr_len, 2):
+            if line[i].allocate != alloc_need:
+                raise WrongOperandSize(line_num, alloc_need, line[i])
+
+    def generate(self, line, pos, l_num):
+        name = self.name
+
+        if name == 'hlt':
+            return [isa.HLT]
+
+        elif name in ('in', 'out'):
+            opc = {'in': isa.IN, 'out': isa.OUT}
+            return [opc[name] | (line[pos + 1].value << 1)]
+
+        elif name == 'ret':
+            return [isa.RET]
+
+        elif name in isa.RET_CONDITIONS:
+            return [isa.RET_COND | (isa.RET_CONDITIONS[name] << 3)]
+
+        elif name == 'call':
+            return [isa.CALL]
+
+        elif name in isa.CALL_CONDITIONS:
+            return [isa.CALL_COND | (isa.CALL_CONDITIONS[name] << 3)]
+
+        elif name == 'jmp':
+            return [isa.JMP]
+
+        elif name in isa.JMP_CONDITIONS:
+            return [isa.JMP_COND | (isa.JMP_CONDITIONS[name] << 3)]
+
+        elif name == 'mov':
+            dst = line[pos + 1].code << 3
+            if isinstance(line[pos + 3], (Immediate, Symbol, Variable)):
+                return [isa.MOV_IMM | dst]
+            return [isa.MOV_RR | dst | line[pos + 3].code]
+
+        elif name in ('inc', 'dec'):
+            code = isa.INC if name == 'inc' else isa.DEC
+            return [code | (line[pos + 1].code << 3)]
+
+        elif name == 'push':
+            if isinstance(line[pos + 1], Immediate):
+                return [isa.PUSH_IMM]
+            return [isa.PUSH_R | (line[pos + 1].code << 3)]
+
+        elif name == 'pop':
+            return [isa.POP_R | (line[pos + 1].code << 3)]
+
+        elif name in isa.ALU_OPERATIONS:
+            select = isa.ALU_OPERATIONS[name] << 3
+            if isinstance(line[pos + 3], Immediate):
+                return [isa.ALU_IMM | select]
+            return [isa.ALU_R | select | line[pos + 3].code]
+
+        elif name in isa.ROTATIONS:
+            return [isa.ROTATE | (isa.ROTATIONS[name] << 3)]
+
+        elif name == 'int':
+            return [isa.INT]
+
+        elif name == 'iret':
+            return [isa.IRET]
+
+        elif name in isa.FLAG_OPERATIONS:
+            return [isa.FLAG | (isa.FLAG_OPERATIONS[name] << 4)]
+
+        return [isa.HLT]
+
+
+class Directive(Action):
+    __slots__ = ()
+
+    ALLOCATING = {'db': 1, 'dw': 2, 'dd': 4, 'dq': 8, 'dt': 10}
+
+    def __init__(self, name):
+        super().__init__(group='Directive', name=name)
+        self.allocate = Directive.ALLOCATING.get(name)
+
+    def syntax_check(self, line_num, pos, line):
+        name = self.name
+
+        if name in ('db', 'dw', 'dd', 'dq', 'dt'):
+            self._repeats(line, pos, line_num)
+            self._values_check(line, pos, line_num)
+            self._values_apply(line, pos, line_num)
+
+            if isinstance(line[0], Variable):
+                first = line[2]
+                if isinstance(first, Repeat):
+                    first = first.first
+                line[0].allocate = self.allocate
+                line[0].value = first.value
+                line[0].expression = first.expression
+                self.value = first.value
+
+        elif name in ('equ', '='):
+            if line[pos + 1].size > line[pos - 1].allocate:
+                line[pos - 1].allocate = line[pos + 1].size
+                line[pos - 1].size = line[pos + 1].size
+                # raise WrongOperandSize(line_num, 1, line[pos + 1])
+            line[pos - 1].value = line[pos + 1].value
+            line[pos - 1].expression = getattr(line[pos + 1], 'expression',
+                                               None)
+            return -1
+
+        elif name == 'org':
+            if (pos or (not isinstance(line[pos + 1], Immediate)) or
+                    (line[pos + 1].allocate > 2)):
+                raise WrongParameterException(line_num, name)
+            self.value = line[pos + 1].value
+            return -1
+
+        elif name in ('end', 'endp'):
+            return -1
+
+    def _repeats(self, line, pos, line_num):
+        """
+        Replace every `<count> dup <values>` of the line by the Repeat,
+        the inner ones first (dup takes the rest of the line).
+        """
+        for dup in range(len(line) - 1, pos, -1):
+            if not (isinstance(line[dup], Directive) and
+                    line[dup].name == 'dup'):
+                continue
+            count = line[dup - 1]
+            if (dup - 1 <= pos or
+                    not isinstance(count, (Immediate, Name)) or
+                    not isinstance(count.value, int) or count.value < 1):
+                raise WrongParameterException(line_num, line[dup].name)
+            repeat = Repeat(count.value, line[dup:])
+            self._values_check(repeat.tokens, 0, line_num)
+            del line[dup - 1:]
+            line.append(repeat)
+
+    def _values_check(self, tokens, pos, line_num):
+        """The values after `pos` are separated by the commas"""
+        pattern = [Comma, (Immediate, Name, Repeat)]
+        if len(tokens[pos:]) % 2:
+            raise WrongParameterException(line_num, tokens[pos].name)
+
+        self.instance_check(1, tokens[pos+1:pos+2], [pattern[1]], line_num)
+        for i in range(pos + 2, len(tokens), 2):
+            self.instance_check(2, tokens[i:i+2], pattern, line_num)
+
+    def _values_apply(self, tokens, pos, line_num):
+        """Size the values after `pos` by the directive, return the size"""
+        size = 0
+        for i in range(pos + 1, len(tokens), 2):
+            token = tokens[i]
+            if isinstance(token, Repeat):
+                token.size = token.count * self._values_apply(token.tokens, 0,
+                                                              line_num)
+            else:
+                self.allocate_apply(token, line_num)
+            size += token.size
+        return size
+
+    def allocate_apply(self, token: Token, line_num):
+        if token.allocate is not None:
+            if self.allocate < token.allocate:
+                raise WrongOperandSize(line_num, self.allocate, token)
+
+            elif (isinstance(token, Immediate) and
+                  (self.allocate > token.allocate)):
+                token.allocate = self.allocate
+                token.size = self.allocate
+
+
+class Operand(Token):
+    __slots__ = ()
+
+    def __init__(self, name, group=None):
+        super().__init__('Operand', group=group, name=name)
+
+    @staticmethod
+    def is_this(line, pos):
+        if (line[pos][0].isdigit() or
+                line[pos] in ('a', 'b', 'c', 'd', 'e', 'h', 'l', 'mem', '?') or
+                line[pos][0] in ('"', "'", '-', '(')):
+            return Operand.get_token(line, pos)
+        return False
+
+    @staticmethod
+    def get_token(line, pos):
+        return Operand(name=line[pos]).specify(line, pos)
+
+    def specify(self, line, pos):
+        if (line[pos][0].isdigit() or line[pos][0] in ('"', "'", '-') or
+                line[pos] == '?'):
+            val = Immediate.value_parse(line[pos])
+            if isinstance(val, Undefined):
+                return val
+            return Immediate(line[pos], val)
+
+        elif line[pos].startswith('('):
+            return Immediate(line[pos], line[pos][1:-1].split())
+
+        # elif line[pos] == '?':
+        #     return
+
+        return Register.shared(line[pos])
+
+    def syntax_check(self, line_num, pos, line):
+        if not pos:
+            raise WrongParameterException(line_num, self.name)
+
+
+class Register(Operand):
+    __slots__ = ('code',)
+
+    def __init__(self, reg):
+        super().__init__(group='Register', name=reg)
+        self.allocate = 1
+        self.code = self._get_code(self.name)
+
+    @staticmethod
+    def _get_code(name):
+        return isa.REGISTERS.get(name)
+
+    @staticmethod
+    def shared(name):
+        """The registers are never changed, one token per name"""
+        register = REGISTERS.get(name)
+        if register is None:
+            register = REGISTERS[name] = Register(name)
+        return register
+
+
+class Immediate(Operand):
+    __slots__ = ('type', 'expression', 'relocatable')
+
+    def __init__(self, name: str, value=None):
+        super().__init__(group='Immediate', name=name)
+        self.value = value
+        self.type = None
+        self.expression = None      # Expression of the value
+        self.relocatable = False    # the expression depends on a label
+        self._set_allocate()
+        self._set_size()
+
+    BIN = re.compile(r'-?[01]+')
+    OCT = re.compile(r'-?[0-8]+')
+    HEX = re.compile(r'-?\d+[\da-f]*')
+    DEC = re.compile(r'-?\d+')
+    STRING = re.compile(r"""('.*?')|(".*?")""")
+
+    @staticmethod
+    def value_parse(value: str):
+        if value[0].isdigit() or (value[0] == '-'):
+            suffix, digits = value[-1], value[:-1]
+            if suffix == 'b' and Immediate.BIN.fullmatch(digits):
+                return Immediate._get_value(digits, 2)   # bin
+
+            elif suffix in 'oq' and Immediate.OCT.fullmatch(digits):
+                return Immediate._get_value(digits, 8)   # oct
+
+            elif suffix == 'h' and Immediate.HEX.fullmatch(digits):
+                return Immediate._get_value(digits, 16)  # hex
+
+            elif suffix == 'd' and Immediate.DEC.fullmatch(digits):
+                return Immediate._get_value(digits, 10)  # dec
+
+            elif Immediate.DEC.fullmatch(value):
+                return Immediate._get_value(value, 10)   # dec
+
+        elif value == '?':
+            return 0
+
+        elif Immediate.STRING.match(value):
+            return value[1:-1]  # ascii
+
+        return Undefined()
+
+    @staticmethod
+    def _get_value(value, base):
+        value = int(value, base)
+        return value
+        # if -128 <= value <= 255:
+        #     return value
+
+    def _set_allocate(self):
+        if isinstance(self.value, (str, list)) or (-128 <= self.value <= 255):
+            self.allocate = 1   # BYTE
+        elif -32768 <= self.value <= 65535:
+            self.allocate = 2   # WORD
+        elif (2 ** (8 * 4)) / -2 <= self.value <= (2 ** (8 * 4)) - 1:
+            self.allocate = 4   # DWORD
+        elif (2 ** (8 * 8)) - 2 <= self.value <= (2 ** (8 * 8)) - 1:
+            self.allocate = 8   # QWORD
+        elif (2 ** (8 * 10)) / 2 <= self.value <= (2 ** (8 * 10)) - 1:
+            self.allocate = 10  # 10 BYTES
+        else:
+            print(type(self.value), self.value)
+            raise TypeError
+
+    def _set_size(self):
+        # self.size = self.allocate
+        if isinstance(self.value, str):
+            self.size = len(self.value)
+        else:
+            self.size = self.allocate
+
+    def generate(self, line, pos, l_num):
+        if isinstance(self.value, str):
+            zeros = ((self.allocate * (
+                    (len(self.value) // self.allocate) +
+                    bool(len(self.value) % self.allocate)
+            )) - len(self.value))
+            values = [ch for ch in bytes(self.value, encoding='ascii')]
+            return values + ([0] * zeros)
+
+        elif line[pos - 1].name in ('in', 'out'):
+            return []
+        else:
+            if self.value < 0:
+                signed = True
+            elif self.allocate == 1 and self.value > 127:
+                signed = False
+            elif self.allocate == 2 and self.value > 32_767:
+                signed = False
+            elif self.allocate == 4 and self.value > 2_147_483_647:
+                signed = False
+            elif self.allocate == 8 and self.value > ((2 ** 64) / 2) - 1:
+                signed = False
+            elif self.allocate == 10 and self.value > ((2 ** 80) / 2) - 1:
+                signed = False
+            else:
+                signed = False
+
+            return [i for i in self.value.to_bytes(self.allocate, 'little',
+                                                   signed=signed)]
+
+    def syntax_check(self, line_num, pos, line):
+        if line[pos - 1] in ('in', 'out') and self.value > 15:
+            raise WrongOperandValue(line_num, self.value)
+
+
+class Name(Operand, Token):
+    __slots__ = ('value_type', 'type', 'external', 'expression')
+
+    PATTERN = re.compile(r'[a-z_][a-z\d?@_$]{0,31}:?')
+
+    def __init__(self, name, group=None, value_type=None):
+        Token.__init__(self, 'Name', group=group)
+        self.value_type = value_type  # address, data, constant
+        self.type = None
+        self.name = name
+        self.external = False   # EXTRN, the value is set by the linker
+        self.expression = None  # Expression of the EQU or DB value
+
+    @staticmethod
+    def is_this(line, pos):
+        if Name.PATTERN.fullmatch(line[pos]):
+            return Name.get_token(line, pos)
+        return False
+
+    @staticmethod
+    def get_token(line, pos):
+        return Name(line[pos]).specify(line, pos)
+
+    def specify(self, line, name_pos):
+        if name_pos != 0:
+            # if (len(line[name_pos]) >= 3) and
+            return self
+
+        if line[0].endswith(':'):
+            line[0] = line[0][:-1]
+            return self._label(line[0])     # Label
+
+        elif len(line) < 2:
+            return Undefined()
+
+        elif len(line) == 2:
+            if line[1] == 'proc':
+                return self._label(line[0])     # Label
+            elif line[1] == 'endp':
+                return self._label(line[0])
+        elif len(line) >= 3:
+            if line[1] == 'proc':
+                del line[1:]
+                return self._label(line[0])     # Label
+            elif line[1] == 'label':
+                del line[1:]
+                return self._label(line[0])     # Label
+
+            elif line[1] in ('db', 'dw', 'dd', 'dq', 'dt'):
+                return self._variable(line, name_pos)  # Variable
+
+            elif line[1] in ('equ', '='):
+                del line[3:]
+                return self._symbol(line[0])    # Symbol
+
+        return Undefined()
+
+    def syntax_check(self, line_num, pos, line):
+        return True
+
+    @staticmethod
+    def _label(name):
+        return Label(name)
+
+    @staticmethod
+    def _variable(line, name_pos):
+
+        return Variable(line[name_pos])
+
+    @staticmethod
+    def _symbol(name):
+        return Symbol(name)
+
+    def __repr__(self):
+        return f'[{self.cls}: {self.group}: "{self.name}": {self.value}]'
+
+    def generate(self, line, pos, l_num):
+        ret = []
+        if pos:
+            if self.value is None:
+                raise NameIsNotDefined(l_num, self.name)
+            ret = [i for i in self.value.to_bytes(self.allocate, 'little',
+                                                    signed=True)]
+        return ret
+
+
+class Label(Name):
+    """
+    <name>:
+        Examples:
+            CLEAR_SCREEN: MOV AL,20H
+            FOO: DB 0FH
+            SUBROUTINE3:
+
+    <name> LABEL NEAR
+    <name> LABEL FAR
+        Examples:
+            FOO LABEL NEAR
+            GOO LABEL FAR
+
+    <name> PROC
+    <name> PROC NEAR
+    <name> PROC FAR
+        Examples:
+            REPEAT PROC NEAR
+            CHECKING PROC ;same as CHECKING PROC NEAR
+            FIND_CHR PROC FAR
+
+    EXTRN <name>:NEAR
+    EXTRN <name>:FAR
+        Examples:
+            EXTRN FOO:NEAR
+            EXTRN ZOO:FAR
+
+    """
+    __slots__ = ('segment', 'offset', 'cs_assume')
+
+    def __init__(self, name):
+        super().__init__(name, group='Label', value_type='address')
+        self.segment = None
+        self.offset = None  # 16-bit unsigned number.
+        self.type = None  # NEAR (2 byte pointer) or FAR (4 byte pointer).
+        self.cs_assume = None
+        self.allocate = 2
+        self.size = 2
+
+    def generate(self, line, pos, l_num):
+        if pos:
+            return [i for i in self.value.to_bytes(self.allocate, 'little',
+                                                   signed=False)]
+        return []
+
+
+class Variable(Name):
+    """
+    <name> <define-dir>         ;no colon!
+           <define-dir> - DB/DW/DD/DQ/DT
+    <name> <struc-name> <expression>
+           <struc-name> - STRUC
+    <name> <rec-name> <expression>
+           <rec-name> - RECORD
+        Example:
+            START_MOVE DW ?
+
+            CORRAL STRUC
+                    *
+                    *
+                    *
+                   ENDS
+            HORSE CORRAL <'SADDLE'>
+
+            GARAGE RECORD CAR:8='P'
+            SMALL GARAGE 10 DUP(<'Z'>)
+
+    <name> LABEL <size>
+                 <size> is one of the following size specifiers:
+                     BYTE - specifies 1 byte
+                     WORD - specifies 2 bytes
+                     DWORD - specifies 4 bytes
+                     QWORD - specifies 8 bytes
+                     TBYTE - specifies 10 bytes
+        Example:
+            CURSOR LABEL WORD
+
+    EXTRN <name>:<size>
+        Example:
+            EXTRN FOO:DWORD
+
+    """
+    __slots__ = ('segment', 'offset')
+
+    def __init__(self, name, allocate=None):
+        super().__init__(name, group='Variable', value_type='data')
+        self.segment = None
+        self.offset = None  # 16-bit unsigned number.
+        self.type = None
+        self.allocate = allocate
+        # Directive Tvpe    Size
+        # DB        BYTE    1 byte
+        # DW        WORD    2 bytes
+        # DD        DWORD   4 bytes
+        # DQ        QWORD   8 bytes
+        # DT        TBYTE   10 bytes
+
+    def generate(self, line, pos, l_num):
+        if pos:
+            if isinstance(self.value, str):
+                return [ch for ch in bytes(self.value, encoding='ascii')]
+            else:
+                return [i for i in self.value.to_bytes(self.allocate, 'little',
+                                                       signed=True)]
+        return []
+
+
+class Symbol(Name):
+    """
+    <name> EQU <expression>
+               <expression> may be another symbol, an instruction mnemonic,
+               a valid expression, or any other entry (such as text or
+               indexed references).
+        Examples:
+            FOO EQU 7H
+            ZOO EQU FOO
+
+    <name> = <expression>
+             <expression> may be any valid expression.
+        Examples:
+            GOO = 0FH
+            GOO = $+2
+            GOO = GOO+FOO
+
+    EXTRN <name>:ABS
+        Examples:
+            EXTRN BAZ:ABS
+            BAZ must be defined by an EQU or = directive to a valid expression.
+
+    """
+    __slots__ = ()
+
+    def __init__(self, name):
+        super().__init__(name, group='Symbol', value_type='constant')
+        self.allocate = 1
+        self.size = 1
+
+    def generate(self, line, pos, l_num):
+        if line[pos - 1].name in ('in', 'out'):
+            return []
+        if pos:
+            if isinstance(self.value, str):
+                return [ch for ch in bytes(self.value, encoding='ascii')]
+            else:
+                return [i for i in self.value.to_bytes(self.allocate, 'little',
+                                                       signed=True)]
+        return []
+
+
+class Repeat(Token):
+    """
+    <count> DUP <values>
+            <values> - the rest of the line, may contain another DUP
+        Examples:
+            DB 226 DUP 0
+            DW 4 DUP 1, 2           ;1, 2, 1, 2, 1, 2, 1, 2
+            DB 2 DUP 0FFh, 3 DUP 0  ;0FFh, 0, 0, 0 twice
+
+    The values are sized and generated once, the size of the node is
+    known without the expansion and the code is repeated as a whole.
+    """
+    __slots__ = ('count', 'tokens')
+
+    def __init__(self, count, tokens):
+        super().__init__('Repeat', group='Repeat', name='dup')
+        self.count = count
+        self.tokens = tokens    # the dup directive and the values
+
+    @property
+    def first(self):
+        """The first value"""
+        token = self.tokens[1]
+        return token.first if isinstance(token, Repeat) else token
+
+    def generate(self, line, pos, l_num):
+        code = bytearray()
+        for pos_i in range(1, len(self.tokens)):
+            code.extend(self.tokens[pos_i].generate(self.tokens, pos_i,
+                                                    l_num))
+        return bytes(code) * self.count
+
+    def __repr__(self):
+        return f'[{self.cls}: {self.count} x {self.tokens[1:]}]'
+
+
+COMMA = Comma(',')
+REGISTERS = {}  # name: the shared Register
+
+
+class NameTable:
+    def __init__(self):
+        self.table = {}
+
+    def add_name(self, name_token: Name):
+        if name_token.name in self.table:
+            return
+        self.table[name_token.name] = name_token
+
+    def get(self, name):
+        result = None
+        try:
+            result = self.table.get(name)
+        except KeyError:
+            result = None
+        finally:
+            return result
+
+    def __repr__(self):
+        return str(self.table)
+
+    def __getitem__(self, name):
+        return self.table.get(name)
+
+    def __iter__(self):
+        for key in self.table:
+            yield key
+
+    def __len__(self):
+        return len(self.table)
+
+
+TOKEN_PATTERN = re.compile(r"""
+      (\n)
+    | ;[^\n]*                           # comment
+    | (   '[^'\n]*' | "[^"\n]*"          # string
+        | \([^;\n]*\)                   # expression up to the last ')'
+        | (?i:high|low)\s*\([^;\n]*\)    # high(...) and low(...)
+        | ,
+        | [^\s,;'"(]+                    # word
+        | \S
+      )
+""", re.VERBOSE)
+
+TOKEN_QUOTED = ('"', "'", '(')
+
+
+def tokenize(text: str):
+    """
+    Split the text to the lexemes in one pass of TOKEN_PATTERN.
+    Words are lowercased and interned (the mnemonics, registers and
+    names are shared by all the lines), strings and expressions are kept as is,
+    high(...), low(...) and $ are enclosed in the parentheses.
+    Return the list of the lexemes of every line.
+    """
+    parts = []
+    lines = [parts]
+    for newline, part in TOKEN_PATTERN.findall(text):
+        if newline:
+            parts = []
+            lines.append(parts)
+        elif part:
+            if part[0] in TOKEN_QUOTED:
+                parts.append(part)
+            elif '(' in part or part == HERE:
+                parts.append(f'({part})')
+            else:
+                parts.append(sys.intern(part.lower()))
+    return lines
+
+
+def lexeme_column(line: str, pos: int):
+    """Column of the lexeme number `pos` of the line, starting from 1"""
+    for match in TOKEN_PATTERN.finditer(line):
+        if match.group(2):
+            if not pos:
+                return match.start() + 1
+            pos -= 1
+    return None
+
+
+class LineCache:
+    """
+    Persistent cache of the assembled lines keyed by the line hash:
+    the tokens of the line and its code with the last operand values.
+    Only plain data is stored, the tokens are rebuilt by their classes.
+    `limit` - number of the lines kept, the oldest ones are dropped.
+    The cache can be shared by the threads.
+    """
+    VERSION = 3
+    TOKENS = {cls.__name__: cls for cls in (
+        Comma, Instruction, Directive, Register, Immediate,
+        Name, Label, Variable, Symbol)}
+
+    def __init__(self, path=None, limit=None):
+        self.path = path
+        self.limit = limit
+        self.lines = {}
+        self.code = {}
+        self.hits = 0
+        self.misses = 0
+        self._used = set()
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            try:
+                with open(path, 'rb') as file:
+                    data = pickle.load(file)
+            except Exception:   # unreadable or stale cache is rebuilt
+                data = None
+            if isinstance(data, dict) and data.get('version') == self.VERSION:
+                self.lines = data['lines']
+                self.code = data['code']
+
+    @staticmethod
+    def key(line: str):
+        return hashlib.blake2b(line.encode(), digest_size=16).digest()
+
+    def tokens(self, line: str):
+        """New tokens of the line or None if it is not cached"""
+        key = self.key(line)
+        with self._lock:
+            self._used.add(key)
+            specs = self.lines.get(key)
+            if specs is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        tokens = []
+        for cls, name, value in specs:
+            cls = self.TOKENS[cls]
+            if cls is Immediate:
+                if isinstance(value, tuple):
+                    value = list(value)     # expression, evaluated in place
+                tokens.append(Immediate(name, value))
+            elif cls is Comma:
+                tokens.append(COMMA)
+            elif cls is Register:
+                tokens.append(Register.shared(name))
+            else:
+                tokens.append(cls(sys.intern(name)))
+        return tokens
+
+    def store(self, line: str, tokens):
+        specs = []
+        for token in tokens:
+            value = token.value
+            if isinstance(value, list):
+                value = tuple(value)
+            specs.append((type(token).__name__, str(token.name), value))
+        with self._lock:
+            self.lines[self.key(line)] = tuple(specs)
+            self._shrink(self.lines)
+
+    def get_code(self, line: str, signature):
+        """Code of the line if it was built with the same signature"""
+        with self._lock:
+            entry = self.code.get(self.key(line))
+        if entry is not None and entry[0] == signature:
+            return entry[1]
+        return None
+
+    def set_code(self, line: str, signature, code):
+        with self._lock:
+            self.code[self.key(line)] = (signature, code)
+            self._shrink(self.code)
+
+    def _shrink(self, entries):
+        """Drop the oldest entries over the limit"""
+        if self.limit is None:
+            return
+        while len(entries) > self.limit:
+            key = next(iter(entries))
+            del entries[key]
+            if key not in self.lines and key not in self.code:
+                self._used.discard(key)
+
+    def save(self):
+        """Store the entries of the last build only"""
+        if not self.path:
+            return
+        with self._lock:
+            data = {'version': self.VERSION,
+                    'lines': {k: v for k, v in self.lines.items()
+                              if k in self._used},
+                    'code': {k: v for k, v in self.code.items()
+                             if k in self._used}}
+        with open(self.path, 'wb') as file:
+            pickle.dump(data, file, pickle.HIGHEST_PROTOCOL)
+
+
+class LineColumn:
+    """
+    Integer of every line number kept in an array instead of a dict
+    (4 bytes per line), the lines without a value hold MISSING.
+    Reads like a dict of the line numbers.
+    """
+    MISSING = -1
+
+    def __init__(self, lines=0):
+        self._values = array('i', [self.MISSING]) * (lines + 1)
+
+    def __setitem__(self, l_num, value):
+        values = self._values
+        if l_num >= len(values):
+            values.extend([self.MISSING] * (l_num + 1 - len(values)))
+        values[l_num] = value
+
+    def __getitem__(self, l_num):
+        if 0 <= l_num < len(self._values):
+            value = self._values[l_num]
+            if value != self.MISSING:
+                return value
+        raise KeyError(l_num)
+
+    def get(self, l_num, default=None):
+        try:
+            return self[l_num]
+        except KeyError:
+            return default
+
+    def __contains__(self, l_num):
+        return self.get(l_num) is not None
+
+    def __iter__(self):
+        for l_num, value in enumerate(self._values):
+            if value != self.MISSING:
+                yield l_num
+
+    def items(self):
+        for l_num, value in enumerate(self._values):
+            if value != self.MISSING:
+                yield l_num, value
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+
+class Lexer:
+    DECLARATION = re.compile(r'\s*(include|public|extrn)\s+([^;]*)',
+                             re.IGNORECASE)
+
+    def __init__(self, text: str, cache: LineCache = None, path: str = None):
+        self.path = path
+        self.sources = {} if path is None else {path: text}
+        # first line numbers of the included and the resumed parts of
+        # the files and their (path, line in the file)
+        self._origin_lines = []
+        self._origins = []
+        self.public = []        # (name, line number)
+        self.external = []      # (name, type)
+        self._lines = self._preprocess(text.splitlines(), path, ())
+        self._table = {}
+        self._name_table = NameTable()
+        self._cache = cache
+        self._references = []   # (line number, position) of the names
+        self._expressions = []  # (line number, Immediate)
+        self._definitions = {}  # name: line number of the definition
+        self._modified = set()  # line numbers changed by the optimizer
+        self.org = 0
+        self.addresses = LineColumn(len(self._lines))  # line number: address
+        self.listing = bytearray()
+        self._offsets = LineColumn()    # line number: offset of its code
+        self._sizes = LineColumn()      # line number: size of its code
+        self.procedures = {}    # name: [start, end] addresses of the proc
+        # (function, line number, change, bytes, removed and added opcodes)
+        self.optimizations = []
+
+    def _preprocess(self, lines, path, included, first=0):
+        """
+        Insert the lines of the included files and collect the PUBLIC
+        and EXTRN names. The declaration lines are left empty.
+        `first` - number of the lines before.
+        """
+        result = []
+        self._origin(first + 1, path, 1)
+        for index, line in enumerate(lines):
+            match = self.DECLARATION.match(line)
+            if match is None:
+                result.append(line)
+                continue
+            keyword, args = match.group(1).lower(), match.group(2).strip()
+            l_num = first + len(result) + 1
+            if keyword == 'include':
+                name = args.strip('\'"')
+                if path is not None:
+                    name = os.path.join(os.path.dirname(path), name)
+                name = os.path.normpath(name)
+                if name in included or name == path:
+                    raise RecursiveInclude(l_num, name)
+                with open(name, 'r') as file:
+                    text = file.read()
+                self.sources[name] = text
+                result += self._preprocess(text.splitlines(), name,
+                                           included + (path,), l_num - 1)
+                self._origin(first + len(result) + 1, path, index + 2)
+                continue
+            for name in args.split(','):
+                name, _, kind = name.strip().lower().partition(':')
+                if not name:
+                    continue
+                if keyword == 'public':
+                    self.public.append((name, l_num))
+                else:
+                    self.external.append((name, kind.strip() or 'near'))
+            result.append('')
+        return result
+
+    def _origin(self, l_num, path, line):
+        self._origin_lines.append(l_num)
+        self._origins.append((path, line))
+
+    def analyze(self, verbose, optimize=False):
+        if self._cache is None:
+            lexemes = tokenize('\n'.join(self._lines))
+        for l_number in range(len(self._lines)):
+            line = self._lines[l_number]
+            if not len(line):
+                continue
+            if self._cache is None:
+                tokens = self._tokenize(lexemes[l_number], l_number + 1)
+            else:
+                tokens = self._cache.tokens(line)
+                if tokens is None:
+                    tokens = self._tokenize(tokenize(line)[0], l_number + 1)
+                    self._cache.store(line, tokens)
+            if not len(tokens):
+                continue
+            if (isinstance(tokens[0], Name) and tokens[0].group is not None
+                    and tokens[0].name not in self._name_table):
+                self._name_table.add_name(tokens[0])
+                self._definitions[tokens[0].name] = l_number + 1
+            self._table[l_number + 1] = tokens
+            self._index(tokens, l_number + 1)
+
+        for name, kind in self.external:
+            if name not in self._name_table:     # the local name is used
+                # NAME:NEAR and NAME:FAR are addresses, NAME:ABS is a byte
+                token = Symbol(name) if kind in ('abs', 'byte') else Label(name)
+                token.value = 0
+                token.external = True
+                self._name_table.add_name(token)
+
+        self._resolve_names()
+
+        if optimize:
+            self._optimize()
+
+        self._syntax_analyze()
+
+        for name in self._name_table:
+            if (isinstance(self._name_table[name], Label) and
+                    not self._name_table[name].external):
+                self._name_table[name].value += self.org
+        for l_num in self.addresses:
+            self.addresses[l_num] += self.org
+        for bounds in self.procedures.values():
+            bounds[:] = [address if address is None else address + self.org
+                         for address in bounds]
+
+        self._evaluate_expressions()
+
+        if verbose:
+            print('\nName Table')
+            for i in self._name_table:
+                print(f'{self._name_table[i]}')
+                
+            for i in sorted(self._table):
+                print('\n', i, end=': ')
+                for j in self._table[i]:
+                    print(j, j.size, j.allocate, end=', ')
+                # print(i, self._table[i])
+
+    def _tokenize(self, parts: list, l_num: int):
+        tokens = []
+        for pos in range(len(parts)):
+            token = self._token_converter(parts, pos)
+            if token is None:
+                continue
+            elif isinstance(token, Undefined):
+                column = None
+                if l_num <= len(self._lines):
+                    column = lexeme_column(self._lines[l_num - 1], pos)
+                raise WrongParameterException(l_num, parts[pos], column)
+            tokens.append(token)
+        return tokens
+
+    def _index(self, tokens: list, l_num: int):
+        """Record the name references and parse the expressions"""
+        for pos in range(len(tokens)):
+            token = tokens[pos]
+            if isinstance(token, Name):
+                if token.group is None:
+                    self._references.append((l_num, pos))
+            elif isinstance(token, Immediate) and isinstance(token.value, list):
+                try:
+                    token.expression = parse(' '.join(token.value))
+                except ExpressionError:
+                    raise WrongParameterException(l_num, token.name)
+                if token.expression.constant is None:
+                    self._expressions.append((l_num, token))
+                else:   # folded, sized as a number
+                    token.value = token.expression.constant
+                    token._set_allocate()
+                    token._set_size()
+
+    def _resolve_names(self):
+        """Replace the name references by the defined names"""
+        for l_num, pos in self._references:
+            line = self._table[l_num]
+            definition = self._name_table[line[pos].name]
+            if definition is not None:
+                line[pos] = definition
+
+    @staticmethod
+    def _token_converter(line: list, pos: int):
+        try:
+            first = line[pos][0]
+        except IndexError:
+            return None
+        if first == ',':
+            return Comma(line[pos])
+        elif first in TOKEN_QUOTED:     # string or expression
+            return Operand.get_token(line, pos)
+
+        spaces = [Action, Operand, Name]
+
+        for space in spaces:
+            try:
+                token = space.is_this(line, pos)
+            except IndexError:
+                return None
+            else:
+                if token:
+                    return token
+        return Undefined()
+
+    # hlt is not here: the interrupt resumes after it
+    TERMINATORS = ('jmp', 'ret', 'iret')
+    JUMPS = (frozenset(('jmp', 'call')) | frozenset(isa.JMP_CONDITIONS) |
+             frozenset(isa.CALL_CONDITIONS))
+
+    def _optimize(self):
+        """
+        Peephole pass over the resolved lines, repeated while it changes
+        anything: push x / pop x pairs are removed, jumps to `jmp` go to
+        its target, the code after jmp/ret/iret up to the next label
+        is removed and call + ret becomes jmp.
+        """
+        function = label = ''
+        self._functions = {}
+        for l_num in sorted(self._table):
+            line = self._table[l_num]
+            if len(line) > 1 and isinstance(line[1], Directive):
+                if line[1].name == 'proc':
+                    function = line[0].name
+                elif line[1].name == 'endp':
+                    function = ''
+            elif isinstance(line[0], Label):
+                label = line[0].name
+            self._functions[l_num] = function or label
+
+        changed = True
+        while changed:
+            self._lines_order = sorted(self._table)
+            changed = self._push_pop()
+            changed |= self._thread_jumps()
+            changed |= self._tail_calls()
+            changed |= self._dead_code()
+
+    def _record(self, l_num, change, size, removed=(), added=()):
+        self.optimizations.append((self._functions[l_num], l_num, change,
+                                   size, list(removed), list(added)))
+        self._modified.add(l_num)
+
+    @staticmethod
+    def _instruction(line):
+        """Position of the instruction of the line (after its label)"""
+        pos = 1 if isinstance(line[0], Label) else 0
+        if pos < len(line) and isinstance(line[pos], Instruction):
+            return pos
+        return None
+
+    @staticmethod
+    def _label_operand(line, pos):
+        """
+        Local label operand of the instruction or None, the lines are
+        not checked yet, so the operand may be missing
+        """
+        if pos + 1 < len(line) and isinstance(line[pos + 1], Label):
+            if not line[pos + 1].external:
+                return line[pos + 1]
+        return None
+
+    @staticmethod
+    def _opcode(line, pos, l_num):
+        return line[pos].generate(line, pos, l_num)[0]
+
+    @staticmethod
+    def _line_size(line, pos):
+        if line[pos].name in ('in', 'out'):     # the port is in the opcode
+            return 1
+        return sum(token.size for token in line[pos:])
+
+    def _pairs(self):
+        """Adjacent lines of code (l_num, line, next l_num, next line)"""
+        for first, second in zip(self._lines_order, self._lines_order[1:]):
+            if first in self._table and second in self._table:
+                yield first, self._table[first], second, self._table[second]
+
+    def _push_pop(self):
+        changed = False
+        for first, push, second, pop in self._pairs():
+            if (len(push) == len(pop) == 2 and
+                    isinstance(push[0], Instruction) and
+                    isinstance(pop[0], Instruction) and
+                    push[0].name == 'push' and pop[0].name == 'pop' and
+                    isinstance(push[1], Register) and
+                    push[1].name == pop[1].name):
+                self._record(first, f'push {push[1].name} / pop', 2,
+                             (self._opcode(push, 0, first),
+                              self._opcode(pop, 0, second)))
+                del self._table[first], self._table[second]
+                changed = True
+        return changed
+
+    def _jump_target(self, name: str):
+        """Label reached from the label `name` through the jmp chain"""
+        visited = {name}
+        while name in self._definitions:
+            index = bisect.bisect_left(self._lines_order,
+                                       self._definitions[name])
+            for l_num in self._lines_order[index:]:
+                line = self._table.get(l_num)
+                if line is None:
+                    continue
+                pos = self._instruction(line)
+                if pos is not None or len(line) != 1:
+                    break
+            else:
+                break
+            if pos is None or line[pos].name != 'jmp':
+                break
+            label = self._label_operand(line, pos)
+            if label is None or label.name in visited:
+                break
+            name = label.name
+            visited.add(name)
+        return self._name_table[name]
+
+    def _thread_jumps(self):
+        changed = False
+        for l_num in self._lines_order:
+            line = self._table.get(l_num)
+            pos = None if line is None else self._instruction(line)
+            if pos is None or line[pos].name not in self.JUMPS:
+                continue
+            label = self._label_operand(line, pos)
+            if label is None:
+                continue
+            target = self._jump_target(label.name)
+            if target is not label:
+                self._record(l_num, f'{line[pos].name} {label.name}'
+                                    f' -> {target.name}', 0, (isa.JMP,))
+                line[pos + 1] = target
+                changed = True
+        return changed
+
+    def _tail_calls(self):
+        changed = False
+        for first, call, second, ret in self._pairs():
+            pos = self._instruction(call)
+            ret_pos = self._instruction(ret)
+            if (pos is None or call[pos].name != 'call' or
+                    ret_pos is None or ret[ret_pos].name != 'ret'):
+                continue
+            call[pos] = Instruction('jmp')
+            if ret_pos:     # labeled ret is kept for the other paths
+                self._record(first, 'call + ret -> jmp', 0,
+                             (isa.CALL, isa.RET), (isa.JMP,))
+            else:
+                self._record(first, 'call + ret -> jmp', 1,
+                             (isa.CALL, isa.RET), (isa.JMP,))
+                del self._table[second]
+            changed = True
+        return changed
+
+    def _dead_code(self):
+        """Unlabeled instructions after jmp, ret and iret"""
+        changed = False
+        dead = False
+        for l_num in self._lines_order:
+            line = self._table.get(l_num)
+            if line is None:
+                continue
+            if dead and isinstance(line[0], Instruction):
+                self._record(l_num, f'unreachable {line[0].name}',
+                             self._line_size(line, 0))
+                del self._table[l_num]
+                changed = True
+                continue
+            pos = self._instruction(line)
+            dead = pos is not None and line[pos].name in self.TERMINATORS
+        return changed
+
+    def _syntax_analyze(self):
+        address_gen = 0
+        for l_num in sorted(self._table):
+            self.addresses[l_num] = address_gen
+            # the line grows while checked (dup), so its length is read
+            # on every step
+            pos = -1
+            while pos + 1 < len(self._table[l_num]):
+                pos += 1
+                resp = self._table[l_num][pos].syntax_check(l_num, pos,
+                                                            self._table[l_num])
+                if resp == -1:
+                    token = self._table[l_num][pos]
+                    if (isinstance(token, Directive) and
+                            token.name == 'org' and not self.org):
+                        self.org = token.value
+                    elif (isinstance(token, Directive) and
+                          token.name == 'endp' and pos):
+                        name = self._table[l_num][0].name
+                        self.procedures.setdefault(
+                            name, [address_gen, None])[1] = address_gen
+                    del self._table[l_num]
+                    break
+                if (pos == 1 and isinstance(self._table[l_num][1], Directive)
+                        and self._table[l_num][1].name == 'proc'):
+                    self.procedures[self._table[l_num][0].name] = [
+                        address_gen, None]
+                size = self._table[l_num][pos].size
+                if not pos and isinstance(self._table[l_num][pos], Label):
+                    self._table[l_num][pos].value = address_gen
+                    continue
+                elif not pos and isinstance(self._table[l_num][pos], Symbol):
+                    continue
+                address_gen += size
+
+    def _evaluate_expressions(self):
+        for l_num, token in self._expressions:
+            if isinstance(token.value, list):   # not evaluated yet
+                token.value = self._evaluate(token.expression, l_num)
+                token.relocatable = token.expression.relative or any(
+                    isinstance(self._name_table[name], Label) or
+                    self._name_table[name].external
+                    for name in token.expression.names if name != HERE)
+
+        for name in self._definitions:
+            self._name_value(self._name_table[name])
+
+    def _name_value(self, token: Name, active=()):
+        """
+        Value of the name, the EQU and DB expressions are evaluated once
+        at the line of the definition.
+        """
+        if token.expression is not None and isinstance(token.value, list):
+            l_num = self._definitions[token.name]
+            if token.name in active:    # defined by itself
+                raise WrongParameterException(l_num, token.name)
+            token.value = self._evaluate(token.expression, l_num,
+                                         active + (token.name,))
+        return token.value
+
+    def _evaluate(self, expression: Expression, l_num: int, active=()):
+        values = {}
+        for name in expression.names:
+            if name == HERE:
+                values[name] = self.addresses[l_num]
+                continue
+            token = self._name_table[name]
+            if token is None:
+                raise NameIsNotDefined(l_num, name)
+            value = self._name_value(token, active)
+            if not isinstance(value, int):
+                raise WrongParameterException(l_num, name)
+            values[name] = value
+        try:
+            return expression.evaluate(values)
+        except ExpressionError:
+            raise WrongParameterException(l_num, expression.text)
+
+    def listing_gen(self):
+        """Emit the code of the lines to the `listing` bytearray"""
+        listing = self.listing
+        for l_num, line in self._table.items():
+            if self._cache is not None and l_num not in self._modified:
+                # the code depends on the resolved values only
+                text = self._lines[l_num - 1]
+                signature = self._signature(line)
+                code = self._cache.get_code(text, signature)
+                if code is None:
+                    code = self._line_gen(l_num, line)
+                    self._cache.set_code(text, signature, code)
+            else:
+                code = self._line_gen(l_num, line)
+            self._offsets[l_num] = len(listing)
+            self._sizes[l_num] = len(code)
+            listing += code
+        return listing
+
+    def code(self, l_num):
+        """Code of the line, empty for the lines without code"""
+        offset = self._offsets.get(l_num)
+        if offset is None:
+            return b''
+        return bytes(self.listing[offset:offset + self._sizes[l_num]])
+
+    def lines(self):
+        """
+        (line number, source text, address, tokens, code) of every line,
+        the address and the tokens are None for the lines without code.
+        """
+        for l_num, text in enumerate(self._lines, 1):
+            yield (l_num, text, self.addresses.get(l_num),
+                   self._table.get(l_num), self.code(l_num))
+
+    def source_line(self, l_num):
+        """(path, line number in the file) of the line, path may be None"""
+        index = bisect.bisect_right(self._origin_lines, l_num) - 1
+        path, line = self._origins[index]
+        return path, line + l_num - self._origin_lines[index]
+
+    def code_lines(self):
+        """(line number, address, code size) of the lines with code"""
+        for l_num, offset in self._offsets.items():
+            size = self._sizes[l_num]
+            if size:
+                yield l_num, self.org + offset, size
+
+    def relocations(self):
+        """
+        Fixups of the listing: (offset, size, expression, line address)
+        of every operand depending on a label address or on `$`.
+        """
+        fixups = []
+        offset = 0
+        for l_num, line in self._table.items():
+            here = self.addresses[l_num] - self.org
+            line_fixups, size = self._fixups(line, 0, l_num)
+            fixups += [(offset + fix_offset, fix_size, expression, here)
+                       for fix_offset, fix_size, expression in line_fixups]
+            offset += size
+        return fixups
+
+    def _fixups(self, tokens, first, l_num):
+        """
+        (offset, size, expression) of the relocatable operands of the
+        tokens from `first` and the size of their code.
+        """
+        fixups = []
+        offset = 0
+        for pos in range(first, len(tokens)):
+            token = tokens[pos]
+            if isinstance(token, Repeat):
+                inner, size = self._fixups(token.tokens, 1, l_num)
+                fixups += [(offset + i * size + fix_offset, fix_size,
+                            expression)
+                           for i in range(token.count)
+                           for fix_offset, fix_size, expression in inner]
+                offset += token.count * size
+                continue
+            size = len(token.generate(tokens, pos, l_num))
+            if pos and size:
+                if isinstance(token, Name) and (
+                        isinstance(token, Label) or token.external):
+                    fixups.append((offset, size, token.name))
+                elif isinstance(token, Immediate) and token.relocatable:
+                    fixups.append((offset, size, token.expression.text))
+            offset += size
+        return fixups, offset
+
+    def labels(self):
+        """Addresses of the labels by name"""
+        return {name: self._name_table[name].value
+                for name in self._name_table
+                if isinstance(self._name_table[name], Label) and
+                not self._name_table[name].external}
+
+    def make_object(self):
+        """Linker object of the assembled module"""
+        labels, constants = {}, {}
+        for name in self._name_table:
+            token = self._name_table[name]
+            if isinstance(token, Label):
+                if not token.external:
+                    labels[name] = token.value - self.org
+            elif (isinstance(token, Symbol) and not token.external and
+                  isinstance(token.value, int)):
+                constants[name] = token.value
+        for name, l_num in self.public:
+            if name not in labels and name not in constants:
+                raise NameIsNotDefined(l_num, name)
+        external = [name for name, _ in self.external
+                    if self._name_table[name].external]
+        lines = [(address - self.org, size) + self.source_line(l_num)
+                 for l_num, address, size in self.code_lines()]
+        procedures = {name: [None if address is None
+                             else address - self.org for address in bounds]
+                      for name, bounds in self.procedures.items()}
+        return linker.make_object(
+            self.listing, self.org or None, labels, constants,
+            [name for name, _ in self.public], external,
+            self.relocations(), self.sources, lines, procedures, self.path)
+
+    @staticmethod
+    def _signature(tokens):
+        """
+        Kinds, sizes and values the code of the tokens depends on:
+        a name of the same value may become a label of another width
+        """
+        return tuple((type(token).__name__, token.size, token.allocate,
+                      (token.count, Lexer._signature(token.tokens))
+                      if isinstance(token, Repeat) else token.value)
+                     for token in tokens)
+
+    @staticmethod
+    def _line_gen(l_num, line):
+        """Code of the line as bytes"""
+        code = bytearray()
+        for pos in range(len(line)):
+            try:
+                code.extend(line[pos].generate(line, pos, l_num))
+            except AttributeError:
+                raise NameIsNotDefined(l_num, line[pos].name)
+        return bytes(code)
+
+    def listing_to_txt_hex(self):
+        """Hex text of the listing, two uppercase digits per byte"""
+        return self.listing.hex().upper()
+
+
+def build_object(path, objects_dir=None, optimize=False):
+    """
+    Assemble the module to the linker object. The object file of
+    the unchanged sources in `objects_dir` is used as is.
+    `optimize` - run the peephole pass, the savings are kept
+    in the "optimizations" of the object.
+    """
+    obj_path = None
+    if objects_dir is not None:
+        obj_path = linker.object_path(path, objects_dir)
+        obj = linker.load_object(obj_path)
+        if (obj is not None and linker.is_up_to_date(obj, path) and
+                ('optimizations' in obj) == optimize):
+            return obj
+
+    with open(path, 'r') as file:
+        text = file.read()
+    try:
+        lex = Lexer(text, path=path)
+        lex.analyze(False, optimize)
+        lex.listing_gen()
+        obj = lex.make_object()
+        if optimize:
+            obj['optimizations'] = lex.optimizations
+    except ExceptionWithLineNumber as err:
+        # keep the message, the exception is pickled to the main process
+        raise BuildError(f'{path}: {err}') from None
+    if obj_path is not None:
+        linker.save_object(obj_path, obj)
+    return obj
+
+
+def savings(optimizations, microcode=None):
+    """
+    Bytes and cycles saved by the optimizer per function, the cycles
+    are None without the microcode.
+    """
+    result = {}
+    for function, _, _, size, removed, added in optimizations:
+        saved = result.setdefault(function, [0, 0])
+        saved[0] += size
+        if microcode is None:
+            saved[1] = None
+        elif saved[1] is not None:
+            saved[1] += (sum(map(microcode.cycles, removed)) -
+                         sum(map(microcode.cycles, added)))
+    return {function: tuple(saved) for function, saved in result.items()}
+
+
+class Image:
+    """
+    Code of the assembled program placed at the `org` address,
+    its labels, the (start, end) addresses of its procedures
+    and its DebugInfo.
+    """
+
+    def __init__(self, code, org=0, labels=None, procedures=None,
+                 debug=None):
+        self.code = bytes(code)
+        self.org = org
+        self.labels = dict(labels or {})
+        self.procedures = {name: tuple(bounds)
+                           for name, bounds in (procedures or {}).items()}
+        self.debug = debug
+
+    def __len__(self):
+        return len(self.code)
+
+    def __bytes__(self):
+        return self.code
+
+    def __repr__(self):
+        return f'<Image: {len(self.code)} bytes at {self.org:04X}h>'
+
+
+def assemble(source: str, path: str = None, cache: LineCache = None,
+             optimize=False):
+    """
+    Assemble the source text to the Image.
+    `path` - the source file name for the includes,
+    `cache` - LineCache shared by the assembled programs,
+    `optimize` - run the peephole pass.
+    """
+    lex = Lexer(source, cache, path)
+    lex.analyze(False, optimize)
+    lex.listing_gen()
+    return Image(lex.listing, lex.org, lex.labels(), lex.procedures,
+                 DebugInfo.from_lexer(lex))
+
+
+SERVER_CACHE_LINES = 100_000
+
+
+def handle_request(request: dict, cache: LineCache = None):
+    """
+    Assemble the program of the server request:
+        {"file": PATH} or {"source": TEXT[, "path": PATH]}
+        [, "out": PATH[, "format": "raw" | "bin" | "ihex"]]
+    The response is {"ok": true, "org": ORG, "size": SIZE} with
+    the hex "image" if there is no "out" (otherwise the debug file
+    is written next to it), or {"ok": false, "error": MESSAGE}.
+    """
+    try:
+        path = request.get('file') or request.get('path')
+        if 'source' in request:
+            source = request['source']
+        else:
+            with open(request['file'], 'r') as file:
+                source = file.read()
+        image = assemble(source, path, cache)
+
+        response = {'ok': True, 'org': image.org, 'size': len(image)}
+        if request.get('out'):
+            with open(request['out'], 'wb') as out:
+                rom.save_image(out, image.code, request.get('format', 'raw'),
+                               image.org)
+            image.debug.save(debug_path(request['out']))
+        else:
+            response['image'] = image.code.hex()
+        return response
+    except Exception as err:    # the server keeps running
+        return {'ok': False, 'error': f'{type(err).__name__}: {err}'}
+
+
+def serve(rfile, wfile, cache: LineCache = None):
+    """
+    Assemble the requests read from the text stream, one JSON object
+    per line, and write the responses. Return the number of requests.
+    The lines are cached for the stream (SERVER_CACHE_LINES at most)
+    if no `cache` is given.
+    """
+    if cache is None:
+        cache = LineCache(limit=SERVER_CACHE_LINES)
+    count = 0
+    for line in rfile:
+        if not line.strip():
+            continue
+        try:
+            request = json.loads(line)
+        except ValueError as err:
+            response = {'ok': False, 'error': f'Wrong request: {err}'}
+        else:
+            response = handle_request(request, cache)
+        wfile.write(json.dumps(response) + '\n')
+        wfile.flush()
+        count += 1
+    return count
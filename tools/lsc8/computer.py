@@ -0,0 +1,77 @@
+# -*- coding: UTF-8 -*-
+
+from .cpu import CPU, ROM_BASE
+from .jit import TranslatingCPU
+from .microcode import Microcode, MicrocodeCPU
+from .scheduler import Scheduler
+from .snapshot import Snapshot
+from .devices import (Display, Keyboard, Screen, Storage, StorageController,
+                      InterruptController, Timer,
+                      MDA_PORT, KBD_PORT, STGC_DATA_PORT, STGC_CMD_PORT,
+                      PIC_PORT, TIMER_DATA_PORT, TIMER_CMD_PORT)
+
+
+class Computer:
+    """
+    LSC-8 computer: CPU, 56 kB RAM, 8 kB BIOS ROM and the controllers
+    MDA (port 4), KBD (port 5) and USC (ports 6, 7). The interrupt
+    controller (port 8) and the timer (ports 9, 10) exist in the
+    simulator only.
+    """
+
+    def __init__(self, bios: bytes = None, keyboard_input='', echo=None,
+                 microcode: Microcode = None, jit=False,
+                 screen: Screen = None):
+        if microcode is not None:
+            self.cpu = MicrocodeCPU(microcode)
+        elif jit:
+            self.cpu = TranslatingCPU()
+        else:
+            self.cpu = CPU()
+        self.display = Display(echo, screen)
+        self.keyboard = Keyboard(keyboard_input)
+        self.storage = StorageController()
+        self.pic = InterruptController()
+        self.scheduler = Scheduler(self.cpu, self.pic)
+        self.timer = Timer(self.scheduler, self.pic)
+
+        self.cpu.attach(MDA_PORT, self.display)
+        self.cpu.attach(KBD_PORT, self.keyboard)
+        self.cpu.attach(STGC_DATA_PORT, self.storage.data_port)
+        self.cpu.attach(STGC_CMD_PORT, self.storage)
+        self.cpu.attach(PIC_PORT, self.pic)
+        self.cpu.attach(TIMER_DATA_PORT, self.timer.data_port)
+        self.cpu.attach(TIMER_CMD_PORT, self.timer)
+
+        if bios is not None:
+            self.load_bios(bios)
+
+    def load_bios(self, bios: bytes):
+        if len(bios) > 0x10000 - ROM_BASE:
+            raise ValueError('BIOS image is larger than 8 kB')
+        self.cpu.load(bios, ROM_BASE)
+
+    def insert(self, number, data: bytes, volatile=True, removable=False):
+        self.storage.insert(number, Storage(data, volatile, removable))
+
+    def reset(self):
+        self.cpu.reset()
+        self.scheduler.reset()
+        for device in (self.display, self.keyboard, self.storage,
+                       self.pic, self.timer):
+            device.reset()
+
+    def run(self, max_instructions=None, execute=None):
+        """
+        Execute instructions by `execute(count)` (cpu.run by default)
+        between the device events until `hlt` or the limit is reached.
+        Return the number of executed instructions.
+        """
+        return self.scheduler.run(execute or self.cpu.run, max_instructions)
+
+    def snapshot(self, previous: Snapshot = None):
+        """State of the computer, the pages equal to `previous` are shared"""
+        return Snapshot(self, previous)
+
+    def restore(self, snapshot: Snapshot):
+        snapshot.restore(self)
@@ -0,0 +1,388 @@
+# -*- coding: UTF-8 -*-
+
+from . import isa
+from .isa import REG_MEM, PORTS_NUMBER
+
+MEMORY_SIZE = 0x10000
+ROM_BASE = 0xE000       # BIOS ROM 8 kB, writes are ignored
+RESET_VECTOR = 0xE000
+STACK_DEPTH = 256
+
+REG_A, REG_B, REG_C, REG_D, REG_E, REG_H, REG_L = range(7)
+REG_NAMES = ('a', 'b', 'c', 'd', 'e', 'h', 'l', 'mem')
+
+# even parity of the byte, PF=1
+PARITY = tuple(int(not bin(i).count('1') % 2) for i in range(256))
+
+
+class IllegalInstruction(Exception):
+    def __init__(self, address: int, opcode: int):
+        super().__init__(f'Illegal instruction {opcode:02X}h '
+                         f'at address {address:04X}h')
+        self.address = address
+        self.opcode = opcode
+
+
+class CPU:
+    """
+    Instruction-level model of the LSC-8 processor.
+
+    Registers A-L are stored in `regs`, the pseudo-register `mem` is
+    the memory cell addressed by H:L. Data and address stacks are
+    separated from RAM and have a depth of 256.
+    """
+
+    def __init__(self):
+        self.memory = bytearray(MEMORY_SIZE)
+        self.ports = [None] * PORTS_NUMBER
+        self.regs = [0] * 7
+        self.data_stack = [0] * STACK_DEPTH
+        self.addr_stack = [0] * STACK_DEPTH
+        # routine address -> function(cpu) emulating it, called on
+        # entering the routine by call or int
+        self.traps = {}
+        self.reset()
+
+    def reset(self):
+        self.regs[:] = [0] * 7
+        self.pc = RESET_VECTOR
+        self.ds_ptr = 0
+        self.as_ptr = 0
+        self.cf = self.zf = self.sf = self.pf = self.if_ = 0
+        self.halted = False
+        self.instructions = 0
+
+    def load(self, data, address: int):
+        """Place image into the address space ignoring ROM protection"""
+        self.memory[address:address + len(data)] = data
+
+    def read_block(self, address, size):
+        """Read `size` bytes from the address wrapping around 64 kB"""
+        data = self.memory[address:address + size]
+        if len(data) < size:
+            data += self.read_block(0, size - len(data))
+        return data
+
+    def write_block(self, address, data):
+        """
+        Write data from the address wrapping around 64 kB,
+        the part over the ROM is ignored.
+        """
+        data = memoryview(data).cast('B')
+        while data:
+            end = min(address + len(data), MEMORY_SIZE)
+            ram_end = min(end, ROM_BASE)
+            if address < ram_end:
+                self.memory[address:ram_end] = data[:ram_end - address]
+            data = data[end - address:]
+            address = 0
+
+    def attach(self, port: int, device):
+        self.ports[port] = device
+
+    # --- flags ---
+    @property
+    def flags(self):
+        return (self.cf | (self.zf << 1) | (self.sf << 2) |
+                (self.pf << 3) | (self.if_ << 4))
+
+    @flags.setter
+    def flags(self, value):
+        self.cf = value & 1
+        self.zf = (value >> 1) & 1
+        self.sf = (value >> 2) & 1
+        self.pf = (value >> 3) & 1
+        self.if_ = (value >> 4) & 1
+
+    def _set_zsp(self, value):
+        self.zf = int(not value)
+        self.sf = value >> 7
+        self.pf = PARITY[value]
+
+    # --- memory & registers ---
+    def read_mem(self, address):
+        return self.memory[address]
+
+    def write_mem(self, address, value):
+        if address < ROM_BASE:
+            self.memory[address] = value
+
+    def get_reg(self, code):
+        if code == REG_MEM:
+            return self.memory[(self.regs[REG_H] << 8) | self.regs[REG_L]]
+        return self.regs[code]
+
+    def set_reg(self, code, value):
+        if code == REG_MEM:
+            self.write_mem((self.regs[REG_H] << 8) | self.regs[REG_L], value)
+        else:
+            self.regs[code] = value
+
+    # --- stacks ---
+    def push_data(self, value):
+        self.data_stack[self.ds_ptr] = value
+        self.ds_ptr = (self.ds_ptr + 1) & 0xFF
+
+    def pop_data(self):
+        self.ds_ptr = (self.ds_ptr - 1) & 0xFF
+        return self.data_stack[self.ds_ptr]
+
+    def push_addr(self, value):
+        self.addr_stack[self.as_ptr] = value
+        self.as_ptr = (self.as_ptr + 1) & 0xFF
+
+    def pop_addr(self):
+        self.as_ptr = (self.as_ptr - 1) & 0xFF
+        return self.addr_stack[self.as_ptr]
+
+    # --- I/O ---
+    def port_in(self, port):
+        device = self.ports[port]
+        return device.read() & 0xFF if device is not None else 0
+
+    def port_out(self, port, value):
+        device = self.ports[port]
+        if device is not None:
+            device.write(value)
+
+    # --- ALU ---
+    def _alu(self, select, operand):
+        acc = self.regs[REG_A]
+        if select <= 0b011:     # add, adc, sub, sbb
+            carry = self.cf if select & 1 else 0
+            if select & 0b010:
+                result = acc - operand - carry
+                self.cf = int(result < 0)
+            else:
+                result = acc + operand + carry
+                self.cf = int(result > 0xFF)
+            result &= 0xFF
+        elif select == 0b100:   # and
+            result = acc & operand
+            self.cf = 0
+        elif select == 0b101:   # xor
+            result = acc ^ operand
+            self.cf = 0
+        elif select == 0b110:   # or
+            result = acc | operand
+            self.cf = 0
+        else:                   # cmp
+            result = acc - operand
+            self.cf = int(result < 0)
+            self._set_zsp(result & 0xFF)
+            return
+        self._set_zsp(result)
+        self.regs[REG_A] = result
+
+    def _rotate(self, mode):
+        acc = self.regs[REG_A]
+        if mode == 0b00:    # rlc
+            self.cf = acc >> 7
+            acc = ((acc << 1) | self.cf) & 0xFF
+        elif mode == 0b01:  # rrc
+            self.cf = acc & 1
+            acc = (acc >> 1) | (self.cf << 7)
+        elif mode == 0b10:  # ral
+            acc, self.cf = ((acc << 1) | self.cf) & 0xFF, acc >> 7
+        else:               # rar
+            acc, self.cf = (acc >> 1) | (self.cf << 7), acc & 1
+        self.regs[REG_A] = acc
+
+    def _fetch_word(self):
+        mem = self.memory
+        pc = self.pc
+        self.pc = (pc + 2) & 0xFFFF
+        return mem[pc] | (mem[(pc + 1) & 0xFFFF] << 8)
+
+    def _fetch_byte(self):
+        value = self.memory[self.pc]
+        self.pc = (self.pc + 1) & 0xFFFF
+        return value
+
+    def interrupt(self, vector):
+        self.push_data(self.flags)
+        self.push_addr(self.pc)
+        self.if_ = 0
+        address = (vector << 1) & 0xFFFF
+        self.pc = self.memory[address] | (self.memory[address + 1] << 8)
+        if self.pc in self.traps:
+            self.traps[self.pc](self)
+
+    def wake(self):
+        """Leave the halted state to the instruction after hlt"""
+        self.halted = False
+        self.pc = (self.pc + 1) & 0xFFFF
+
+    # --- instruction handlers, see DISPATCH ---
+    def _op_mov(self, dst, src):
+        self.set_reg(dst, self.get_reg(src))
+
+    def _op_mov_rr(self, dst, src):
+        self.regs[dst] = self.regs[src]
+
+    def _op_hlt(self, x, y):
+        self.pc = (self.pc - 1) & 0xFFFF
+        self.halted = True
+
+    def _op_alu(self, select, src):
+        self._alu(select, self.get_reg(src))
+
+    def _op_in(self, port, y):
+        self.regs[REG_A] = self.port_in(port)
+
+    def _op_out(self, port, y):
+        self.port_out(port, self.regs[REG_A])
+
+    def _op_jmp_cond(self, flag, value):
+        target = self._fetch_word()
+        if getattr(self, flag) == value:
+            self.pc = target
+
+    def _op_call_cond(self, flag, value):
+        target = self._fetch_word()
+        if getattr(self, flag) == value:
+            self.push_addr(self.pc)
+            self.pc = target
+            if target in self.traps:
+                self.traps[target](self)
+
+    def _op_ret_cond(self, flag, value):
+        if getattr(self, flag) == value:
+            self.pc = self.pop_addr()
+
+    def _op_push(self, src, y):
+        self.push_data(self.get_reg(src))
+
+    def _op_pop(self, dst, y):
+        self.set_reg(dst, self.pop_data())
+
+    def _op_inc(self, dst, y):
+        value = (self.regs[dst] + 1) & 0xFF
+        self.regs[dst] = value
+        self._set_zsp(value)
+
+    def _op_dec(self, dst, y):
+        value = (self.regs[dst] - 1) & 0xFF
+        self.regs[dst] = value
+        self._set_zsp(value)
+
+    def _op_jmp(self, x, y):
+        self.pc = self._fetch_word()
+
+    def _op_call(self, x, y):
+        target = self._fetch_word()
+        self.push_addr(self.pc)
+        self.pc = target
+        if target in self.traps:
+            self.traps[target](self)
+
+    def _op_rotate(self, mode, y):
+        self._rotate(mode)
+
+    def _op_ret(self, x, y):
+        self.pc = self.pop_addr()
+
+    def _op_int(self, x, y):
+        self.interrupt(self._fetch_byte())
+
+    def _op_push_imm(self, x, y):
+        self.push_data(self._fetch_byte())
+
+    def _op_iret(self, x, y):
+        self.pc = self.pop_addr()
+        self.flags = self.pop_data()
+
+    def _op_alu_imm(self, select, y):
+        self._alu(select, self._fetch_byte())
+
+    def _op_set_flag(self, flag, value):
+        setattr(self, flag, value)
+
+    def _op_mov_imm(self, dst, y):
+        self.set_reg(dst, self._fetch_byte())
+
+    def _op_illegal(self, opc, y):
+        self.pc = (self.pc - 1) & 0xFFFF
+        raise IllegalInstruction(self.pc, opc)
+
+    # --- execution ---
+    def step(self):
+        pc = self.pc
+        handler, x, y = DISPATCH[self.memory[pc]]
+        self.pc = (pc + 1) & 0xFFFF
+        self.instructions += 1
+        handler(self, x, y)
+
+    def run(self, max_instructions=None):
+        """
+        Execute instructions until `hlt` or the limit is reached.
+        Return the number of executed instructions.
+        """
+        memory = self.memory
+        dispatch = DISPATCH
+        limit = -1 if max_instructions is None else max_instructions
+        executed = 0
+        try:
+            while not self.halted and executed != limit:
+                pc = self.pc
+                handler, x, y = dispatch[memory[pc]]
+                self.pc = (pc + 1) & 0xFFFF
+                executed += 1
+                handler(self, x, y)
+        finally:
+            self.instructions += executed
+        return executed
+
+
+def _build_dispatch():
+    """
+    Decode every opcode byte once: handler and its two decoded fields
+    (register, ALU select, port number or tested flag and its value).
+    """
+    flags = ('cf', 'zf', 'sf', 'pf')
+    conditions = [(flags[cond & 0b11], cond >> 2) for cond in range(8)]
+    table = [(CPU._op_illegal, opc, 0) for opc in range(256)]
+
+    for ddd in range(8):
+        for sss in range(8):
+            if REG_MEM in (ddd, sss):
+                table[isa.MOV_RR | (ddd << 3) | sss] = (CPU._op_mov, ddd, sss)
+            else:
+                table[isa.MOV_RR | (ddd << 3) | sss] = (CPU._op_mov_rr,
+                                                        ddd, sss)
+            table[isa.ALU_R | (ddd << 3) | sss] = (CPU._op_alu, ddd, sss)
+
+        flag, value = conditions[ddd]
+        table[isa.JMP_COND | (ddd << 3)] = (CPU._op_jmp_cond, flag, value)
+        table[isa.CALL_COND | (ddd << 3)] = (CPU._op_call_cond, flag, value)
+        table[isa.RET_COND | (ddd << 3)] = (CPU._op_ret_cond, flag, value)
+        table[isa.PUSH_R | (ddd << 3)] = (CPU._op_push, ddd, 0)
+        table[isa.POP_R | (ddd << 3)] = (CPU._op_pop, ddd, 0)
+        table[isa.ALU_IMM | (ddd << 3)] = (CPU._op_alu_imm, ddd, 0)
+        table[isa.MOV_IMM | (ddd << 3)] = (CPU._op_mov_imm, ddd, 0)
+        if ddd != REG_MEM:
+            table[isa.INC | (ddd << 3)] = (CPU._op_inc, ddd, 0)
+            table[isa.DEC | (ddd << 3)] = (CPU._op_dec, ddd, 0)
+
+    for port in range(PORTS_NUMBER):
+        table[isa.IN | (port << 1)] = (CPU._op_in, port, 0)
+        table[isa.OUT | (port << 1)] = (CPU._op_out, port, 0)
+
+    for mode in set(isa.ROTATIONS.values()):
+        table[isa.ROTATE | (mode << 3)] = (CPU._op_rotate, mode, 0)
+
+    for code in isa.FLAG_OPERATIONS.values():
+        flag = 'if_' if code & 0b10 else 'cf'
+        table[isa.FLAG | (code << 4)] = (CPU._op_set_flag, flag, code & 1)
+
+    table[isa.HLT] = (CPU._op_hlt, 0, 0)
+    table[isa.JMP] = (CPU._op_jmp, 0, 0)
+    table[isa.CALL] = (CPU._op_call, 0, 0)
+    table[isa.RET] = (CPU._op_ret, 0, 0)
+    table[isa.INT] = (CPU._op_int, 0, 0)
+    table[isa.PUSH_IMM] = (CPU._op_push_imm, 0, 0)
+    table[isa.IRET] = (CPU._op_iret, 0, 0)
+    return table
+
+
+DISPATCH = _build_dispatch()
@@ -0,0 +1,228 @@
+# -*- coding: UTF-8 -*-
+"""
+Debug information of the assembled images.
+
+The file written alongside the ROM (the same name with DEBUG_EXTENSION)
+keeps the label addresses, the address ranges of the source lines
+(file and line number) and the procedure extents, so the tools name
+the addresses without assembling the sources again. Every table is
+sorted by address and stored by columns in the compact JSON:
+
+    {"version": 1, "org": ORG, "size": SIZE, "files": [PATH, ...],
+     "symbols": {"address": [...], "name": [...]},
+     "lines": {"address": [...], "size": [...], "file": [...],
+               "line": [...]},
+     "procedures": {"start": [...], "end": [...], "name": [...]}}
+
+The lookups are binary searches over the address columns.
+"""
+
+import bisect
+import json
+import os
+
+from . import linker
+
+DEBUG_VERSION = 1
+DEBUG_EXTENSION = '.dbg'
+
+
+class WrongDebugFile(Exception):
+    def __init__(self, source, message='Not a debug file'):
+        super().__init__(f'{message}: {source}')
+
+
+def debug_path(image_path):
+    """Debug file of the image file"""
+    return os.path.splitext(image_path)[0] + DEBUG_EXTENSION
+
+
+def _segments(extents):
+    """
+    Non-overlapping (start, end, name) of the sorted procedure extents,
+    every address is in the segment of its innermost procedure
+    """
+    segments = []
+    stack = []      # (end, name) of the open procedures
+    cursor = None
+
+    def close(until):
+        nonlocal cursor
+        if stack and cursor < until:
+            segments.append((cursor, until, stack[-1][1]))
+        cursor = max(cursor, until)
+
+    for start, end, name in sorted(extents, key=lambda e: (e[0], -e[1])):
+        while stack and stack[-1][0] <= start:
+            close(stack[-1][0])
+            stack.pop()
+        if stack:
+            close(start)
+        cursor = start
+        stack.append((end, name))
+    while stack:
+        close(stack[-1][0])
+        stack.pop()
+    return segments
+
+
+class DebugInfo:
+    """
+    `symbols` - (address, name) of the labels, `lines` - (address, size,
+    path, line) of the code of the source lines, `procedures` - name:
+    (start, end) addresses.
+    """
+
+    def __init__(self, org=0, size=0, symbols=(), lines=(), procedures=None):
+        self.org = org
+        self.size = size
+        symbols = sorted(symbols)
+        self._symbol_addresses = [address for address, _ in symbols]
+        self._symbol_names = [name for _, name in symbols]
+
+        lines = sorted(lines, key=lambda line: line[0])
+        self.files = list(dict.fromkeys(path for _, _, path, _ in lines))
+        index = {path: i for i, path in enumerate(self.files)}
+        self._line_addresses = [line[0] for line in lines]
+        self._line_sizes = [line[1] for line in lines]
+        self._line_files = [index[line[2]] for line in lines]
+        self._line_numbers = [line[3] for line in lines]
+
+        extents = sorted((start, end, name)
+                         for name, (start, end) in (procedures or {}).items()
+                         if start is not None and end is not None)
+        self._procedure_starts = [start for start, _, _ in extents]
+        self._procedure_ends = [end for _, end, _ in extents]
+        self._procedure_names = [name for _, _, name in extents]
+        segments = _segments(extents)
+        self._segment_starts = [start for start, _, _ in segments]
+        self._segment_ends = [end for _, end, _ in segments]
+        self._segment_names = [name for _, _, name in segments]
+
+    @classmethod
+    def from_lexer(cls, lex):
+        """Debug information of the assembled Lexer"""
+        lines = [(address, size) + lex.source_line(l_num)
+                 for l_num, address, size in lex.code_lines()]
+        return cls(lex.org, len(lex.listing),
+                   [(address, name) for name, address in lex.labels().items()],
+                   lines, lex.procedures)
+
+    @classmethod
+    def from_objects(cls, objects, libraries=()):
+        """Debug information of the image linked from the objects"""
+        objects, bases = linker.place(objects, libraries)
+        start = min(bases)
+        end = max(base + len(obj['code']) // 2
+                  for obj, base in zip(objects, bases))
+        symbols, lines, procedures = [], [], {}
+        for obj, base in zip(objects, bases):
+            symbols += [(base + offset, name)
+                        for name, offset in obj['labels'].items()]
+            lines += [(base + offset, size, obj['files'][file], line)
+                      for offset, size, file, line in obj['lines']]
+            for name, bounds in obj['procedures'].items():
+                procedures[name] = [None if offset is None else base + offset
+                                    for offset in bounds]
+        return cls(start, end - start, symbols, lines, procedures)
+
+    @property
+    def labels(self):
+        """Address of every label by name (the first of the same names)"""
+        labels = {}
+        for address, name in zip(self._symbol_addresses, self._symbol_names):
+            labels.setdefault(name, address)
+        return labels
+
+    @property
+    def procedures(self):
+        """(start, end) of every procedure by name"""
+        return {name: (start, end) for start, end, name in zip(
+            self._procedure_starts, self._procedure_ends,
+            self._procedure_names)}
+
+    def symbol(self, address):
+        """(name, offset) of the last label up to the address or None"""
+        index = bisect.bisect_right(self._symbol_addresses, address) - 1
+        if index < 0:
+            return None
+        return (self._symbol_names[index],
+                address - self._symbol_addresses[index])
+
+    def line(self, address):
+        """(path, line number) of the source line of the code or None"""
+        index = bisect.bisect_right(self._line_addresses, address) - 1
+        if (index < 0 or address >= self._line_addresses[index] +
+                self._line_sizes[index]):
+            return None
+        return (self.files[self._line_files[index]],
+                self._line_numbers[index])
+
+    def procedure(self, address):
+        """Name of the innermost procedure of the address or None"""
+        index = bisect.bisect_right(self._segment_starts, address) - 1
+        if index < 0 or address >= self._segment_ends[index]:
+            return None
+        return self._segment_names[index]
+
+    def describe(self, address):
+        """Address as text: "name+offset (path:line)" """
+        symbol = self.symbol(address)
+        if symbol is None:
+            text = f'{address:04X}h'
+        else:
+            text = symbol[0] + (f'+{symbol[1]:X}h' if symbol[1] else '')
+        line = self.line(address)
+        if line is not None:
+            text += f' ({line[0] or "<source>"}:{line[1]})'
+        return text
+
+    def to_dict(self):
+        return {
+            'version': DEBUG_VERSION,
+            'org': self.org,
+            'size': self.size,
+            'files': self.files,
+            'symbols': {'address': self._symbol_addresses,
+                        'name': self._symbol_names},
+            'lines': {'address': self._line_addresses,
+                      'size': self._line_sizes,
+                      'file': self._line_files,
+                      'line': self._line_numbers},
+            'procedures': {'start': self._procedure_starts,
+                           'end': self._procedure_ends,
+                           'name': self._procedure_names},
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        files = data['files']
+        symbols = zip(data['symbols']['address'], data['symbols']['name'])
+        lines = data['lines']
+        procedures = data['procedures']
+        return cls(data['org'], data['size'], symbols,
+                   zip(lines['address'], lines['size'],
+                       [files[file] for file in lines['file']],
+                       lines['line']),
+                   {name: (start, end) for start, end, name in zip(
+                       procedures['start'], procedures['end'],
+                       procedures['name'])})
+
+    def save(self, path):
+        with open(path, 'w') as file:
+            json.dump(self.to_dict(), file, separators=(',', ':'))
+
+    @classmethod
+    def load(cls, path):
+        try:
+            with open(path, 'r') as file:
+                data = json.load(file)
+        except ValueError:
+            raise WrongDebugFile(path)
+        if not isinstance(data, dict) or data.get('version') != DEBUG_VERSION:
+            raise WrongDebugFile(path, 'Unknown debug file version')
+        return cls.from_dict(data)
+
+    def __repr__(self):
+        return (f'<DebugInfo: {len(self._symbol_names)} symbols,'
+                f' {len(self._line_addresses)} lines at {self.org:04X}h>')
@@ -0,0 +1,565 @@
+# -*- coding: UTF-8 -*-
+
+import copy
+import mmap
+import os
+from collections import deque
+
+MDA_PORT = 4
+KBD_PORT = 5
+STGC_DATA_PORT = 6
+STGC_CMD_PORT = 7
+PIC_PORT = 8
+TIMER_DATA_PORT = 9
+TIMER_CMD_PORT = 10
+
+SECTOR_SIZE = 256
+MAX_DRIVES = 4
+
+IRQ_LINES = 8
+IRQ_VECTOR = 0x08   # vector of the line 0
+TIMER_IRQ = 0
+
+
+class Device:
+    def read(self):
+        return 0
+
+    def write(self, value):
+        pass
+
+    def reset(self):
+        pass
+
+
+class Display(Device):
+    """
+    MDA - Monochrome Display Adapter (port 4).
+    Write-only, collects the printed text. Reading is always 0.
+    The chars are echoed to the `echo` stream and put on the `screen`.
+    """
+    CLEAR = 0x0C
+
+    def __init__(self, echo=None, screen=None):
+        self.text = []
+        self.echo = echo
+        self.screen = screen
+
+    def write(self, value):
+        if value == Display.CLEAR:
+            self.text.clear()
+        else:
+            self.text.append(chr(value))
+        if self.echo is not None:
+            self.echo.write(chr(value))
+        if self.screen is not None:
+            self.screen.put(value)
+
+    def reset(self):
+        self.text.clear()
+        if self.screen is not None:
+            self.screen.clear()
+
+    def restore(self, text):
+        """Set the text printed since the last clear, the screen is redrawn"""
+        self.text[:] = text
+        if self.screen is not None:
+            self.screen.clear()
+            for char in text:
+                self.screen.put(ord(char))
+
+    def __str__(self):
+        return ''.join(self.text)
+
+
+class Screen:
+    """
+    Text buffer of the MDA terminal, 80x25 chars. Controls as in the
+    LogiSim TTY: 0Ah - new line, 0Dh - line start, 08h - backspace,
+    0Ch - clear. The rows changed since the last `take_dirty()` are
+    tracked for the renderer.
+    """
+    COLUMNS = 80
+    ROWS = 25
+    NEW_LINE = 0x0A
+    CARRIAGE_RETURN = 0x0D
+    BACKSPACE = 0x08
+
+    def __init__(self, columns=COLUMNS, rows=ROWS):
+        self.columns = columns
+        self.height = rows
+        self.clear()
+
+    def clear(self):
+        self.rows = [bytearray(b' ' * self.columns)
+                     for _ in range(self.height)]
+        self.row = self.column = 0
+        self.dirty = set(range(self.height))
+
+    def put(self, value):
+        if value == Screen.NEW_LINE:
+            self._new_line()
+        elif value == Display.CLEAR:
+            self.clear()
+        elif value == Screen.CARRIAGE_RETURN:
+            self.column = 0
+        elif value == Screen.BACKSPACE:
+            if self.column:
+                self.column -= 1
+                self.rows[self.row][self.column] = 0x20
+                self.dirty.add(self.row)
+        else:
+            if self.column == self.columns:
+                self._new_line()
+            self.rows[self.row][self.column] = value
+            self.column += 1
+            self.dirty.add(self.row)
+
+    def write(self, text):
+        for char in text:
+            self.put(ord(char))
+
+    def _new_line(self):
+        self.column = 0
+        if self.row + 1 < self.height:
+            self.row += 1
+        else:   # scroll up
+            del self.rows[0]
+            self.rows.append(bytearray(b' ' * self.columns))
+            self.dirty.update(range(self.height))
+
+    def take_dirty(self):
+        """Numbers of the rows changed since the last call"""
+        rows = sorted(self.dirty)
+        self.dirty.clear()
+        return rows
+
+    def line(self, row):
+        return self.rows[row].decode('latin-1')
+
+    def __str__(self):
+        return '\n'.join(self.line(row) for row in range(self.height))
+
+
+class Keyboard(Device):
+    """
+    KBD - Keyboard Controller (port 5).
+    Read: next char from the buffer (0 if empty)
+    Write 0Ch: clear buffer
+    Write 11h: next read without removing the char
+
+    The scripted input is typed into the buffer by one char each time
+    the program finds the buffer empty, so clearing the buffer does not
+    lose it. The reset types the script again from the beginning.
+    """
+    CLEAR = 0x0C
+    PEEK = 0x11
+
+    def __init__(self, text=''):
+        self.buffer = deque()
+        self.script = deque()
+        self.typed = bytearray()    # chars of the script typed so far
+        self._peek = False
+        self.feed(text)
+
+    def feed(self, text):
+        if isinstance(text, str):
+            text = text.encode('ascii')
+        self.script.extend(text)
+
+    def press(self, char):
+        self.buffer.append(char)
+
+    def read(self):
+        if not self.buffer and self.script:
+            char = self.script.popleft()
+            self.typed.append(char)
+            self.buffer.append(char)
+        if not self.buffer:
+            value = 0
+        elif self._peek:
+            value = self.buffer[0]
+        else:
+            value = self.buffer.popleft()
+        self._peek = False
+        return value
+
+    def write(self, value):
+        if value == Keyboard.CLEAR:
+            self.buffer.clear()
+        elif value == Keyboard.PEEK:
+            self._peek = True
+
+    def reset(self):
+        self.buffer.clear()
+        self.script.extendleft(reversed(self.typed))
+        self.typed.clear()
+        self._peek = False
+
+
+class Storage:
+    """
+    Storage device with 256 bytes per sector.
+        Storage parameter:
+            0-2 bits: Size (0 - no storage; 1 - 128 KB; 512K; 1M; 2M; 4M; 8M;
+                      7 - 16 MB)
+            3 bit: 0 - read only; 1 - volatile
+            4 bit: 0 - fixed; 1 - removable
+            6 bit: 1 - storage is available
+
+    The image is a read-only base (bytes or mmap of the image file)
+    shared between the copies of the storage. Written sectors go to the
+    sparse copy-on-write overlay, so the base is never modified.
+    """
+    SIZES = (0, 128 << 10, 512 << 10, 1 << 20, 2 << 20,
+             4 << 20, 8 << 20, 16 << 20)
+    REMOVABLE_MAX_SIZE = 128 << 10
+
+    VOLATILE = 0b0000_1000
+    REMOVABLE = 0b0001_0000
+    AVAILABLE = 0b0100_0000
+
+    def __init__(self, data=b'', volatile=True, removable=False):
+        size_code = 1
+        while Storage.SIZES[size_code] < len(data):
+            size_code += 1
+            if size_code == len(Storage.SIZES):
+                raise ValueError('Storage image is larger than 16 MB')
+        if removable and Storage.SIZES[size_code] > self.REMOVABLE_MAX_SIZE:
+            raise ValueError('Maximum size of removable storage is 128 KB')
+
+        self.size_code = size_code
+        self.size = Storage.SIZES[size_code]
+        self.volatile = volatile
+        self.removable = removable
+        self._base = memoryview(data).cast('B')
+        self._overlay = {}
+
+    @classmethod
+    def open(cls, path, volatile=True, removable=False):
+        """Storage backed by the mmap of the binary image file"""
+        with open(path, 'rb') as file:
+            if not os.fstat(file.fileno()).st_size:
+                return cls(b'', volatile, removable)
+            data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls(data, volatile, removable)
+
+    def fork(self):
+        """Copy sharing the base image, the written sectors are copied"""
+        storage = copy.copy(self)
+        storage._overlay = {number: bytearray(sector)
+                            for number, sector in self._overlay.items()}
+        return storage
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['_base'] = bytes(self._base)     # mmap is not picklable
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._base = memoryview(self._base).cast('B')
+
+    @property
+    def param(self):
+        param = self.size_code | Storage.AVAILABLE
+        if self.volatile:
+            param |= Storage.VOLATILE
+        if self.removable:
+            param |= Storage.REMOVABLE
+        return param
+
+    @property
+    def dirty(self):
+        """Numbers of the written sectors"""
+        return sorted(self._overlay)
+
+    def sector(self, number):
+        """Read-only view of the sector"""
+        sector = self._overlay.get(number)
+        if sector is not None:
+            return memoryview(sector)
+        offset = number * SECTOR_SIZE
+        view = self._base[offset:offset + SECTOR_SIZE]
+        if len(view) < SECTOR_SIZE:     # image is shorter than storage
+            return memoryview(bytes(view) + bytes(SECTOR_SIZE - len(view)))
+        return view
+
+    def _writable(self, number):
+        sector = self._overlay.get(number)
+        if sector is None:
+            sector = self._overlay[number] = bytearray(self.sector(number))
+        return sector
+
+    def read(self, offset):
+        sector = self._overlay.get(offset >> 8)
+        if sector is not None:
+            return sector[offset & 0xFF]
+        if offset < len(self._base):
+            return self._base[offset]
+        return 0
+
+    def write(self, offset, value):
+        if self.volatile:
+            self._writable(offset >> 8)[offset & 0xFF] = value
+
+    def read_range(self, offset, size):
+        """Data from the byte offset as bytes"""
+        chunks = []
+        while size > 0:
+            start = offset & 0xFF
+            chunk = self.sector(offset >> 8)[start:start + size]
+            chunks.append(chunk)
+            offset += len(chunk)
+            size -= len(chunk)
+        return b''.join(chunks)
+
+    def write_range(self, offset, data):
+        """Write data from the byte offset, ignored if read only"""
+        if not self.volatile:
+            return
+        data = memoryview(data).cast('B')
+        while data:
+            start = offset & 0xFF
+            chunk = data[:SECTOR_SIZE - start]
+            self._writable(offset >> 8)[start:start + len(chunk)] = chunk
+            offset += len(chunk)
+            data = data[len(chunk):]
+
+    def read_sectors(self, first, count):
+        """Data of `count` sectors as bytes"""
+        return self.read_range(first * SECTOR_SIZE, count * SECTOR_SIZE)
+
+    def write_sectors(self, first, data):
+        """Write whole sectors, ignored if the storage is read only"""
+        self.write_range(first * SECTOR_SIZE, data)
+
+    def save(self, path):
+        """Write the whole image with the written sectors to the file"""
+        with open(path, 'wb') as file:
+            for number in range(self.size // SECTOR_SIZE):
+                file.write(self.sector(number))
+
+
+class StorageController(Device):
+    """
+    USC - Universal Storage Controller (ports 6 & 7).
+    After the drive select, the first two writes to the data port set
+    the HIGH and LOW sector number, the next accesses transfer data with
+    auto-increment of the byte address.
+    """
+    SET_UP = 0b1000_0000
+    RESET = 0b0000_0100
+
+    SELECT, SECTOR_HIGH, SECTOR_LOW, DATA = range(4)
+
+    def __init__(self):
+        self.drives = [None] * MAX_DRIVES
+        self.data_port = _StorageDataPort(self)
+        self.reset()
+
+    def reset(self):
+        self.drive = None
+        self.state = StorageController.SELECT
+        self.address = 0
+
+    def insert(self, number, storage: Storage):
+        self.drives[number] = storage
+
+    def eject(self, number):
+        self.drives[number] = None
+
+    # port 7
+    def read(self):
+        if self.drive is None or self.drives[self.drive] is None:
+            return 0
+        return StorageController.SET_UP | self.drives[self.drive].param
+
+    def write(self, value):
+        if value & StorageController.RESET:
+            self.reset()
+        else:
+            self.drive = value & 0b11
+            self.state = StorageController.SECTOR_HIGH
+            self.address = 0
+
+    # port 6
+    def read_data(self):
+        storage = self._storage()
+        if storage is None:
+            return 0
+        value = storage.read(self.address)
+        self.address += 1
+        return value
+
+    def write_data(self, value):
+        if self.state == StorageController.SECTOR_HIGH:
+            self.address = value << 16
+            self.state = StorageController.SECTOR_LOW
+        elif self.state == StorageController.SECTOR_LOW:
+            self.address |= value << 8
+            self.state = StorageController.DATA
+        else:
+            storage = self._storage()
+            if storage is not None:
+                storage.write(self.address, value)
+                self.address += 1
+
+    def read_block(self, size):
+        """`size` sequential reads of the data port"""
+        storage = self._storage()
+        if storage is None:
+            return bytes(size)
+        available = min(size, storage.size - self.address)
+        data = storage.read_range(self.address, available)
+        self.address += available
+        return data + bytes(size - available)
+
+    def write_block(self, data):
+        """Sequential writes of the data to the data port"""
+        storage = self._storage()
+        if storage is not None:
+            available = min(len(data), storage.size - self.address)
+            storage.write_range(self.address, data[:available])
+            self.address += available
+
+    def _storage(self):
+        if self.state != StorageController.DATA or self.drive is None:
+            return None
+        storage = self.drives[self.drive]
+        if storage is None or self.address >= storage.size:
+            return None
+        return storage
+
+
+class _StorageDataPort(Device):
+    def __init__(self, controller):
+        self.controller = controller
+
+    def read(self):
+        return self.controller.read_data()
+
+    def write(self, value):
+        self.controller.write_data(value)
+
+
+class InterruptController(Device):
+    """
+    Interrupt controller (port 8) of 8 request lines, the line N calls
+    the vector 8h + N, the line 0 has the highest priority.
+    Read: pending requests
+    Write: mask, 1 disables the line
+    A request is pending until it is delivered to the CPU with the
+    interrupts enabled. The halted CPU continues after the hlt.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.pending = 0
+        self.mask = 0
+
+    def read(self):
+        return self.pending
+
+    def write(self, value):
+        self.mask = value
+
+    def request(self, line):
+        self.pending |= 1 << line
+
+    def masked(self, line):
+        return bool(self.mask >> line & 1)
+
+    def waiting(self, cpu):
+        """Enabled request waits for the interrupts of the CPU"""
+        return bool(self.pending & ~self.mask) and not cpu.if_
+
+    def deliver(self, cpu):
+        requests = self.pending & ~self.mask
+        if not requests or not cpu.if_:
+            return
+        line = (requests & -requests).bit_length() - 1
+        self.pending &= ~(1 << line)
+        if cpu.halted:
+            cpu.wake()
+        cpu.interrupt(IRQ_VECTOR + line)
+
+
+class Timer(Device):
+    """
+    Programmable interval timer (ports 9, 10), requests the line 0 after
+    (period * prescaler) instructions.
+    Port 10 write: control, resets the byte order of port 9
+        0-1 bits: prescaler 1, 16, 256, 4096 instructions per tick
+        6 bit: 1 - periodic, 0 - one-shot
+        7 bit: 1 - start counting, 0 - stop
+    Port 10 read: control, 5 bit - the period has expired (cleared on read)
+    Port 9 write: period in ticks, LOW then HIGH byte (0 - 65536)
+    The counting starts at the next quantum of the scheduler.
+    """
+    PRESCALERS = (1, 16, 256, 4096)
+    PERIODIC = 0b0100_0000
+    ENABLE = 0b1000_0000
+    EXPIRED = 0b0010_0000
+
+    def __init__(self, scheduler, controller, line=TIMER_IRQ):
+        self.scheduler = scheduler
+        self.controller = controller
+        self.line = line
+        self.data_port = _TimerDataPort(self)
+        self.reset()
+
+    def reset(self):
+        self.control = 0
+        self.period = 0
+        self.high = False   # next write to port 9 is the HIGH byte
+        self.expired = False
+        self.scheduler.cancel(self)
+
+    @property
+    def interval(self):
+        """Instructions between the requests"""
+        return ((self.period or 0x10000) *
+                Timer.PRESCALERS[self.control & 0b11])
+
+    def read(self):
+        value = self.control | (Timer.EXPIRED if self.expired else 0)
+        self.expired = False
+        return value
+
+    def write(self, value):
+        self.control = value & ~Timer.EXPIRED
+        self.high = False
+        self.restart()
+
+    def write_data(self, value):
+        if self.high:
+            self.period = (self.period & 0xFF) | (value << 8)
+        else:
+            self.period = (self.period & 0xFF00) | value
+        self.high = not self.high
+
+    def restart(self):
+        if self.control & Timer.ENABLE:
+            self.scheduler.schedule(self, self.scheduler.boundary() +
+                                    self.interval)
+        else:
+            self.scheduler.cancel(self)
+
+    def event(self, time):
+        self.expired = True
+        self.controller.request(self.line)
+        if self.control & Timer.PERIODIC:
+            self.scheduler.schedule(self, time + self.interval)
+        else:
+            self.control &= ~Timer.ENABLE
+
+
+class _TimerDataPort(Device):
+    def __init__(self, timer):
+        self.timer = timer
+
+    def write(self, value):
+        self.timer.write_data(value)
@@ -0,0 +1,318 @@
+# -*- coding: UTF-8 -*-
+"""
+Disassembler of the LSC-8 images.
+
+The opcode table inverts the encodings of Instruction.generate() with
+the tables of the isa module. The code is separated from the data by
+the recursive descent from the entry points (the reset vector or the
+boot location, the handlers of the interrupt vector table): the branch
+targets are followed, the jumps and returns end the flow. The rest is
+written as `db`. The output assembles to the same bytes.
+"""
+
+from . import isa
+from .cpu import ROM_BASE
+
+BOOT_ADDRESS = 0x0C00
+BOOT_SIGNATURE = 0xAB
+VECTORS = 16            # words of the interrupt vector table
+DATA_LINE = 8           # bytes of a `db` line
+DUP_MIN = 16            # shortest run of the same byte written by `dup`
+STRING_MIN = 4          # shortest run of the chars written as a string
+
+# operands following the opcode
+NONE, BYTE, PORT, ADDRESS = range(4)
+OPERAND_SIZE = {NONE: 0, BYTE: 1, PORT: 0, ADDRESS: 2}
+
+# flow after the instruction
+NEXT, BRANCH, JUMP, STOP = range(4)
+
+
+def _names(mapping):
+    """Code: the first name of the code"""
+    names = {}
+    for name, code in mapping.items():
+        names.setdefault(code, name)
+    return names
+
+
+def _build_opcodes():
+    """
+    Decode every opcode byte: (mnemonic, fixed operands, operand kind,
+    flow), None for the illegal opcodes.
+    """
+    registers = _names(isa.REGISTERS)
+    table = [None] * 256
+
+    for ddd in range(8):
+        for sss in range(8):
+            table[isa.MOV_RR | (ddd << 3) | sss] = (
+                'mov', f'{registers[ddd]}, {registers[sss]}', NONE, NEXT)
+        for select, name in _names(isa.ALU_OPERATIONS).items():
+            table[isa.ALU_R | (select << 3) | ddd] = (
+                name, f'a, {registers[ddd]}', NONE, NEXT)
+            table[isa.ALU_IMM | (select << 3)] = (name, 'a, ', BYTE, NEXT)
+
+        table[isa.PUSH_R | (ddd << 3)] = ('push', registers[ddd], NONE, NEXT)
+        table[isa.POP_R | (ddd << 3)] = ('pop', registers[ddd], NONE, NEXT)
+        table[isa.MOV_IMM | (ddd << 3)] = ('mov', f'{registers[ddd]}, ',
+                                           BYTE, NEXT)
+        if ddd != isa.REG_MEM:
+            table[isa.INC | (ddd << 3)] = ('inc', registers[ddd], NONE, NEXT)
+            table[isa.DEC | (ddd << 3)] = ('dec', registers[ddd], NONE, NEXT)
+
+    for cond, name in _names(isa.JMP_CONDITIONS).items():
+        table[isa.JMP_COND | (cond << 3)] = (name, '', ADDRESS, BRANCH)
+    for cond, name in _names(isa.CALL_CONDITIONS).items():
+        table[isa.CALL_COND | (cond << 3)] = (name, '', ADDRESS, BRANCH)
+    for cond, name in _names(isa.RET_CONDITIONS).items():
+        table[isa.RET_COND | (cond << 3)] = (name, '', NONE, NEXT)
+
+    for port in range(isa.PORTS_NUMBER):
+        table[isa.IN | (port << 1)] = ('in', '', PORT, NEXT)
+        table[isa.OUT | (port << 1)] = ('out', '', PORT, NEXT)
+
+    for mode, name in _names(isa.ROTATIONS).items():
+        table[isa.ROTATE | (mode << 3)] = (name, '', NONE, NEXT)
+    for code, name in _names(isa.FLAG_OPERATIONS).items():
+        table[isa.FLAG | (code << 4)] = (name, '', NONE, NEXT)
+
+    table[isa.HLT] = ('hlt', '', NONE, STOP)
+    table[isa.JMP] = ('jmp', '', ADDRESS, JUMP)
+    table[isa.CALL] = ('call', '', ADDRESS, BRANCH)
+    table[isa.RET] = ('ret', '', NONE, STOP)
+    table[isa.INT] = ('int', '', BYTE, NEXT)
+    table[isa.PUSH_IMM] = ('push', '', BYTE, NEXT)
+    table[isa.IRET] = ('iret', '', NONE, STOP)
+    return table
+
+
+OPCODES = _build_opcodes()
+
+
+def number(value):
+    """Number in the style of the sources: 5, 0Ah, 0E000h"""
+    if value < 10:
+        return str(value)
+    text = f'{value:X}h'
+    return text if text[0].isdigit() else '0' + text
+
+
+def default_org(data: bytes):
+    """Boot location for a boot sector, otherwise the BIOS ROM"""
+    if len(data) >= 256 and data[255] == BOOT_SIGNATURE:
+        return BOOT_ADDRESS
+    return ROM_BASE
+
+
+class Instruction:
+    def __init__(self, address, opcode, operand=None):
+        self.address = address
+        self.opcode = opcode
+        self.operand = operand
+        self.mnemonic, self.fixed, self.kind, self.flow = OPCODES[opcode]
+        self.size = 1 + OPERAND_SIZE[self.kind]
+
+    @property
+    def target(self):
+        return self.operand if self.kind == ADDRESS else None
+
+    def text(self, names=None):
+        """Source text, the addresses are named by `names`"""
+        if self.kind == NONE:
+            operand = ''
+        elif self.kind == PORT:
+            operand = number((self.opcode >> 1) & 0b1111)
+        elif self.kind == ADDRESS:
+            operand = (names or {}).get(self.operand) or number(self.operand)
+        else:
+            operand = number(self.operand)
+        text = self.fixed + operand
+        return f'{self.mnemonic} {text}' if text else self.mnemonic
+
+
+class Disassembler:
+    """
+    Disassembly of the image placed at `org`, the code is traced from
+    the `entries` and the handlers of the vector table at `vectors`
+    (found in the image if it is True). `labels` - name: address.
+    """
+
+    def __init__(self, data: bytes, org=None, entries=None, vectors=True,
+                 labels=None):
+        self.data = bytes(data)
+        self.org = default_org(self.data) if org is None else org
+        self.end = self.org + len(self.data)
+        self.instructions = {}      # address: Instruction
+        self.labels = {}            # address: name
+        for name, address in (labels or {}).items():
+            if self.org <= address < self.end:
+                self.labels.setdefault(address, name)
+
+        if vectors is True:
+            vectors = self.find_vectors()
+        self.vectors = vectors
+        handlers = []
+        if vectors is not None:
+            self._label(vectors, 'vector_table')
+            for vector in range(VECTORS):
+                handler = self._word(vectors + vector * 2)
+                self._label(handler, f'int_{vector:02x}h')
+                handlers.append(handler)
+        self.trace(list(entries or [self.org]) + handlers)
+
+    def _word(self, address):
+        offset = address - self.org
+        return self.data[offset] | (self.data[offset + 1] << 8)
+
+    def _label(self, address, name=None):
+        if self.org <= address < self.end:
+            self.labels.setdefault(address, name or f'l_{address:04x}')
+
+    def find_vectors(self):
+        """
+        Address of the first VECTORS words pointing into the image,
+        None if there are no such words (the table is only in ROM)
+        """
+        if self.org != ROM_BASE:
+            return None
+        size = VECTORS * 2
+        for offset in range(len(self.data) - size + 1):
+            words = [self.data[i] | (self.data[i + 1] << 8)
+                     for i in range(offset, offset + size, 2)]
+            if all(self.org <= word < self.end for word in words):
+                return self.org + offset
+        return None
+
+    def decode(self, address):
+        """Instruction at the address, None if it is illegal or cut"""
+        offset = address - self.org
+        if not 0 <= offset < len(self.data):
+            return None
+        opcode = self.data[offset]
+        if OPCODES[opcode] is None:
+            return None
+        instruction = Instruction(address, opcode)
+        size = instruction.size
+        if offset + size > len(self.data):
+            return None
+        if size == 2:
+            instruction.operand = self.data[offset + 1]
+        elif size == 3:
+            instruction.operand = self._word(address + 1)
+        return instruction
+
+    def trace(self, entries):
+        """Recursive descent from the entries"""
+        pending = list(entries)
+        covered = set()
+        while pending:
+            address = pending.pop()
+            while address not in self.instructions:
+                instruction = self.decode(address)
+                if instruction is None or any(
+                        address + i in covered
+                        for i in range(instruction.size)):
+                    break   # data or overlapping code
+                self.instructions[address] = instruction
+                covered.update(range(address, address + instruction.size))
+                if instruction.flow in (BRANCH, JUMP):
+                    self._label(instruction.target)
+                    pending.append(instruction.target)
+                if instruction.flow in (JUMP, STOP):
+                    break
+                address += instruction.size
+
+    def lines(self):
+        """Source lines of the image"""
+        lines = [f'org {number(self.org)}']
+        names = dict(self.labels)
+        # the labels in the middle of an instruction can not be placed
+        for instruction in self.instructions.values():
+            for address in range(instruction.address + 1,
+                                 instruction.address + instruction.size):
+                names.pop(address, None)
+
+        table = self.vectors
+        if table is not None and any(
+                address in names or address in self.instructions
+                for address in range(table, table + VECTORS * 2)
+                if address != table or table in self.instructions):
+            table = None    # not a separate table
+
+        data = []
+        address = self.org
+        while address < self.end:
+            instruction = self.instructions.get(address)
+            if (address in names or instruction is not None or
+                    address == table):
+                lines += self._data(data)
+                data = []
+            if address in names:
+                lines.append(f'{names[address]}:')
+            if address == table:
+                words = [self._word(table + vector * 2)
+                         for vector in range(VECTORS)]
+                for i in range(0, VECTORS, 4):
+                    lines.append('    dw ' + ', '.join(
+                        names.get(word) or number(word)
+                        for word in words[i:i + 4]))
+                address += VECTORS * 2
+            elif instruction is None:
+                data.append(self.data[address - self.org])
+                address += 1
+            else:
+                lines.append(f'    {instruction.text(names)}')
+                address += instruction.size
+        lines += self._data(data)
+        return lines
+
+    @staticmethod
+    def _data(data):
+        """`db` lines of the bytes: the strings, `dup` runs and numbers"""
+        lines, items = [], []
+        i = 0
+        while i < len(data):
+            run = i
+            while run < len(data) and data[run] == data[i]:
+                run += 1
+            chars = i
+            while (chars < len(data) and 0x20 <= data[chars] < 0x7F and
+                   data[chars] != ord("'")):
+                chars += 1
+
+            if run - i >= DUP_MIN:
+                lines += _db(items)
+                items = []
+                lines.append(f'    db {run - i} dup {number(data[i])}')
+                i = run
+            elif chars - i >= STRING_MIN:
+                items.append("'" + bytes(data[i:chars]).decode('ascii') + "'")
+                i = chars
+            else:
+                items.append(number(data[i]))
+                i += 1
+            if len(items) == DATA_LINE or items and items[-1][0] == "'":
+                lines += _db(items)
+                items = []
+        return lines + _db(items)
+
+    def source(self):
+        return '\n'.join(self.lines()) + '\n'
+
+
+def _db(items):
+    return [f'    db {", ".join(items)}'] if items else []
+
+
+def verify(source: str, path=None):
+    """
+    Assemble the source, disassemble and assemble the result again.
+    Return (equal, the first image, the disassembly, the second image).
+    """
+    from .assembler import assemble
+
+    image = assemble(source, path)
+    text = Disassembler(bytes(image), image.org).source()
+    again = assemble(text)
+    return bytes(image) == bytes(again), image, text, again
@@ -0,0 +1,118 @@
+# -*- coding: UTF-8 -*-
+"""
+Expressions of the assembler operands, e.g. "(msg >> 8)", "high(msg)".
+
+The text is parsed once: the names are replaced by the Python
+identifiers, the numbers by their values, and the checked syntax tree
+is compiled to the code evaluated with the values of the names.
+Expressions without names are folded to the constant. parse() caches
+the expressions by the text.
+
+Operators: + - * / % & | ^ << >>, high() and low() bytes of the word,
+$ - address of the current instruction.
+"""
+
+import ast
+import functools
+import re
+
+HERE = '$'
+
+LEXEME = re.compile(r'(?<![\w?@$])(?:(\d\w*)|([a-z_][\w?@$]*)|(\$))',
+                    re.IGNORECASE)
+
+FUNCTIONS = {
+    'high': lambda value: (value >> 8) & 0xFF,
+    'low': lambda value: value & 0xFF,
+}
+
+NODES = (ast.Expression, ast.BinOp, ast.UnaryOp, ast.Name, ast.Load,
+         ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod,
+         ast.USub, ast.UAdd, ast.Invert, ast.BitXor, ast.BitAnd, ast.BitOr,
+         ast.LShift, ast.RShift)
+
+NUMBER_BASES = {'h': 16, 'b': 2, 'o': 8, 'q': 8, 'd': 10}
+NUMBER_DIGITS = {16: re.compile(r'\d[\da-f]*'), 2: re.compile(r'[01]+'),
+                 8: re.compile(r'[0-7]+'), 10: re.compile(r'\d+')}
+
+
+class ExpressionError(ValueError):
+    pass
+
+
+def parse_number(text: str):
+    """Value of the number with the base suffix (0FFh) or prefix (0xFF)"""
+    text = text.lower()
+    base = NUMBER_BASES.get(text[-1])
+    # the suffix first: 0B0h is the hex number, not the binary prefix
+    if base is not None and NUMBER_DIGITS[base].fullmatch(text[:-1]):
+        return int(text[:-1], base)
+    try:
+        return int(text, 0) if text[:2] in ('0x', '0b', '0o') else int(text)
+    except ValueError:
+        raise ExpressionError(f'Wrong number "{text}"')
+
+
+class Expression:
+    """Parsed expression and the names it refers to"""
+
+    def __init__(self, text: str):
+        self.text = text
+        names = []
+
+        def replace(match):
+            number, name, here = match.groups()
+            if number is not None:
+                return str(parse_number(number))
+            name = HERE if here else name.lower()
+            if name in FUNCTIONS and text[match.end():].lstrip()[:1] == '(':
+                return name
+            if name not in names:
+                names.append(name)
+            return f'_{names.index(name)}'
+
+        try:
+            tree = ast.parse(LEXEME.sub(replace, text).strip(), mode='eval')
+        except SyntaxError:
+            raise ExpressionError(f'Wrong expression "{text}"')
+        for node in ast.walk(tree):
+            if isinstance(node, ast.BinOp) and isinstance(node.op, ast.Div):
+                node.op = ast.FloorDiv()    # integer division
+            elif not self._is_valid(node):
+                raise ExpressionError(f'Wrong expression "{text}"')
+        self.names = tuple(names)
+        self.relative = HERE in names
+        self._code = compile(tree, '<expression>', 'eval')
+        self.constant = None if names else self._run({})
+
+    @staticmethod
+    def _is_valid(node):
+        if isinstance(node, ast.Call):
+            return (isinstance(node.func, ast.Name) and
+                    node.func.id in FUNCTIONS and
+                    len(node.args) == 1 and not node.keywords)
+        elif isinstance(node, ast.Constant):
+            return type(node.value) is int
+        return isinstance(node, NODES)
+
+    def _run(self, values):
+        try:
+            return eval(self._code, dict(FUNCTIONS, __builtins__={}), values)
+        except (ArithmeticError, ValueError):
+            raise ExpressionError(f'Can\'t evaluate "{self.text}"')
+
+    def evaluate(self, values: dict):
+        """Value with the integer `values` of the names"""
+        if self.constant is not None:
+            return self.constant
+        return self._run({f'_{i}': values[name]
+                          for i, name in enumerate(self.names)})
+
+    def __repr__(self):
+        return f'Expression({self.text!r})'
+
+
+@functools.lru_cache(maxsize=4096)
+def parse(text: str):
+    """Expression of the text, parsed once"""
+    return Expression(text)
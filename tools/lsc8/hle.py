@@ -0,0 +1,124 @@
+# -*- coding: UTF-8 -*-
+"""
+High-level emulation of the BIOS routines.
+
+The trap replaces the byte-at-a-time loop of the routine with a bulk
+copy leaving the registers, flags and stacks as the routine does.
+Routines are found by name in the symbol table of the BIOS source.
+"""
+
+from .cpu import REG_A, REG_B, REG_C, REG_D, REG_E, REG_H, REG_L, PARITY
+from .devices import SECTOR_SIZE
+
+STORAGE_READ = 2
+STORAGE_WRITE = 3
+
+
+def storage_io(computer, symbols):
+    """
+    INT 7h: (A)=2 read / (A)=3 write (C) sectors of the drive (B) from
+    the sector (D)(E) to/from the buffer (H)(L).
+    Other functions are executed as is.
+    """
+    controller = computer.storage
+    # return addresses of `call STRG_SETUP`
+    setup_return = {STORAGE_READ: symbols.get('strg_read_loop'),
+                    STORAGE_WRITE: symbols.get('strg_write_loop')}
+
+    def trap(cpu):
+        regs = cpu.regs
+        function, drive, count = regs[REG_A], regs[REG_B], regs[REG_C]
+        if function not in (STORAGE_READ, STORAGE_WRITE) or drive > 3:
+            return
+        size = (count or 256) * SECTOR_SIZE
+        address = (regs[REG_H] << 8) | regs[REG_L]
+
+        # stack slots left by the drive number test and STRG_SETUP call
+        cpu.data_stack[cpu.ds_ptr] = function
+        if setup_return[function] is not None:
+            cpu.addr_stack[cpu.as_ptr] = setup_return[function]
+
+        # STRG_SETUP
+        controller.write(drive)
+        controller.write_data(regs[REG_D])
+        controller.write_data(regs[REG_E])
+
+        if function == STORAGE_READ:
+            data = controller.read_block(size)
+            cpu.write_block(address, data)
+        else:
+            data = cpu.read_block(address, size)
+            controller.write_block(data)
+
+        address = (address + size) & 0xFFFF
+        regs[REG_A] = data[-1]
+        regs[REG_B] = regs[REG_C] = 0
+        regs[REG_H], regs[REG_L] = address >> 8, address & 0xFF
+        # iret
+        cpu.pc = cpu.pop_addr()
+        cpu.flags = cpu.pop_data()
+
+    return trap
+
+
+def mem_to_mem(computer, symbols):
+    """
+    MEM_TO_MEM: copy (C) bytes from (A)(B) to (D)(E).
+    Return (H)(L) and (D)(E) after the blocks.
+    """
+
+    def trap(cpu):
+        regs = cpu.regs
+        size = regs[REG_C] or 256
+        src = (regs[REG_A] << 8) | regs[REG_B]
+        dst = (regs[REG_D] << 8) | regs[REG_E]
+
+        if 0 < (dst - src) & 0xFFFF < size:     # overlapped forward copy
+            for i in range(size):
+                cpu.write_mem((dst + i) & 0xFFFF,
+                              cpu.memory[(src + i) & 0xFFFF])
+            last = cpu.memory[(src + size - 1) & 0xFFFF]
+        else:
+            data = cpu.read_block(src, size)
+            cpu.write_block(dst, data)
+            last = data[-1]
+
+        src = (src + size) & 0xFFFF
+        dst = (dst + size) & 0xFFFF
+        regs[REG_A] = last
+        regs[REG_C] = 0
+        regs[REG_D], regs[REG_E] = dst >> 8, dst & 0xFF
+        regs[REG_H], regs[REG_L] = src >> 8, src & 0xFF
+        # the source pointer left on the data stack by the loop
+        cpu.data_stack[cpu.ds_ptr] = regs[REG_H]
+        cpu.data_stack[(cpu.ds_ptr + 1) & 0xFF] = regs[REG_L]
+        # flags of the last `dec c`
+        cpu.zf, cpu.sf, cpu.pf = 1, 0, PARITY[0]
+        # ret
+        cpu.pc = cpu.pop_addr()
+
+    return trap
+
+
+ROUTINES = {
+    'storage_io': storage_io,
+    'mem_to_mem': mem_to_mem,
+}
+
+
+def install(computer, symbols):
+    """
+    Trap the routines found in the symbols (name -> address).
+    Return the names of the trapped routines.
+    """
+    installed = []
+    for name, factory in ROUTINES.items():
+        if name in symbols:
+            computer.cpu.traps[symbols[name]] = factory(computer, symbols)
+            installed.append(name)
+    return installed
+
+
+def uninstall(computer):
+    """Back to the exact execution"""
+    computer.cpu.traps.clear()
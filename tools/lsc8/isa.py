@@ -0,0 +1,100 @@
+# -*- coding: UTF-8 -*-
+"""
+LSC-8 instruction encoding shared by the assembler and the simulator.
+
+Opcode layout is GG_DDD_SSS: 2-bit group, destination (or ALU select,
+flag condition) field and source (or sub-operation) field.
+"""
+
+# Registers, DDD/SSS field
+REGISTERS = {
+    'a': 0b000,
+    'b': 0b001,
+    'c': 0b010,
+    'd': 0b011,
+    'e': 0b100,
+    'h': 0b101,
+    'l': 0b110,
+    'mem': 0b111
+}
+REG_MEM = REGISTERS['mem']
+
+# Flag conditions, DDD field: bits 0-1 select CF, ZF, SF, PF,
+# bit 2 is the expected flag value
+COND_NC, COND_NZ, COND_NS, COND_NP, COND_C, COND_Z, COND_S, COND_P = range(8)
+
+JMP_CONDITIONS = {
+    'jnc': COND_NC, 'jae': COND_NC, 'jnb': COND_NC,
+    'jc': COND_C, 'jb': COND_C, 'jnae': COND_C,
+    'jnz': COND_NZ, 'jne': COND_NZ,
+    'jz': COND_Z, 'je': COND_Z,
+    'jns': COND_NS,
+    'js': COND_S,
+    'jnp': COND_NP, 'jpo': COND_NP,
+    'jp': COND_P, 'jpe': COND_P,
+}
+CALL_CONDITIONS = {
+    'cnc': COND_NC, 'cnz': COND_NZ, 'cp': COND_NS, 'cpo': COND_NP,
+    'cc': COND_C, 'cz': COND_Z, 'cm': COND_S, 'cpe': COND_P,
+}
+RET_CONDITIONS = {
+    'rnc': COND_NC, 'rnz': COND_NZ, 'rp': COND_NS, 'rpo': COND_NP,
+    'rc': COND_C, 'rz': COND_Z, 'rm': COND_S, 'rpe': COND_P,
+}
+
+# ALU select, DDD field
+ALU_OPERATIONS = {
+    'add': 0b000,
+    'adc': 0b001,
+    'sub': 0b010,
+    'sbb': 0b011,
+    'and': 0b100,
+    'xor': 0b101,
+    'or': 0b110,
+    'cmp': 0b111
+}
+ALU_CMP = ALU_OPERATIONS['cmp']
+
+# Accumulator rotations, DDD field
+ROTATIONS = {
+    'rlc': 0b00, 'rol': 0b00,
+    'rrc': 0b01, 'ror': 0b01,
+    'ral': 0b10, 'rcl': 0b10,
+    'rar': 0b11, 'rcr': 0b11,
+}
+
+# Flag instructions, DDD field >> 1
+FLAG_OPERATIONS = {'clc': 0b00, 'stc': 0b01, 'cli': 0b10, 'sti': 0b11}
+
+# Group 11
+MOV_RR = 0b11_000_000       # mov r, r
+HLT = 0b11_111_111
+
+# Group 10
+ALU_R = 0b10_000_000        # add..cmp a, r
+
+# Group 01
+IN = 0b01_000_001           # in/out, port in bits 1-4
+OUT = 0b01_100_001
+JMP_COND = 0b01_000_000
+CALL_COND = 0b01_000_010
+PUSH_R = 0b01_000_100
+POP_R = 0b01_000_110
+
+# Group 00
+INC = 0b00_000_000
+DEC = 0b00_000_001
+JMP = 0b00_111_000          # inc mem
+CALL = 0b00_111_001         # dec mem
+ROTATE = 0b00_000_010
+RET = 0b00_100_010
+INT = 0b00_101_010
+PUSH_IMM = 0b00_110_010
+IRET = 0b00_111_010
+RET_COND = 0b00_000_011
+ALU_IMM = 0b00_000_100
+FLAG = 0b00_000_101
+MOV_IMM = 0b00_000_110
+
+PORTS_NUMBER = 16
+
@@ -0,0 +1,240 @@
+# -*- coding: UTF-8 -*-
+"""
+Basic-block translation for the LSC-8 simulator.
+
+Straight-line runs of instructions ending at a control transfer are
+translated to Python functions, compiled once and cached by the start
+address. A write into a translated range drops the blocks covering it.
+"""
+
+from .cpu import CPU, DISPATCH, PARITY, ROM_BASE, MEMORY_SIZE
+from .isa import REG_MEM
+
+MAX_BLOCK = 64      # instructions per block
+
+_HL = '((r[5] << 8) | r[6])'
+
+
+class TranslatingCPU(CPU):
+    """CPU executing the basic blocks translated to Python code"""
+
+    def __init__(self):
+        self.blocks = {}
+        self.code_map = bytearray(MEMORY_SIZE)
+        self._page_blocks = [set() for _ in range(MEMORY_SIZE >> 8)]
+        self._smc = False
+        super().__init__()
+
+    def load(self, data, address: int):
+        super().load(data, address)
+        self.invalidate(address, address + len(data))
+
+    def write_mem(self, address, value):
+        if address < ROM_BASE:
+            self.memory[address] = value
+            if self.code_map[address]:
+                self.invalidate(address)
+
+    def write_block(self, address, data):
+        super().write_block(address, data)
+        end = address + len(data)
+        self.invalidate(address, min(end, MEMORY_SIZE))
+        if end > MEMORY_SIZE:
+            self.invalidate(0, end - MEMORY_SIZE)
+
+    def invalidate(self, start, end=None):
+        """Drop the translated blocks overlapping [start, end)"""
+        if end is None:
+            end = start + 1
+        end = min(end, MEMORY_SIZE)
+        dropped = set()
+        for page in range(start >> 8, ((end - 1) >> 8) + 1):
+            for first in self._page_blocks[page]:
+                if first < end and start < self.blocks[first][2]:
+                    dropped.add(first)
+        for first in dropped:
+            last = self.blocks.pop(first)[2]
+            for page in range(first >> 8, ((last - 1) >> 8) + 1):
+                self._page_blocks[page].discard(first)
+            self.code_map[first:last] = bytes(last - first)
+        if dropped:
+            self._smc = True
+            # the ranges of the blocks left may overlap the dropped ones
+            for page in range(start >> 8, ((end - 1) >> 8) + 1):
+                for first in self._page_blocks[page]:
+                    last = self.blocks[first][2]
+                    self.code_map[first:last] = b'\x01' * (last - first)
+
+    def translate(self, address):
+        """
+        Compile the block starting at `address`.
+        Return (function, instructions, end address) or None if the
+        first instruction can't be translated.
+        """
+        lines, count, end = _translate(self.memory, address)
+        if not count:
+            return None
+        source = (f'def block_{address:04X}(cpu):\n'
+                  f'    r = cpu.regs\n'
+                  f'    m = cpu.memory\n' +
+                  ''.join(f'    {line}\n' for line in lines))
+        namespace = {'PARITY': PARITY}
+        exec(compile(source, f'<block {address:04X}h>', 'exec'), namespace)
+        block = (namespace[f'block_{address:04X}'], count, end)
+
+        self.blocks[address] = block
+        for page in range(address >> 8, ((end - 1) >> 8) + 1):
+            self._page_blocks[page].add(address)
+        self.code_map[address:end] = b'\x01' * (end - address)
+        return block
+
+    def run(self, max_instructions=None):
+        blocks = self.blocks
+        limit = -1 if max_instructions is None else max_instructions
+        executed = 0
+        try:
+            while not self.halted and executed != limit:
+                block = blocks.get(self.pc) or self.translate(self.pc)
+                if block is None or 0 <= limit - executed < block[1]:
+                    self.step()
+                    self.instructions -= 1
+                    executed += 1
+                    continue
+                self._smc = False
+                executed += block[0](self)
+        finally:
+            self.instructions += executed
+        return executed
+
+
+def _translate(memory, address):
+    """Python source lines of the block, its length and end address"""
+    lines = []
+    emit = lines.append
+    count = 0
+    pc = address
+    transfer = False
+
+    while count < MAX_BLOCK and pc < MEMORY_SIZE - 3:
+        handler, x, y = DISPATCH[memory[pc]]
+        size = _SIZES.get(handler, 1)
+        operand = memory[pc + 1] if size == 2 else None
+        target = memory[pc + 1] | (memory[pc + 2] << 8) if size == 3 else None
+        nxt = pc + size
+
+        if handler is CPU._op_illegal:     # left to the interpreter
+            break
+        count += 1
+
+        if handler is CPU._op_mov_rr:
+            emit(f'r[{x}] = r[{y}]')
+        elif handler is CPU._op_mov:
+            if x == REG_MEM:
+                emit(f'cpu.write_mem({_HL}, r[{y}])')
+                _smc_check(emit, nxt, count)
+            else:
+                emit(f'r[{x}] = m[{_HL}]')
+        elif handler is CPU._op_mov_imm:
+            if x == REG_MEM:
+                emit(f'cpu.write_mem({_HL}, {operand})')
+                _smc_check(emit, nxt, count)
+            else:
+                emit(f'r[{x}] = {operand}')
+        elif handler is CPU._op_alu:
+            src = f'm[{_HL}]' if y == REG_MEM else f'r[{y}]'
+            emit(f'cpu._alu({x}, {src})')
+        elif handler is CPU._op_alu_imm:
+            emit(f'cpu._alu({x}, {operand})')
+        elif handler in (CPU._op_inc, CPU._op_dec):
+            sign = '+' if handler is CPU._op_inc else '-'
+            emit(f'v = (r[{x}] {sign} 1) & 0xFF')
+            emit(f'r[{x}] = v')
+            emit('cpu.zf = int(not v)')
+            emit('cpu.sf = v >> 7')
+            emit('cpu.pf = PARITY[v]')
+        elif handler is CPU._op_push:
+            src = f'm[{_HL}]' if x == REG_MEM else f'r[{x}]'
+            emit(f'cpu.push_data({src})')
+        elif handler is CPU._op_push_imm:
+            emit(f'cpu.push_data({operand})')
+        elif handler is CPU._op_pop:
+            if x == REG_MEM:
+                emit(f'cpu.write_mem({_HL}, cpu.pop_data())')
+                _smc_check(emit, nxt, count)
+            else:
+                emit(f'r[{x}] = cpu.pop_data()')
+        elif handler is CPU._op_in:
+            emit(f'r[0] = cpu.port_in({x})')
+        elif handler is CPU._op_out:
+            emit(f'cpu.port_out({x}, r[0])')
+        elif handler is CPU._op_rotate:
+            emit(f'cpu._rotate({x})')
+        elif handler is CPU._op_set_flag:
+            emit(f'cpu.{x} = {y}')
+
+        # control transfer, end of the block
+        elif handler is CPU._op_jmp:
+            emit(f'cpu.pc = {target}')
+            transfer = True
+        elif handler is CPU._op_jmp_cond:
+            emit(f'cpu.pc = {target} if cpu.{x} == {y} else {nxt}')
+            transfer = True
+        elif handler is CPU._op_call:
+            emit(f'cpu.push_addr({nxt})')
+            emit(f'cpu.pc = {target}')
+            emit(f'if {target} in cpu.traps:')
+            emit(f'    cpu.traps[{target}](cpu)')
+            transfer = True
+        elif handler is CPU._op_call_cond:
+            emit(f'if cpu.{x} == {y}:')
+            emit(f'    cpu.push_addr({nxt})')
+            emit(f'    cpu.pc = {target}')
+            emit(f'    if {target} in cpu.traps:')
+            emit(f'        cpu.traps[{target}](cpu)')
+            emit('else:')
+            emit(f'    cpu.pc = {nxt}')
+            transfer = True
+        elif handler is CPU._op_ret:
+            emit('cpu.pc = cpu.pop_addr()')
+            transfer = True
+        elif handler is CPU._op_ret_cond:
+            emit(f'cpu.pc = cpu.pop_addr() if cpu.{x} == {y} else {nxt}')
+            transfer = True
+        elif handler is CPU._op_int:
+            emit(f'cpu.pc = {nxt}')
+            emit(f'cpu.interrupt({operand})')
+            transfer = True
+        elif handler is CPU._op_iret:
+            emit('cpu.pc = cpu.pop_addr()')
+            emit('cpu.flags = cpu.pop_data()')
+            transfer = True
+        elif handler is CPU._op_hlt:
+            emit(f'cpu.pc = {pc}')
+            emit('cpu.halted = True')
+            transfer = True
+
+        pc = nxt
+        if transfer:
+            break
+
+    if not count:
+        return lines, count, address
+    if not transfer:
+        emit(f'cpu.pc = {pc}')
+    emit(f'return {count}')
+    return lines, count, pc
+
+
+def _smc_check(emit, nxt, count):
+    """Leave the block if the write modified translated code"""
+    emit('if cpu._smc:')
+    emit(f'    cpu.pc = {nxt}')
+    emit(f'    return {count}')
+
+
+_SIZES = {
+    CPU._op_mov_imm: 2, CPU._op_alu_imm: 2, CPU._op_push_imm: 2,
+    CPU._op_int: 2,
+    CPU._op_jmp: 3, CPU._op_jmp_cond: 3,
+    CPU._op_call: 3, CPU._op_call_cond: 3,
+}
@@ -0,0 +1,219 @@
+# -*- coding: UTF-8 -*-
+"""
+Object files of the assembled modules and the linker.
+
+An object holds the code of the module assembled at its `org` (or 0),
+the addresses of its labels relative to the module start, its constants,
+the public and external names and the fixups: the operands depending on
+the label addresses, evaluated again when the modules are placed, and
+the debug tables: the source lines of the code and the procedures.
+Objects are stored as JSON.
+"""
+
+import hashlib
+import json
+import os
+
+from .expression import HERE, ExpressionError, parse
+
+OBJECT_VERSION = 4
+OBJECT_EXTENSION = '.obj'
+
+
+class LinkError(Exception):
+    pass
+
+
+def source_digest(text: str):
+    return hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+
+
+def make_object(code, org=None, labels=None, constants=None, public=(),
+                external=(), fixups=(), sources=None, lines=(),
+                procedures=None, path=None):
+    """
+    Object of the module.
+    `fixups` - (offset, size, expression, address) of the operands to
+    evaluate with the label addresses, the address of the line relative
+    to the module start is the value of `$`,
+    `sources` - texts of the module files,
+    `lines` - (offset, size, path, line) of the code of the source lines,
+    `procedures` - name: (start, end) offsets,
+    `path` - the source file of the module.
+    """
+    files = list(dict.fromkeys(path for _, _, path, _ in lines))
+    index = {path: i for i, path in enumerate(files)}
+    return {
+        'version': OBJECT_VERSION,
+        'path': None if path is None else os.path.abspath(path),
+        'org': org,
+        'code': bytes(code).hex(),
+        'labels': dict(labels or {}),
+        'constants': dict(constants or {}),
+        'public': list(public),
+        'external': list(external),
+        'fixups': [list(fixup) for fixup in fixups],
+        'sources': {path: source_digest(text)
+                    for path, text in (sources or {}).items()},
+        'files': files,
+        'lines': [[offset, size, index[path], line]
+                  for offset, size, path, line in lines],
+        'procedures': {name: list(bounds)
+                       for name, bounds in (procedures or {}).items()},
+    }
+
+
+def object_path(source_path, directory):
+    """
+    Object file of the source: its name and the hash of its absolute
+    path, the modules of the same name in other directories differ
+    """
+    name = os.path.splitext(os.path.basename(source_path))[0]
+    digest = hashlib.blake2b(os.path.abspath(source_path).encode(),
+                             digest_size=4).hexdigest()
+    return os.path.join(directory, f'{name}-{digest}{OBJECT_EXTENSION}')
+
+
+def save_object(path, obj):
+    """Write the object to a temporary file and rename it"""
+    temp = f'{path}.{os.getpid()}.tmp'
+    with open(temp, 'w') as file:
+        json.dump(obj, file, indent=1)
+    os.replace(temp, path)
+
+
+def load_object(path):
+    """The object stored in the file or None if it is missing or stale"""
+    try:
+        with open(path, 'r') as file:
+            obj = json.load(file)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(obj, dict) or obj.get('version') != OBJECT_VERSION:
+        return None
+    return obj
+
+
+def is_up_to_date(obj, source_path=None):
+    """
+    All the source files of the object are unchanged and the object
+    is built from `source_path` if it is given
+    """
+    if (source_path is not None and
+            obj.get('path') != os.path.abspath(source_path)):
+        return False
+    for path, digest in obj['sources'].items():
+        try:
+            with open(path, 'r') as file:
+                if source_digest(file.read()) != digest:
+                    return False
+        except OSError:
+            return False
+    return True
+
+
+def evaluate(expression: str, symbols: dict):
+    """Value of the assembler expression with the names from `symbols`"""
+    try:
+        parsed = parse(expression)
+    except ExpressionError as err:
+        raise LinkError(str(err))
+    for name in parsed.names:
+        if name not in symbols:
+            raise LinkError(f'Name "{name}" of "{expression}"'
+                            f' is not defined')
+    return parsed.evaluate(symbols)
+
+
+def _select_libraries(objects, libraries):
+    """Library objects providing the external names, recursively"""
+    provided = {name for obj in objects for name in obj['public']}
+    needed = {name for obj in objects for name in obj['external']} - provided
+    selected = []
+    rest = list(libraries)
+    while needed:
+        for lib in rest:
+            if needed & set(lib['public']):
+                break
+        else:
+            break
+        rest.remove(lib)
+        selected.append(lib)
+        provided |= set(lib['public'])
+        needed = (needed | set(lib['external'])) - provided
+    return selected
+
+
+def place(objects, libraries=()):
+    """
+    Place the modules one after another (or at their `org`).
+    Return the linked objects (the needed library modules are added)
+    and their addresses.
+    """
+    objects = list(objects) + _select_libraries(objects, libraries)
+    if not objects:
+        raise LinkError('Nothing to link')
+
+    bases = []
+    address = None
+    for obj in objects:
+        size = len(obj['code']) // 2
+        base = obj['org'] if obj['org'] is not None else (address or 0)
+        for other, other_base in zip(objects, bases):
+            other_end = other_base + len(other['code']) // 2
+            if base < other_end and other_base < base + size:
+                raise LinkError(f'Module at {base:04X}h overlaps'
+                                f' the module at {other_base:04X}h')
+        bases.append(base)
+        address = base + size
+    return objects, bases
+
+
+def link(objects, libraries=()):
+    """
+    Place the modules one after another (or at their `org`), resolve
+    the fixups and return the image and its start address.
+    Library modules are linked only if they provide a needed name.
+    """
+    objects, bases = place(objects, libraries)
+    start = min(bases)
+    end = max(base + len(obj['code']) // 2
+              for obj, base in zip(objects, bases))
+    if end > 0x10000:
+        raise LinkError(f'Image is out of the address space: {end:X}h')
+
+    # public names
+    names = {}
+    for obj, base in zip(objects, bases):
+        symbols = _module_symbols(obj, base)
+        for name in obj['public']:
+            if name in names:
+                raise LinkError(f'Public name "{name}" is defined twice')
+            names[name] = symbols[name]
+
+    image = bytearray(end - start)
+    for obj, base in zip(objects, bases):
+        code = bytearray.fromhex(obj['code'])
+        symbols = _module_symbols(obj, base)
+        for name in obj['external']:
+            if name not in symbols:
+                if name not in names:
+                    raise LinkError(f'External name "{name}"'
+                                    f' is not defined')
+                symbols[name] = names[name]
+        for offset, size, expression, here in obj['fixups']:
+            symbols[HERE] = base + here
+            value = evaluate(expression, symbols)
+            if not -(1 << (8 * size - 1)) <= value < (1 << (8 * size)):
+                raise LinkError(f'Value of "{expression}" over {size} byte')
+            code[offset:offset + size] = (
+                (value & ((1 << (8 * size)) - 1)).to_bytes(size, 'little'))
+        image[base - start:base - start + len(code)] = code
+    return bytes(image), start
+
+
+def _module_symbols(obj, base):
+    symbols = dict(obj['constants'])
+    symbols.update({name: base + offset
+                    for name, offset in obj['labels'].items()})
+    return symbols
@@ -0,0 +1,173 @@
+# -*- coding: UTF-8 -*-
+"""
+Listing of the assembled program with the static cost of the code.
+
+Every instruction is annotated with its clock cycles counted by
+the microcode (taken/not taken for the conditional ones). Procedures
+(`proc` ... `endp`) get the total of their instructions and the loops
+found by the backward jumps, with the iteration bound when the loop is
+closed by `jnz` after `dec r` (at most 256 iterations of the 8-bit
+counter). Called routines are not included in the cost of the caller.
+"""
+
+from . import isa
+from .assembler import Directive, Instruction, Label
+
+BYTES_PER_LINE = 6
+COUNTER_BOUND = 256
+
+
+def instruction_cycles(microcode, tokens, code):
+    """(taken, not taken) cycles of the instruction line or None"""
+    if tokens is None or not code:
+        return None
+    pos = 1 if isinstance(tokens[0], Label) else 0
+    if pos >= len(tokens) or not isinstance(tokens[pos], Instruction):
+        return None
+    return microcode.cycles(code[0]), microcode.cycles(code[0], False)
+
+
+class Loop:
+    """Code from the jump target up to the backward jump"""
+
+    def __init__(self, label, start, end, counter=None):
+        self.label = label
+        self.start = start
+        self.end = end
+        self.counter = counter      # register of `dec r; jnz`
+        self.body = 0               # worst cycles of one iteration
+        self.bounded = True         # the inner loops are bounded too
+
+    @property
+    def bound(self):
+        return COUNTER_BOUND if self.counter is not None else None
+
+    @property
+    def extra(self):
+        """Cycles of the iterations after the first one"""
+        if self.bound is None or not self.bounded:
+            return None
+        return (self.bound - 1) * self.body
+
+    def contains(self, other):
+        return (self is not other and self.start <= other.start and
+                other.end <= self.end)
+
+
+class Routine:
+    """Procedure with the total cycles of its instructions"""
+
+    def __init__(self, name, address):
+        self.name = name
+        self.address = address
+        self.size = 0
+        self.cycles = 0             # every instruction once
+        self.loops = []
+        self._instructions = []     # (address, worst cycles)
+
+    @property
+    def worst(self):
+        """Cycles with the bounded loops fully iterated or None"""
+        worst = self.cycles
+        for loop in self.loops:
+            if not any(other.contains(loop) for other in self.loops):
+                if loop.extra is None:
+                    return None
+                worst += loop.extra
+        return worst
+
+    def _analyze_loops(self):
+        # the inner loops first
+        for loop in sorted(self.loops, key=lambda item: item.end - item.start):
+            loop.body = sum(cycles for address, cycles in self._instructions
+                            if loop.start <= address <= loop.end)
+            for inner in self.loops:
+                if loop.contains(inner):
+                    if inner.extra is None:
+                        loop.bounded = False
+                    else:
+                        loop.body += inner.extra
+
+
+def analyze(lex, microcode):
+    """Routines of the assembled Lexer with their cost"""
+    routines = []
+    routine = None
+    previous = None     # tokens of the previous instruction
+    for l_num, text, address, tokens, code in lex.lines():
+        if tokens is None:
+            words = text.split(';')[0].lower().split()
+            if words[1:2] == ['endp'] and routine is not None:
+                routine._analyze_loops()
+                routine = None
+            continue
+        if len(tokens) > 1 and isinstance(tokens[1], Directive):
+            if tokens[1].name == 'proc':
+                if routine is not None:
+                    routine._analyze_loops()
+                routine = Routine(tokens[0].name, address)
+                routines.append(routine)
+            continue
+        cycles = instruction_cycles(microcode, tokens, code)
+        if routine is None or cycles is None:
+            continue
+        routine.size += len(code)
+        routine.cycles += cycles[0]
+        routine._instructions.append((address, max(cycles)))
+
+        pos = 1 if isinstance(tokens[0], Label) else 0
+        name = tokens[pos].name
+        if (name == 'jmp' or name in isa.JMP_CONDITIONS) and (
+                isinstance(tokens[pos + 1].value, int)):
+            target = tokens[pos + 1].value
+            if routine.address <= target <= address:
+                counter = None
+                if (name in ('jnz', 'jne') and previous is not None and
+                        previous[0].name == 'dec'):
+                    counter = previous[1].name
+                routine.loops.append(Loop(tokens[pos + 1].name, target,
+                                          address, counter))
+        previous = tokens[pos:]
+    if routine is not None:
+        routine._analyze_loops()
+    return routines
+
+
+def _cycles_text(cycles):
+    if cycles is None:
+        return ''
+    taken, not_taken = cycles
+    return str(taken) if taken == not_taken else f'{taken}/{not_taken}'
+
+
+def write_listing(lex, microcode, file):
+    """Write the listing and the routine costs of the assembled Lexer"""
+    file.write(f'{"Line":>5} {"Addr":<4}  {"Code":<{3 * BYTES_PER_LINE}}'
+               f'{"Cycles":<7} Source\n')
+    for l_num, text, address, tokens, code in lex.lines():
+        cycles = _cycles_text(instruction_cycles(microcode, tokens, code))
+        addr = '' if address is None else f'{address:04X}'
+        chunks = [code[i:i + BYTES_PER_LINE]
+                  for i in range(0, len(code), BYTES_PER_LINE)] or [[]]
+        for i, chunk in enumerate(chunks):
+            data = ' '.join(f'{byte:02X}' for byte in chunk)
+            if i == 0:
+                file.write(f'{l_num:>5} {addr:<4}  '
+                           f'{data:<{3 * BYTES_PER_LINE}}'
+                           f'{cycles:<7} {text}'.rstrip() + '\n')
+            else:
+                address_i = address + i * BYTES_PER_LINE
+                file.write(f'{"":>5} {address_i:04X}  {data}\n')
+
+    file.write(f'\n{"Routine":<20}{"Addr":<6}{"Bytes":>6}{"Cycles":>8}'
+               f'{"Worst":>10}\n')
+    for routine in analyze(lex, microcode):
+        worst = routine.worst
+        file.write(f'{routine.name:<20}{routine.address:04X}  '
+                   f'{routine.size:>6}{routine.cycles:>8}'
+                   f'{"?" if worst is None else worst:>10}\n')
+        for loop in routine.loops:
+            bound = (f'x {loop.bound} (dec {loop.counter})'
+                     if loop.bound is not None else 'x ? (unbounded)')
+            file.write(f'  loop {loop.label} {loop.start:04X}-'
+                       f'{loop.end:04X}: {loop.body} cycles {bound}\n')
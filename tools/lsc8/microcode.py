@@ -0,0 +1,312 @@
+# -*- coding: UTF-8 -*-
+"""
+Microcode-accurate model of the LSC-8 Control Unit.
+
+The command decoder ROM maps the instruction register to the start
+address of its microprogram, the microcode ROM holds 32-bit control
+words. Each microinstruction takes one clock cycle; address 0 is the
+fetch microcommand.
+"""
+
+from .cpu import CPU, REG_A, PARITY
+from .rom import DECODER_ROM, MICROCODE_ROM, read_raw, rom_path
+
+# Control word signals (named after the Control Unit circuit)
+END = 1 << 0            # go to the next instruction
+END_NOT_COND = 1 << 1   # END if the COND field of IR is not satisfied
+HLT = 1 << 2
+DS_POP = 1 << 6         # data stack -> data bus
+DS_PUSH = 1 << 7        # data bus -> data stack
+STATUS_SHIFT = 8        # 3-bit bus cycle status
+AS_POP = 1 << 11        # address stack -> PC
+AS_PUSH = 1 << 12       # PC -> address stack
+PC_HIGH = 1 << 13       # AS&PC L/H: the high byte of PC (and vector)
+PC_OE = 1 << 14         # PC -> address bus, PC + 1
+PC_WE = 1 << 15         # data bus -> PC byte
+REGS_AO = 1 << 16       # H:L -> address bus
+REGS_ACC = 1 << 17      # select accumulator instead of DDD/SSS
+REGS_RE = 1 << 18       # register -> data bus
+REGS_WE = 1 << 19       # data bus -> register
+SELECT_SHIFT = 20       # 2-bit select: 1 - port, 2 - IR, 3 - vector
+FR_WE = 1 << 22
+FR_OE = 1 << 23
+ALU_CODE_SHIFT = 24     # 2-bit ALU code: 1 - inc, 2 - dec, 3 - rotate
+ALU_COD = 1 << 26       # ALU code from the DDD field of IR
+ALU_OE = 1 << 27
+ALU_FLAGS = 1 << 28     # update flags from ALU
+TMP_B = 1 << 29         # ALU temp register a/b
+TMP_OE = 1 << 30        # ALU temp register I/O: 1 - output to data bus
+TMP_EN = 1 << 31
+
+# Bus cycle status
+STATUS_MEMW, STATUS_MEMR = 1, 2
+STATUS_IOW, STATUS_IOR, STATUS_INTA = 5, 6, 7
+
+SELECT_PORT, SELECT_IR, SELECT_VECTOR = 1, 2, 3
+ALU_INC, ALU_DEC, ALU_ROTATE = 1, 2, 3
+
+FETCH = 0
+
+
+class Microcode:
+    """Contents of the COMMAND_DECODER and MICROCODE ROMs"""
+
+    def __init__(self, decoder, words):
+        if len(decoder) != 256:
+            raise ValueError('Command decoder should have 256 entries')
+        self.decoder = list(decoder)
+        self.words = list(words)
+
+    @classmethod
+    def load(cls, decoder_path=None, microcode_path=None):
+        """Load the ROMs, the ones of the repository by default"""
+        return cls(read_raw(decoder_path or rom_path(DECODER_ROM)),
+                   read_raw(microcode_path or rom_path(MICROCODE_ROM)))
+
+    def program(self, opcode):
+        """
+        Addresses of the microprogram of the instruction up to the word
+        with the END signal (HLT has no END).
+        """
+        address = self.decoder[opcode]
+        program = []
+        while address < len(self.words) and address not in program:
+            program.append(address)
+            word = self.words[address]
+            if word & (END | HLT):
+                break
+            address += 1
+        return program
+
+    def cycles(self, opcode, taken=True):
+        """
+        Clock cycles of the instruction including the fetch.
+        `taken` - the condition of jmp/call/ret is satisfied.
+        """
+        program = self.program(opcode)
+        if not taken:
+            for i, address in enumerate(program):
+                if self.words[address] & END_NOT_COND:
+                    return i + 2
+        return len(program) + 1
+
+
+def _compile(address, word):
+    """
+    Translate a control word to the Python function of the CPU
+    returning the next microprogram address.
+    """
+    status = (word >> STATUS_SHIFT) & 0b111
+    select = (word >> SELECT_SHIFT) & 0b11
+    alu_code = (word >> ALU_CODE_SHIFT) & 0b11
+    tmp = 1 if word & TMP_B else 0
+
+    lines = []
+    emit = lines.append
+
+    # address bus
+    if word & PC_OE:
+        emit('addr = cpu.pc; cpu.pc = (addr + 1) & 0xFFFF')
+    elif word & REGS_AO:
+        emit('addr = (cpu.regs[5] << 8) | cpu.regs[6]')
+    elif select == SELECT_VECTOR:
+        emit(f'addr = (cpu.vector << 1) | {1 if word & PC_HIGH else 0}')
+
+    # data bus sources
+    has_bus = True
+    if status == STATUS_MEMR:
+        emit('bus = cpu.memory[addr]')
+    elif status == STATUS_IOR:
+        emit('bus = cpu.port_in((cpu.ir >> 1) & 0b1111)')
+    elif word & REGS_RE:
+        if word & REGS_ACC:
+            emit('bus = cpu.regs[0]')
+        else:
+            emit('bus = cpu.regs[cpu.reg_src]')
+    elif word & FR_OE:
+        emit('bus = cpu.flags')
+    elif word & DS_POP:
+        emit('bus = cpu.pop_data()')
+    elif word & ALU_OE:
+        if word & ALU_COD:
+            code = 'cpu.ir >> 3 & 0b111'
+        else:
+            code = str(0b1000 | alu_code)
+        emit(f'bus = cpu.alu({code}, {bool(word & ALU_FLAGS)})')
+    elif word & TMP_EN and word & TMP_OE:
+        emit(f'bus = cpu.tmp[{tmp}]')
+    else:
+        has_bus = False
+
+    # data bus destinations
+    if has_bus:
+        if select == SELECT_IR:
+            emit('cpu.ir = bus')
+        if word & REGS_WE:
+            emit(f'cpu.regs[{"0" if word & REGS_ACC else "cpu.reg_dst"}]'
+                 f' = bus')
+        if word & TMP_EN and not word & TMP_OE:
+            emit(f'cpu.tmp[{tmp}] = bus')
+        if word & DS_PUSH:
+            emit('cpu.push_data(bus)')
+        if status == STATUS_MEMW:
+            emit('cpu.write_mem(addr, bus)')
+        elif status == STATUS_IOW:
+            emit('cpu.port_out((cpu.ir >> 1) & 0b1111, bus)')
+        if word & FR_WE and word & DS_POP:
+            emit('cpu.flags = bus')
+        if (status == STATUS_MEMR and select != SELECT_IR and
+                not word & (REGS_WE | TMP_EN | PC_WE | DS_PUSH)):
+            emit('cpu.vector = bus')    # interrupt vector latch
+
+    # PC and address stack
+    if word & AS_PUSH:
+        emit('cpu.push_addr(cpu.pc)')
+    if word & PC_WE:
+        if word & PC_HIGH:
+            emit('cpu.pc = (cpu.pc & 0xFF) | (bus << 8)')
+        else:
+            emit('cpu.pc = (cpu.pc & 0xFF00) | bus')
+    if word & AS_POP:
+        emit('cpu.pc = cpu.pop_addr()')
+
+    # flag operations: FS from DDD, bit 2 - CF/IF, bit 1 - value
+    if word & FR_WE and not word & DS_POP:
+        emit('fs = cpu.ir >> 4 & 0b11')
+        emit('if fs & 0b10: cpu.if_ = fs & 1')
+        emit('else: cpu.cf = fs & 1')
+
+    # sequencing
+    if word & HLT:
+        emit('cpu.halted = True')
+        emit(f'return {address}')
+    elif word & END:
+        if select == SELECT_IR:
+            emit('cpu.decode()')
+            emit('return cpu.decoder[cpu.ir]')
+        else:
+            emit(f'return {FETCH}')
+    elif word & END_NOT_COND:
+        emit(f'return {address + 1} if cpu.condition() else {FETCH}')
+    else:
+        emit(f'return {address + 1}')
+
+    source = (f'def uop_{address}(cpu):\n' +
+              ''.join(f'    {line}\n' for line in lines))
+    namespace = {}
+    exec(compile(source, f'<microcode {address:02X}h>', 'exec'), namespace)
+    return namespace[f'uop_{address}']
+
+
+class MicrocodeCPU(CPU):
+    """
+    Cycle-level model of the LSC-8 processor executing the microcode.
+    Every control word is compiled once to a micro-op function.
+    """
+
+    def __init__(self, microcode: Microcode):
+        self.microcode = microcode
+        self.decoder = microcode.decoder
+        self.uops = [_compile(address, word)
+                     for address, word in enumerate(microcode.words)]
+        self.tmp = [0, 0]
+        super().__init__()
+
+    def reset(self):
+        super().reset()
+        self.upc = FETCH
+        self.ir = 0
+        self.vector = 0
+        self.reg_src = self.reg_dst = REG_A
+        self.tmp[:] = [0, 0]
+        self.cycles = 0
+
+    def wake(self):
+        super().wake()
+        self.upc = FETCH
+
+    def decode(self):
+        """Register fields of the instruction just loaded into IR"""
+        ddd = (self.ir >> 3) & 0b111
+        self.reg_dst = ddd
+        # SSS for mov and ALU groups, DDD for inc/dec, push
+        self.reg_src = self.ir & 0b111 if self.ir & 0b1000_0000 else ddd
+
+    def condition(self):
+        cond = (self.ir >> 3) & 0b111
+        flag = (self.cf, self.zf, self.sf, self.pf)[cond & 0b11]
+        return flag == (cond >> 2)
+
+    def alu(self, code, update_flags):
+        a, b = self.tmp
+        cf = self.cf
+        if code < 0b1000:
+            if code <= 0b011 or code == 0b111:   # add, adc, sub, sbb, cmp
+                carry = cf if code in (0b001, 0b011) else 0
+                if code & 0b010:
+                    result = a - b - carry
+                    cf = int(result < 0)
+                else:
+                    result = a + b + carry
+                    cf = int(result > 0xFF)
+                result &= 0xFF
+            elif code == 0b100:
+                result, cf = a & b, 0
+            elif code == 0b101:
+                result, cf = a ^ b, 0
+            else:
+                result, cf = a | b, 0
+        elif code == 0b1000 | ALU_INC:
+            result = (a + 1) & 0xFF
+        elif code == 0b1000 | ALU_DEC:
+            result = (a - 1) & 0xFF
+        else:
+            mode = (self.ir >> 3) & 0b11
+            if mode == 0b00:    # rlc
+                cf = a >> 7
+                result = ((a << 1) | cf) & 0xFF
+            elif mode == 0b01:  # rrc
+                cf = a & 1
+                result = (a >> 1) | (cf << 7)
+            elif mode == 0b10:  # ral
+                result, cf = ((a << 1) | cf) & 0xFF, a >> 7
+            else:               # rar
+                result, cf = (a >> 1) | (cf << 7), a & 1
+        if update_flags:
+            self.cf = cf
+            if code < 0b1000 | ALU_ROTATE:
+                self.zf = int(not result)
+                self.sf = result >> 7
+                self.pf = PARITY[result]
+        if code == 0b111:   # cmp keeps the accumulator
+            return a
+        return result
+
+    def microstep(self):
+        """Execute one microinstruction (one clock cycle)"""
+        self.upc = self.uops[self.upc](self)
+        self.cycles += 1
+
+    def step(self):
+        uops = self.uops
+        upc = uops[FETCH](self)
+        cycles = 1
+        while upc != FETCH and not self.halted:
+            upc = uops[upc](self)
+            cycles += 1
+        self.upc = upc
+        self.cycles += cycles
+        self.instructions += 1
+        if self.halted:
+            # like CPU, stay at the address of hlt
+            self.pc = (self.pc - 1) & 0xFFFF
+
+    def run(self, max_instructions=None):
+        executed = 0
+        limit = -1 if max_instructions is None else max_instructions
+        step = self.step
+        while not self.halted and executed != limit:
+            step()
+            executed += 1
+        return executed
+
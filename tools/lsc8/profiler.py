@@ -0,0 +1,168 @@
+# -*- coding: UTF-8 -*-
+"""
+Profiler of the simulated programs.
+
+The instructions are counted per address by the interpreting loop
+(the cycles too on the MicrocodeCPU, otherwise they are estimated by
+the microcode). Every `interval` instructions the call stack is sampled
+from the address stack: the caller of every return address and the
+routine of PC. Addresses are named by the procedures and labels of the
+assembled sources.
+"""
+
+from .cpu import CPU, DISPATCH, MEMORY_SIZE
+from .microcode import MicrocodeCPU
+
+DEFAULT_INTERVAL = 1000     # instructions between the call stack samples
+
+
+class Profiler:
+    def __init__(self, labels=None, procedures=None, microcode=None):
+        """
+        `labels` - name -> address, `procedures` - name -> (start, end),
+        `microcode` - Microcode for the cycle estimates of the CPU
+        without the microcode.
+        """
+        self.counts = [0] * MEMORY_SIZE
+        self.cycles = [0] * MEMORY_SIZE     # measured by MicrocodeCPU
+        self.stacks = {}    # tuple of the routine names: instructions
+        self.edges = {}     # (caller, callee): instructions
+        self.microcode = microcode
+        self._names = self._name_map(labels or {}, procedures or {})
+
+    @staticmethod
+    def _name_map(labels, procedures):
+        """Routine name of every address"""
+        names = [None] * MEMORY_SIZE
+        points = sorted((address, name) for name, address in labels.items())
+        ends = [address for address, _ in points[1:]] + [MEMORY_SIZE]
+        for (address, name), end in zip(points, ends):
+            names[address:end] = [name] * (end - address)
+        for name, (start, end) in procedures.items():
+            if end is not None:
+                names[start:end] = [name] * (end - start)
+        return names
+
+    def name(self, address):
+        return self._names[address] or f'{address:04X}h'
+
+    def run(self, cpu: CPU, max_instructions=None, interval=DEFAULT_INTERVAL):
+        """
+        Execute like cpu.run() counting the instructions.
+        Return the number of executed instructions.
+        """
+        limit = -1 if max_instructions is None else max_instructions
+        executed = 0
+        while not cpu.halted and executed != limit:
+            count = interval if limit < 0 else min(interval, limit - executed)
+            if isinstance(cpu, MicrocodeCPU):
+                done = self._run_microcode(cpu, count)
+            else:
+                done = self._run(cpu, count)
+            executed += done
+            self.sample(cpu, done)
+        return executed
+
+    def _run(self, cpu, count):
+        memory = cpu.memory
+        dispatch = DISPATCH
+        counts = self.counts
+        executed = 0
+        try:
+            while not cpu.halted and executed != count:
+                pc = cpu.pc
+                handler, x, y = dispatch[memory[pc]]
+                cpu.pc = (pc + 1) & 0xFFFF
+                executed += 1
+                counts[pc] += 1
+                handler(cpu, x, y)
+        finally:
+            cpu.instructions += executed
+        return executed
+
+    def _run_microcode(self, cpu, count):
+        counts, cycles = self.counts, self.cycles
+        executed = 0
+        while not cpu.halted and executed != count:
+            pc, start = cpu.pc, cpu.cycles
+            cpu.step()
+            executed += 1
+            counts[pc] += 1
+            cycles[pc] += cpu.cycles - start
+        return executed
+
+    def sample(self, cpu, weight=1):
+        """Record the call stack of the CPU with the weight"""
+        stack = tuple([self.name((address - 1) & 0xFFFF)
+                       for address in cpu.addr_stack[:cpu.as_ptr]] +
+                      [self.name(cpu.pc)])
+        self.stacks[stack] = self.stacks.get(stack, 0) + weight
+        for edge in zip(stack, stack[1:]):
+            if edge[0] != edge[1]:
+                self.edges[edge] = self.edges.get(edge, 0) + weight
+
+    def address_cycles(self, memory):
+        """Cycles per address, measured or estimated, None if unknown"""
+        if any(self.cycles):
+            return self.cycles
+        if self.microcode is None:
+            return None
+        cost = [self.microcode.cycles(opcode) for opcode in range(256)]
+        return [count and count * cost[memory[address]]
+                for address, count in enumerate(self.counts)]
+
+    def routines(self, memory):
+        """name: [instructions, cycles or None] of every routine"""
+        cycles = self.address_cycles(memory)
+        result = {}
+        for address, count in enumerate(self.counts):
+            if count:
+                item = result.setdefault(self.name(address), [0, 0])
+                item[0] += count
+                item[1] = None if cycles is None else item[1] + cycles[address]
+        return result
+
+    def inclusive(self):
+        """Sampled instructions of every routine with its callees"""
+        result = {}
+        for stack, weight in self.stacks.items():
+            for name in set(stack):
+                result[name] = result.get(name, 0) + weight
+        return result
+
+    def folded(self):
+        """Stacks in the folded format of the flame graph tools"""
+        return ''.join(f'{";".join(stack)} {weight}\n'
+                       for stack, weight in sorted(self.stacks.items()))
+
+    def report(self, memory, top=20):
+        """Text report of the `top` routines, addresses and calls"""
+        total = sum(self.counts) or 1
+        sampled = sum(self.stacks.values()) or 1
+        inclusive = self.inclusive()
+        lines = [f'{"Routine":<24}{"Instr":>12}{"Self%":>8}'
+                 f'{"Incl%":>8}{"Cycles":>14}']
+        routines = sorted(self.routines(memory).items(),
+                          key=lambda item: item[1][0], reverse=True)
+        for name, (count, cycles) in routines[:top]:
+            lines.append(f'{name:<24}{count:>12}{100 * count / total:>8.1f}'
+                         f'{100 * inclusive.get(name, 0) / sampled:>8.1f}'
+                         f'{"?" if cycles is None else cycles:>14}')
+
+        lines.append(f'\n{"Address":<24}{"Instr":>12}{"Self%":>8}')
+        addresses = sorted(range(MEMORY_SIZE), key=self.counts.__getitem__,
+                           reverse=True)
+        for address in addresses[:top]:
+            count = self.counts[address]
+            if not count:
+                break
+            lines.append(f'{address:04X}h {self.name(address):<18}'
+                         f'{count:>12}{100 * count / total:>8.1f}')
+
+        lines.append(f'\n{"Call":<40}{"Samples%":>10}')
+        edges = sorted(self.edges.items(), key=lambda item: item[1],
+                       reverse=True)
+        for (caller, callee), weight in edges[:top]:
+            lines.append(f'{caller + " -> " + callee:<40}'
+                         f'{100 * weight / sampled:>10.1f}')
+        return '\n'.join(lines) + '\n'
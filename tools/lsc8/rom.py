@@ -0,0 +1,222 @@
+# -*- coding: UTF-8 -*-
+"""
+ROM and disk image formats: LogiSim "v2.0 raw" text, Intel HEX and
+plain binary.
+"""
+
+import os
+import re
+
+# ROMs of the repository, the defaults of the tools run from anywhere
+ROM_DIR = os.path.normpath(os.path.join(os.path.dirname(__file__),
+                                        os.pardir, os.pardir, 'rom'))
+DECODER_ROM = 'COMMAND_DECODER.rom'
+MICROCODE_ROM = 'MICROCODE.rom'
+BIOS_ROM = '8kBIOS.rom'
+
+RAW_HEADER = 'v2.0 raw'
+FORMATS = ('raw', 'bin', 'ihex')
+EXTENSIONS = {'raw': '.rom', 'bin': '.bin', 'ihex': '.hex'}
+
+RAW_RUN = 4             # shortest run written as "N*XX"
+RAW_LINE = 16           # entries per line
+IHEX_RECORD = 16        # data bytes per record
+IHEX_DATA, IHEX_EOF, IHEX_SEGMENT, IHEX_LINEAR = 0x00, 0x01, 0x02, 0x04
+
+# start of a run, its end is the first other byte (a repeated group of
+# the backreference takes memory proportional to the run)
+RAW_RUN_START = re.compile(rb'(.)\1{%d}' % (RAW_RUN - 1), re.DOTALL)
+RAW_RUN_END = [re.compile(b'[^%s]' % re.escape(bytes([value])))
+               for value in range(256)]
+
+
+class WrongImageFormat(Exception):
+    def __init__(self, source, message='Not a "v2.0 raw" image'):
+        super().__init__(f'{message}: {source}')
+
+
+def parse_raw(text: str, source='<text>'):
+    """
+    Parse the LogiSim "v2.0 raw" text format to the list of words.
+    Supports the run-length entries "N*XX" (N times the value XX).
+    """
+    lines = text.splitlines()
+    if not lines or lines[0].strip() != RAW_HEADER:
+        raise WrongImageFormat(source)
+
+    words = []
+    for item in ' '.join(lines[1:]).split():
+        if '*' in item:
+            count, value = item.split('*')
+            words += [int(value, 16)] * int(count)
+        else:
+            words.append(int(item, 16))
+    return words
+
+
+def _raw_items(data, compress):
+    """Entries of the bytes, the runs are searched by the regexps"""
+    data = bytes(data)
+    start = 0
+    while compress:
+        run = RAW_RUN_START.search(data, start)
+        if run is None:
+            break
+        value = data[run.start()]
+        end = RAW_RUN_END[value].search(data, run.end())
+        end = len(data) if end is None else end.start()
+        yield from _hex_items(data[start:run.start()])
+        yield f'{end - run.start()}*{value:02X}'
+        start = end
+    yield from _hex_items(data[start:])
+
+
+def _hex_items(data: bytes):
+    text = data.hex().upper()
+    for i in range(0, len(text), 2):
+        yield text[i:i + 2]
+
+
+def raw_lines(data, compress=True):
+    """
+    Lines of the LogiSim "v2.0 raw" text of the bytes, the header first.
+    Runs of RAW_RUN and more equal bytes are written as "N*XX".
+    """
+    yield RAW_HEADER + '\n'
+    items = []
+    for item in _raw_items(data, compress):
+        items.append(item)
+        if len(items) == RAW_LINE:
+            yield ' '.join(items) + '\n'
+            items = []
+    if items:
+        yield ' '.join(items) + '\n'
+
+
+def dump_raw(data, compress=True):
+    """LogiSim "v2.0 raw" text of the bytes"""
+    return ''.join(raw_lines(data, compress))
+
+
+def _ihex_record(kind, address, payload=b''):
+    record = bytes([len(payload), address >> 8, address & 0xFF, kind]) + payload
+    checksum = -sum(record) & 0xFF
+    return f':{record.hex().upper()}{checksum:02X}'
+
+
+def dump_ihex(data, address=0):
+    """
+    Intel HEX text of the bytes placed at the address.
+    Images over 64K use the extended linear address records.
+    """
+    lines = []
+    upper = 0
+    offset, size = 0, len(data)
+    while offset < size:
+        linear = address + offset
+        if linear >> 16 != upper:
+            upper = linear >> 16
+            lines.append(_ihex_record(IHEX_LINEAR, 0, upper.to_bytes(2, 'big')))
+        # a record doesn't cross the 64K boundary
+        count = min(IHEX_RECORD, size - offset, 0x10000 - (linear & 0xFFFF))
+        lines.append(_ihex_record(IHEX_DATA, linear & 0xFFFF,
+                                  bytes(data[offset:offset + count])))
+        offset += count
+    lines.append(_ihex_record(IHEX_EOF, 0))
+    return ''.join(line + '\n' for line in lines)
+
+
+def parse_ihex(text: str, source='<text>'):
+    """
+    Parse Intel HEX text to bytes starting at the lowest address.
+    Gaps are filled with zeros.
+    """
+    chunks = []
+    base = 0
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            if line[0] != ':':
+                raise ValueError
+            record = bytes.fromhex(line[1:])
+        except ValueError:
+            raise WrongImageFormat(source, 'Not an Intel HEX image')
+        if len(record) < 5 or len(record) != record[0] + 5 or sum(record) & 0xFF:
+            raise WrongImageFormat(source, 'Broken Intel HEX record')
+
+        kind = record[3]
+        payload = record[4:-1]
+        if kind == IHEX_DATA:
+            chunks.append((base + (record[1] << 8 | record[2]), payload))
+        elif kind == IHEX_EOF:
+            break
+        elif kind == IHEX_SEGMENT:
+            base = int.from_bytes(payload, 'big') << 4
+        elif kind == IHEX_LINEAR:
+            base = int.from_bytes(payload, 'big') << 16
+
+    if not chunks:
+        return bytes()
+    start = min(address for address, _ in chunks)
+    end = max(address + len(payload) for address, payload in chunks)
+    image = bytearray(end - start)
+    for address, payload in chunks:
+        image[address - start:address - start + len(payload)] = payload
+    return bytes(image)
+
+
+def image_format(path):
+    """Guess the format of the image file by its first bytes"""
+    with open(path, 'rb') as file:
+        head = file.read(len(RAW_HEADER))
+    if head == RAW_HEADER.encode():
+        return 'raw'
+    if head[:1] == b':' and all(chr(c) in '0123456789ABCDEFabcdef\r\n'
+                                for c in head[1:]):
+        return 'ihex'
+    return 'bin'
+
+
+def rom_path(name):
+    """Path of the ROM file of the repository"""
+    return os.path.join(ROM_DIR, name)
+
+
+def read_raw(path):
+    with open(path, 'r') as file:
+        return parse_raw(file.read(), path)
+
+
+def load_image(path):
+    """Read 8-bit image of any of the FORMATS as bytes"""
+    fmt = image_format(path)
+    if fmt == 'bin':
+        with open(path, 'rb') as file:
+            return file.read()
+    if fmt == 'ihex':
+        with open(path, 'r') as file:
+            return parse_ihex(file.read(), path)
+
+    words = read_raw(path)
+    for word in words:
+        if word > 0xFF:
+            raise WrongImageFormat(path, 'Image is not 8-bit')
+    return bytes(words)
+
+
+def save_image(file, data, fmt='raw', address=0):
+    """
+    Write the bytes to the file object opened in binary mode.
+    `address` - load address of the Intel HEX records.
+    """
+    if fmt == 'bin':
+        file.write(bytes(data))
+    elif fmt == 'ihex':
+        file.write(dump_ihex(data, address).encode())
+    elif fmt == 'raw':
+        for line in raw_lines(data):
+            file.write(line.encode())
+    else:
+        raise ValueError(f'Unknown image format: {fmt}')
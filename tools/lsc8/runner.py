@@ -0,0 +1,226 @@
+# -*- coding: UTF-8 -*-
+"""
+Runner of the boot-sector test programs.
+
+The BIOS is booted once from a placeholder drive up to the entry of
+the loaded boot sector and the computer is snapshotted there. Every
+test is forked from the snapshot: its image is inserted to drive 0,
+its first sector is put to the boot location as the BIOS would do, and
+the program runs within its instruction budget. The display output
+after the fork is captured and compared with the expected text.
+"""
+
+import json
+import os
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+
+from .assembler import ExceptionWithLineNumber, assemble
+from .computer import Computer
+from .cpu import IllegalInstruction
+from .devices import SECTOR_SIZE, Storage
+from .rom import load_image
+from .snapshot import Snapshot
+
+BOOT_ADDRESS = 0x0C00
+BOOT_SIGNATURE = 0xAB
+BOOT_BUDGET = 1_000_000     # instructions of the BIOS up to the boot
+DEFAULT_BUDGET = 5_000_000
+CHUNK = 10_000              # instructions between the output checks
+
+PASSED, FAILED, ERROR = 'passed', 'failed', 'error'
+TEST_FIELDS = ('name', 'image', 'source', 'input', 'expect', 'max',
+               'removable')
+
+
+class BootError(Exception):
+    pass
+
+
+class ManifestError(Exception):
+    pass
+
+
+def boot_snapshot(bios: bytes, jit=False):
+    """State of the computer entering the boot sector"""
+    computer = Computer(bios, jit=jit)
+    computer.insert(0, bytes(SECTOR_SIZE - 1) + bytes([BOOT_SIGNATURE]))
+    cpu = computer.cpu
+    while cpu.pc != BOOT_ADDRESS:
+        if cpu.halted or cpu.instructions >= BOOT_BUDGET:
+            raise BootError(f'BIOS did not boot, stopped at {cpu.pc:04X}h:'
+                            f'\n{computer.display}')
+        cpu.step()
+    return computer.snapshot()
+
+
+class Test:
+    """
+    Boot-sector program: `image` (ROM file) or `source` (assembled),
+    keyboard `input`, `expect` - text the display output must contain
+    (without it the program must halt), `max` - instruction budget.
+    """
+
+    def __init__(self, name, image=None, source=None, input='',
+                 expect=None, max=DEFAULT_BUDGET, removable=False):
+        self.name = name
+        self.image = image
+        self.source = source
+        self.input = input
+        self.expect = expect
+        self.max = max
+        self.removable = removable
+
+    @classmethod
+    def from_dict(cls, spec: dict, base='.', defaults=None):
+        spec = dict(defaults or {}, **spec)
+        for key in ('image', 'source'):
+            if spec.get(key) is not None:
+                spec[key] = os.path.join(base, spec[key])
+        if 'name' not in spec:
+            spec['name'] = os.path.basename(spec.get('image') or
+                                            spec.get('source') or '')
+        for key in spec:
+            if key not in TEST_FIELDS:
+                raise ManifestError(f'Test {spec["name"]}: unknown key'
+                                    f' "{key}"')
+        return cls(**spec)
+
+    def load(self):
+        """Storage image of the program"""
+        if self.source is not None:
+            with open(self.source, 'r') as file:
+                return bytes(assemble(file.read(), self.source))
+        return load_image(self.image)
+
+
+def load_tests(path, defaults=None):
+    """
+    Tests of the JSON manifest: the list of test objects, the paths
+    are relative to the manifest
+    """
+    with open(path, 'r') as file:
+        specs = json.load(file)
+    if not isinstance(specs, list):
+        raise ManifestError(f'{path}: not a list of tests')
+    base = os.path.dirname(path)
+    tests = []
+    for number, spec in enumerate(specs, 1):
+        if not isinstance(spec, dict):
+            raise ManifestError(f'{path}: test {number} is not an object')
+        try:
+            tests.append(Test.from_dict(spec, base, defaults))
+        except ManifestError as err:
+            raise ManifestError(f'{path}: {err}') from None
+    return tests
+
+
+class Result:
+    def __init__(self, name, status, output='', message='',
+                 instructions=0, pc=0, halted=False, elapsed=0.0):
+        self.name = name
+        self.status = status
+        self.output = output
+        self.message = message
+        self.instructions = instructions
+        self.pc = pc
+        self.halted = halted
+        self.elapsed = elapsed
+
+    def as_dict(self):
+        return dict(self.__dict__)
+
+
+# the worker process state, set by _init_worker()
+_snapshot = None
+_computer = None
+
+
+def _init_worker(snapshot: Snapshot, jit=False):
+    global _snapshot, _computer
+    _snapshot = snapshot
+    _computer = Computer(jit=jit)
+
+
+def run_test(test: Test, snapshot: Snapshot = None, computer=None):
+    """Run the test forked from the boot snapshot"""
+    snapshot = snapshot or _snapshot
+    computer = computer or _computer
+    start = time.perf_counter()
+    try:
+        data = test.load()
+        storage = Storage(data, True, test.removable)
+    except (OSError, ValueError, ExceptionWithLineNumber) as err:
+        return Result(test.name, ERROR, message=f'{type(err).__name__}: {err}')
+
+    computer.restore(snapshot)
+    computer.storage.insert(0, storage)
+    computer.cpu.load(storage.sector(0), BOOT_ADDRESS)
+    computer.keyboard.feed(test.input)
+    computer.display.text.clear()
+    cpu = computer.cpu
+    first = cpu.instructions
+
+    status, message = None, ''
+    try:
+        while status is None:
+            executed = cpu.instructions - first
+            if cpu.halted:
+                status = PASSED if test.expect is None else FAILED
+            elif executed >= test.max:
+                status = FAILED
+                message = f'budget of {test.max} instructions is exhausted'
+            else:
+                computer.run(min(CHUNK, test.max - executed))
+            if test.expect is not None and test.expect in str(
+                    computer.display):
+                status = PASSED
+    except IllegalInstruction as err:
+        status, message = ERROR, str(err)
+    output = str(computer.display)
+    if status == FAILED and test.expect is not None and not message:
+        message = f'expected {test.expect!r} in the output'
+    return Result(test.name, status, output, message,
+                  cpu.instructions - first, cpu.pc, cpu.halted,
+                  time.perf_counter() - start)
+
+
+def run_tests(tests, snapshot: Snapshot, jobs=None, jit=False):
+    """Results of the tests run in the worker processes, in order"""
+    with ProcessPoolExecutor(jobs, initializer=_init_worker,
+                             initargs=(snapshot, jit)) as pool:
+        return list(pool.map(run_test, tests,
+                             chunksize=max(1, len(tests) // 256)))
+
+
+def summary(results):
+    counts = {status: 0 for status in (PASSED, FAILED, ERROR)}
+    for result in results:
+        counts[result.status] += 1
+    counts['tests'] = len(results)
+    counts['time'] = sum(result.elapsed for result in results)
+    return counts
+
+
+def write_json(results, file):
+    json.dump({'summary': summary(results),
+               'tests': [result.as_dict() for result in results]},
+              file, indent=1)
+
+
+def write_junit(results, file, name='lsc8'):
+    counts = summary(results)
+    suite = ET.Element('testsuite', name=name, tests=str(counts['tests']),
+                       failures=str(counts[FAILED]),
+                       errors=str(counts[ERROR]),
+                       time=f'{counts["time"]:.3f}')
+    for result in results:
+        case = ET.SubElement(suite, 'testcase', classname=name,
+                             name=result.name, time=f'{result.elapsed:.3f}')
+        if result.status != PASSED:
+            tag = 'failure' if result.status == FAILED else 'error'
+            ET.SubElement(case, tag, message=result.message)
+        ET.SubElement(case, 'system-out').text = result.output
+    ET.ElementTree(suite).write(file, encoding='unicode',
+                                xml_declaration=True)
@@ -0,0 +1,104 @@
+# -*- coding: UTF-8 -*-
+"""
+Event scheduler of the simulated devices.
+
+The clock of the simulation is the number of executed instructions
+(plus the time spent in `hlt` waiting for an interrupt). The devices
+put their events to the heap keyed by the clock, the CPU runs without
+any checks up to the first event, then the due events are fired and
+the interrupt requests are delivered.
+
+The CPU loops update the instruction counter only at the end of a run,
+so the devices programmed during a run see the clock of its start. To
+keep the simulation deterministic regardless of how the runs are split,
+the runs never cross a multiple of QUANTUM instructions and the devices
+start counting at the next multiple (see `boundary()`).
+"""
+
+import heapq
+
+QUANTUM = 1024
+
+
+class Scheduler:
+    def __init__(self, cpu, controller):
+        self.cpu = cpu
+        self.controller = controller
+        self.reset()
+
+    def reset(self):
+        self.events = []    # heap of (time, order, device)
+        self.due = {}       # device: time of its scheduled event
+        self.idle = 0       # time spent halted
+        self._order = 0
+
+    @property
+    def now(self):
+        return self.cpu.instructions + self.idle
+
+    def boundary(self):
+        """Time the device programmed in the current run starts at"""
+        return (self.now // QUANTUM + 1) * QUANTUM
+
+    def schedule(self, device, time):
+        """Call device.event(time) at the time, replaces its event"""
+        self.due[device] = time
+        self._order += 1
+        heapq.heappush(self.events, (time, self._order, device))
+
+    def cancel(self, device):
+        self.due.pop(device, None)
+
+    @property
+    def next_time(self):
+        """Time of the first event or None"""
+        events = self.events
+        while events and self.due.get(events[0][2]) != events[0][0]:
+            heapq.heappop(events)   # replaced or cancelled
+        return events[0][0] if events else None
+
+    def fire(self):
+        """Fire the due events"""
+        now = self.now
+        while True:
+            time = self.next_time
+            if time is None or time > now:
+                break
+            _, _, device = heapq.heappop(self.events)
+            del self.due[device]
+            device.event(time)
+
+    def run(self, execute, max_instructions=None):
+        """
+        Execute the instructions by `execute(count)` between the events.
+        The halted CPU waits for the interrupt if it can be woken up.
+        Return the number of executed instructions.
+        """
+        cpu, controller = self.cpu, self.controller
+        limit = -1 if max_instructions is None else max_instructions
+        executed = 0
+        while True:
+            controller.deliver(cpu)
+            if cpu.halted:  # wait for the interrupt
+                time = self.next_time
+                if (time is None or not cpu.if_ or
+                        controller.masked(self.events[0][2].line)):
+                    break
+                self.idle += max(time - self.now, 0)
+                self.fire()
+                continue
+            if executed == limit:
+                break
+
+            now = self.now
+            count = QUANTUM - now % QUANTUM
+            time = self.next_time
+            if time is not None:
+                count = min(count, time - now)
+            if limit >= 0:
+                count = min(count, limit - executed)
+            if controller.waiting(cpu):
+                count = 1   # until the interrupts are enabled
+            executed += execute(count)
+            self.fire()
+        return executed
@@ -0,0 +1,189 @@
+# -*- coding: UTF-8 -*-
+"""
+Snapshots of the simulated computer and reverse execution.
+
+A snapshot keeps the address space as 256-byte pages, the pages equal
+to the ones of the previous snapshot are shared, so a snapshot costs
+only the pages written since. The registers, flags, both stacks and
+the state of the controllers (display text, keyboard buffers, storage
+setup and written sectors, interrupt requests, timer) are copied.
+
+The simulation is deterministic, so the Recorder taking a snapshot
+every `interval` instructions reaches any earlier instruction by
+restoring the nearest snapshot and executing the rest again.
+"""
+
+import pickle
+
+from .cpu import MEMORY_SIZE
+from .microcode import MicrocodeCPU
+
+PAGE_SIZE = 256
+SNAPSHOT_VERSION = 3
+
+CPU_STATE = ('pc', 'ds_ptr', 'as_ptr', 'cf', 'zf', 'sf', 'pf', 'if_',
+             'halted', 'instructions')
+MICROCODE_STATE = ('upc', 'ir', 'vector', 'reg_src', 'reg_dst', 'cycles')
+TIMER_STATE = ('control', 'period', 'high', 'expired')
+
+
+class Snapshot:
+    """State of the computer after `instructions` executed instructions"""
+
+    def __init__(self, computer, previous=None):
+        cpu = computer.cpu
+        memory = cpu.memory
+        pages = []
+        for address in range(0, MEMORY_SIZE, PAGE_SIZE):
+            page = memory[address:address + PAGE_SIZE]
+            if previous is not None:
+                shared = previous.pages[address // PAGE_SIZE]
+                if shared == page:
+                    pages.append(shared)
+                    continue
+            pages.append(bytes(page))
+        self.pages = tuple(pages)
+
+        names = CPU_STATE
+        if isinstance(cpu, MicrocodeCPU):
+            names += MICROCODE_STATE
+        self.cpu = {name: getattr(cpu, name) for name in names}
+        self.regs = tuple(cpu.regs)
+        self.data_stack = tuple(cpu.data_stack)
+        self.addr_stack = tuple(cpu.addr_stack)
+        self.tmp = tuple(getattr(cpu, 'tmp', ()))
+
+        self.display = tuple(computer.display.text)
+        keyboard = computer.keyboard
+        self.keyboard = (tuple(keyboard.buffer), tuple(keyboard.script),
+                         bytes(keyboard.typed), keyboard._peek)
+        storage = computer.storage
+        self.storage = (storage.drive, storage.state, storage.address)
+        self.drives = tuple(None if drive is None else drive.fork()
+                            for drive in storage.drives)
+
+        timer = computer.timer
+        self.interrupts = (computer.pic.pending, computer.pic.mask,
+                           computer.scheduler.idle)
+        self.timer = {name: getattr(timer, name) for name in TIMER_STATE}
+        self.timer_due = computer.scheduler.due.get(timer)
+
+    @property
+    def instructions(self):
+        return self.cpu['instructions']
+
+    def restore(self, computer):
+        """Put the computer into the state of the snapshot"""
+        cpu = computer.cpu
+        cpu.load(b''.join(self.pages), 0)
+        for name, value in self.cpu.items():
+            setattr(cpu, name, value)
+        cpu.regs[:] = self.regs
+        cpu.data_stack[:] = self.data_stack
+        cpu.addr_stack[:] = self.addr_stack
+        if self.tmp:
+            cpu.tmp[:] = self.tmp
+
+        computer.display.restore(self.display)
+        keyboard = computer.keyboard
+        buffer, script, typed, keyboard._peek = self.keyboard
+        keyboard.buffer.clear()
+        keyboard.buffer.extend(buffer)
+        keyboard.script.clear()
+        keyboard.script.extend(script)
+        keyboard.typed[:] = typed
+        storage = computer.storage
+        storage.drive, storage.state, storage.address = self.storage
+        # the snapshot keeps its own copies to be restored again
+        storage.drives[:] = [None if drive is None else drive.fork()
+                             for drive in self.drives]
+
+        pic, scheduler = computer.pic, computer.scheduler
+        scheduler.reset()
+        pic.pending, pic.mask, scheduler.idle = self.interrupts
+        for name, value in self.timer.items():
+            setattr(computer.timer, name, value)
+        if self.timer_due is not None:
+            scheduler.schedule(computer.timer, self.timer_due)
+
+    def save(self, path):
+        with open(path, 'wb') as file:
+            pickle.dump((SNAPSHOT_VERSION, self), file,
+                        pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def load(path):
+        with open(path, 'rb') as file:
+            version, snapshot = pickle.load(file)
+        if version != SNAPSHOT_VERSION:
+            raise ValueError(f'Snapshot version {version} is not supported')
+        return snapshot
+
+    def __repr__(self):
+        return (f'<Snapshot: {self.instructions} instructions,'
+                f' PC={self.cpu["pc"]:04X}h>')
+
+
+class Recorder:
+    """
+    Execution of the computer with the snapshots taken every `interval`
+    instructions for the reverse execution. `limit` - maximum number of
+    the kept snapshots, the older ones are thinned out.
+    """
+
+    def __init__(self, computer, interval=10000, limit=1000):
+        self.computer = computer
+        self.interval = interval
+        self.limit = limit
+        self.snapshots = [Snapshot(computer)]
+
+    @property
+    def instructions(self):
+        return self.computer.cpu.instructions
+
+    def run(self, max_instructions=None):
+        """Execute like Computer.run() taking the snapshots"""
+        cpu = self.computer.cpu
+        limit = -1 if max_instructions is None else max_instructions
+        executed = 0
+        while not cpu.halted and executed != limit:
+            count = self.interval - (self.instructions -
+                                     self.snapshots[-1].instructions)
+            if limit >= 0:
+                count = min(count, limit - executed)
+            executed += self.computer.run(count)
+            if (self.instructions - self.snapshots[-1].instructions >=
+                    self.interval):
+                self.take()
+        return executed
+
+    def take(self):
+        """Snapshot of the current state"""
+        snapshot = Snapshot(self.computer, self.snapshots[-1])
+        self.snapshots.append(snapshot)
+        if len(self.snapshots) > self.limit:
+            # keep the first one and every other older snapshot
+            self.snapshots[1:-1] = self.snapshots[2:-1:2]
+        return snapshot
+
+    def rewind(self, instruction: int):
+        """
+        Return to the state after `instruction` executed instructions.
+        The later snapshots are dropped, the run may go another way.
+        """
+        if instruction < self.snapshots[0].instructions:
+            raise ValueError(f'Instruction {instruction} is before'
+                             f' the first snapshot')
+        while self.snapshots[-1].instructions > instruction:
+            self.snapshots.pop()
+        self.snapshots[-1].restore(self.computer)
+        display = self.computer.display
+        echo, display.echo = display.echo, None     # printed already
+        try:
+            self.computer.run(instruction - self.instructions)
+        finally:
+            display.echo = echo
+
+    def step_back(self, count=1):
+        self.rewind(max(self.instructions - count,
+                        self.snapshots[0].instructions))
@@ -0,0 +1,31 @@
+# -*- coding: UTF-8 -*-
+"""
+Symbol tables of the assembled programs for the simulator tools.
+The debug file written by the assembler is read instead of the source.
+"""
+
+from .assembler import assemble
+from .debuginfo import DEBUG_EXTENSION, DebugInfo
+
+
+def _debug_info(path):
+    """DebugInfo of the debug file or of the assembled source"""
+    if path.endswith(DEBUG_EXTENSION):
+        return DebugInfo.load(path)
+    with open(path, 'r') as file:
+        text = file.read()
+    return assemble(text, path).debug
+
+
+def assemble_symbols(path):
+    """Return the label addresses by name of the source or debug file"""
+    return _debug_info(path).labels
+
+
+def assemble_routines(path):
+    """
+    Return the label addresses and the (start, end) addresses of the
+    procedures by name of the source or debug file
+    """
+    debug = _debug_info(path)
+    return debug.labels, debug.procedures
@@ -0,0 +1,100 @@
+# -*- coding: UTF-8 -*-
+"""
+Curses terminal of the simulated computer.
+
+The program runs in slices of instructions, the MDA output goes to the
+Screen buffer only. A frame is drawn `fps` times per second: the rows
+changed since the previous frame are redrawn and the keys pressed are
+put to the keyboard buffer, so the output costs nothing per char.
+"""
+
+import curses
+import time
+
+from .devices import Screen
+
+DEFAULT_FPS = 30
+SLICE = 5000    # instructions between the frame time checks
+
+KEYS = {
+    curses.KEY_ENTER: 0x0A,
+    0x0D: 0x0A,
+    curses.KEY_BACKSPACE: 0x08,
+    0x7F: 0x08,
+}
+
+
+class Terminal:
+    def __init__(self, computer, fps=DEFAULT_FPS):
+        screen = computer.display.screen
+        if screen is None:
+            raise ValueError('Display of the computer has no screen')
+        self.computer = computer
+        self.screen: Screen = screen
+        self.period = 1 / fps
+        self.frames = 0
+        self._window = None
+
+    def run(self, max_instructions=None):
+        """
+        Execute like Computer.run() showing the screen, wait for a key
+        after the halt. Return the number of executed instructions.
+        """
+        return curses.wrapper(self._run, max_instructions)
+
+    def _run(self, window, max_instructions):
+        self._window = window
+        window.nodelay(True)
+        self.screen.dirty.update(range(self.screen.height))
+        cpu = self.computer.cpu
+        limit = -1 if max_instructions is None else max_instructions
+        executed = 0
+        try:
+            while not cpu.halted and executed != limit:
+                deadline = time.perf_counter() + self.period
+                while (not cpu.halted and executed != limit and
+                       time.perf_counter() < deadline):
+                    count = SLICE if limit < 0 else min(SLICE,
+                                                        limit - executed)
+                    executed += self.computer.run(count)
+                self.frame()
+                self.poll()
+        except KeyboardInterrupt:
+            pass
+        else:
+            self.frame(f'{"halted" if cpu.halted else "stopped"}'
+                       f' at {cpu.pc:04X}h, press any key')
+            window.nodelay(False)
+            window.getch()
+        return executed
+
+    def frame(self, status=None):
+        """Draw the changed rows and the status line"""
+        window, screen = self._window, self.screen
+        height, width = window.getmaxyx()
+        for row in screen.take_dirty():
+            if row < height:
+                self._draw(row, screen.line(row), width)
+        if status is not None and screen.height < height:
+            self._draw(screen.height, status, width, curses.A_REVERSE)
+        if screen.row < height and screen.column < width:
+            window.move(screen.row, screen.column)
+        window.refresh()
+        self.frames += 1
+
+    def _draw(self, row, text, width, attr=curses.A_NORMAL):
+        try:    # the last cell of the window raises after the write
+            self._window.addnstr(row, 0, text.ljust(width), width, attr)
+        except curses.error:
+            pass
+
+    def poll(self):
+        """Put the pressed keys to the keyboard buffer"""
+        keyboard = self.computer.keyboard
+        while True:
+            key = self._window.getch()
+            if key == -1:
+                break
+            key = KEYS.get(key, key)
+            if key < 0x100:
+                keyboard.press(key)